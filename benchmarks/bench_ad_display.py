@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+
+# Add path for clip app and the ad_genie display cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from display_cache import CanvasCache, letterbox, prerender_catalog, prerendered_path, SCREEN_SIZE
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+CATALOG_IMAGE_SIZE = (1920, 2880)  # Zara catalog photos
+ZIPF_EXPONENT = 1.2  # Popularity of the ads, a few items are shown most of the time
+
+
+def synthetic_images(directory, num_images, rng):
+    """Catalog JPEGs of CATALOG_IMAGE_SIZE with noise, so they do not compress to nothing."""
+    os.makedirs(directory, exist_ok=True)
+    small = (CATALOG_IMAGE_SIZE[0] // 16, CATALOG_IMAGE_SIZE[1] // 16)
+    for i in range(num_images):
+        pixels = rng.integers(0, 256, (small[1], small[0], 3), dtype=np.uint8)
+        Image.fromarray(pixels).resize(CATALOG_IMAGE_SIZE, Image.BILINEAR).save(
+            os.path.join(directory, f"item_{i}.jpg"), quality=90)
+
+
+def render_original(path):
+    with Image.open(path) as image:
+        return letterbox(image, SCREEN_SIZE)
+
+
+def render_prerendered(path):
+    with Image.open(path) as image:
+        return image.convert('RGB')
+
+
+def time_switches(cache, keys):
+    cache.reset_stats()
+    start = time.perf_counter()
+    for key in keys:
+        cache.get(key)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return elapsed_ms / len(keys), cache.summary()
+
+
+def run_benchmark(num_images, switches, cache_mb_list, workers=None, seed=0):
+    """
+    Time ad switches: decode and letterbox the catalog JPEG, decode the pre-rendered image, and the canvas cache
+    over a Zipf distributed sequence of ads. Returns a list of result dicts.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        images = os.path.join(tmp_dir, "images")
+        display = os.path.join(tmp_dir, "display")
+        synthetic_images(images, num_images, rng)
+        stats = prerender_catalog(images, display, SCREEN_SIZE, workers)
+        logger.info("Pre-rendered %s images in %.2f s (%.1f images/s)", stats["rendered"], stats["elapsed_s"],
+                    stats["images_per_s"])
+        paths = [os.path.join(images, f"item_{i}.jpg") for i in range(num_images)]
+        keys = [paths[i] for i in np.minimum(rng.zipf(ZIPF_EXPONENT, switches) - 1, num_images - 1)]
+        modes = [("original", 0, render_original), ("prerendered", 0, lambda path: render_prerendered(
+            prerendered_path(display, path)))]
+        modes += [("cached", cache_mb, lambda path: render_prerendered(prerendered_path(display, path)))
+                  for cache_mb in cache_mb_list]
+        for mode, cache_mb, render in modes:
+            switch_ms, summary = time_switches(CanvasCache(render, cache_mb * 1024 * 1024), keys)
+            logger.info("%-11s cache %4d MB: %.2f ms per switch, p99 %.2f ms, hit rate %.2f", mode, cache_mb,
+                        switch_ms, summary["switch_ms"]["p99_ms"], summary["hit_rate"])
+            results.append({"mode": mode, "cache_mb": cache_mb, "switch_ms": switch_ms,
+                            "p99_ms": summary["switch_ms"]["p99_ms"], "hit_rate": summary["hit_rate"]})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ad_genie display switches")
+    parser.add_argument("--images", type=int, default=40, help="Catalog images")
+    parser.add_argument("--switches", type=int, default=200, help="Ad switches per configuration")
+    parser.add_argument("--cache-mb", type=int, nargs='+', default=[64, 256], help="Canvas cache budgets")
+    parser.add_argument("--workers", type=int, default=None, help="Pre-rendering processes")
+    args = parser.parse_args()
+    run_benchmark(args.images, args.switches, args.cache_mb, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import contextlib
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+import synthetic_hailo
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+
+def median_ms(func, make_args, iterations):
+    """Median time of func(*make_args()) in ms, the arguments are built outside the timed section."""
+    func(*make_args())  # warmup
+    times = np.empty(iterations)
+    for i in range(iterations):
+        args = make_args()
+        start = time.perf_counter()
+        func(*args)
+        times[i] = time.perf_counter() - start
+    return float(np.median(times)) * 1000
+
+
+def bench_hailopython(rng, detection_counts, iterations):
+    """clip_hailopython.run() on frames with new embeddings (no track cache hits)."""
+    from clip_app import clip_hailopython
+    results = []
+    for count in detection_counts:
+        rois = [synthetic_hailo.synthetic_roi(rng, count) for _ in range(iterations + 1)]
+        frames = iter(rois)
+
+        def make_args():
+            clip_hailopython.track_match_cache.clear()
+            return (synthetic_hailo.SyntheticVideoFrame(next(frames)),)
+        results.append({"callback": "clip_hailopython.run", "detections": count,
+                        "frame_ms": median_ms(clip_hailopython.run, make_args, iterations)})
+    return results
+
+
+def bench_app_callback(rng, detection_counts, iterations):
+    """clip_application.app_callback() on frames where every detection has a CLIP classification."""
+    import clip_application
+    hailo = sys.modules["hailo"]
+    user_data = clip_application.app_callback_class()
+    results = []
+    for count in detection_counts:
+        roi = synthetic_hailo.synthetic_roi(rng, count)
+        for detection in roi.get_objects():
+            detection.add_object(hailo.HailoClassification("clip", "person", 0.9))
+        info = synthetic_hailo.SyntheticProbeInfo(roi)
+        # The callback prints every frame, keep the terminal quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            frame_ms = median_ms(clip_application.app_callback, lambda: (None, None, info, user_data), iterations)
+        results.append({"callback": "clip_application.app_callback", "detections": count, "frame_ms": frame_ms})
+    return results
+
+
+def bench_match_handler(iterations):
+    """MatchHandler.handle() for a label with an action and a label without one. Actions are not run."""
+    from community_projects.baiby_monitor.src.match_handler import MatchHandler, DetectionClass
+    handler = MatchHandler()
+    behavior = dict(MatchHandler.BEHAVIOR_DICT)
+    try:
+        # Replace the actions (telegram message, lullaby) with a no-op
+        MatchHandler.BEHAVIOR_DICT = {label: None if action is None else DetectionClass(function=lambda argument: None)
+                                      for label, action in behavior.items()}
+        results = []
+        for label in ("Crying baby", "Calm baby"):
+            frame_ms = median_ms(handler.handle, lambda: (label,), iterations)
+            results.append({"callback": "MatchHandler.handle", "label": label, "frame_ms": frame_ms})
+        return results
+    finally:
+        MatchHandler.BEHAVIOR_DICT = behavior
+
+
+def run_benchmark(detection_counts, iterations, prompts=6, seed=0):
+    """Time the per frame callbacks on synthetic frames. Returns a list of result dicts."""
+    installed = synthetic_hailo.install()
+    if installed:
+        logger.info("Using synthetic %s modules", ", ".join(installed))
+    rng = np.random.default_rng(seed)
+    matcher = TextImageMatcher()
+    embeddings = rng.standard_normal((prompts, synthetic_hailo.EMBEDDING_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding) for i, embedding in enumerate(embeddings)]
+    matcher.threshold = 0.0  # Every detection gets a classification
+
+    results = []
+    benches = [("clip_hailopython.run", lambda: bench_hailopython(rng, detection_counts, iterations)),
+               ("clip_application.app_callback", lambda: bench_app_callback(rng, detection_counts, iterations)),
+               ("MatchHandler.handle", lambda: bench_match_handler(iterations))]
+    for name, bench in benches:
+        try:
+            bench_results = bench()
+        except ImportError as e:
+            logger.warning("Skipping %s: %s", name, e)
+            continue
+        for result in bench_results:
+            logger.info("%-30s %s: %.4f ms per frame", name,
+                        result.get("label", f"{result.get('detections')} detections"), result["frame_ms"])
+        results.extend(bench_results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per frame callbacks with synthetic ROI objects")
+    parser.add_argument("--detections", type=int, nargs='+', default=[1, 8, 32], help="Detections per frame")
+    parser.add_argument("--iterations", type=int, default=500, help="Timed frames per configuration")
+    args = parser.parse_args()
+    run_benchmark(args.detections, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+
+# Add path for clip app and the ad_genie catalog index
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from catalog_index import CatalogIndex, write_catalog
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+ITEMS_PER_PRODUCT = 4  # Catalog images per product
+
+
+def normalize(embeddings):
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_catalog(rng, num_items):
+    """Catalog of num_items images, split between two genders, a few images per product."""
+    embeddings = normalize(rng.standard_normal((num_items, EMBEDDING_DIM)))
+    ids = [f"item_{i}.jpg" for i in range(num_items)]
+    values = {"gender": ["Men" if i % 2 else "Women" for i in range(num_items)],
+              "item": [f"PRODUCT {i // (2 * ITEMS_PER_PRODUCT)}" for i in range(num_items)]}
+    return ids, embeddings, values
+
+
+def time_query(catalog, queries, iterations, **filters):
+    catalog.query_batch(queries, k=5, **filters)  # warmup, pages in the memory map
+    start = time.perf_counter()
+    for _ in range(iterations):
+        catalog.query_batch(queries, k=5, **filters)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def recall_at_1(catalog, exact, queries, **filters):
+    """Fraction of queries whose best indexed match is the best exact match."""
+    indexed = catalog.query_batch(queries, k=1, **filters)
+    expected = exact.query_batch(queries, k=1, **filters)
+    return float(np.mean([a[:1] and a[0][0] == b[0][0] for a, b in zip(indexed, expected)]))
+
+
+def run_benchmark(sizes, rows_list, iterations, seed=0):
+    """
+    Time top-5 catalog queries over the whole catalog and a gender partition, scored exactly and (for catalogs
+    large enough to be indexed) through the IVF index. Returns a list of result dicts.
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_items in sizes:
+            directory = os.path.join(tmp_dir, f"catalog_{num_items}")
+            ids, embeddings, values = synthetic_catalog(rng, num_items)
+            # Queries close to catalog items of the queried gender, as crops of catalog products are
+            targets = 2 * rng.integers(0, num_items // 2, max(rows_list)) + 1
+            build_start = time.perf_counter()
+            write_catalog(directory, ids, embeddings, values)
+            build_s = time.perf_counter() - build_start
+            catalog = CatalogIndex.load(directory)
+            exact = CatalogIndex(catalog.ids, catalog.embeddings, catalog.values, catalog.fields)
+            searches = [("exact", exact)] + ([("indexed", catalog)] if catalog.indexes else [])
+            for rows in rows_list:
+                noise = normalize(rng.standard_normal((rows, EMBEDDING_DIM)))
+                queries = normalize(embeddings[targets[:rows]] + 0.5 * noise)
+                for partition, filters in (("all", {}), ("gender", {"gender": "Men"})):
+                    for search, searched in searches:
+                        query_ms = time_query(searched, queries, iterations, **filters)
+                        recall = recall_at_1(searched, exact, queries, **filters)
+                        logger.info("%6d items, %2d rows, %-6s %-7s: %.3f ms per query batch, recall@1 %.3f",
+                                    num_items, rows, partition, search, query_ms, recall)
+                        results.append({"num_items": num_items, "rows": rows, "partition": partition,
+                                        "search": search, "query_ms": query_ms, "recall_at_1": recall,
+                                        "build_s": build_s})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ad_genie catalog image to image search")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000, 100000], help="Catalog sizes")
+    parser.add_argument("--rows", type=int, nargs='+', default=[1, 8], help="Crop embeddings per query batch")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed queries per configuration")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.rows, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+
+
+def random_embeddings(rng, rows, dim=EMBEDDING_DIM):
+    embeddings = rng.standard_normal((rows, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def edit_loop(matcher, embeddings, stop, edit_interval):
+    """Simulate the GUI: edit a text box and toggle a negative flag every edit_interval seconds."""
+    edit = 0
+    while not stop.is_set():
+        index = edit % len(embeddings)
+        matcher.update_text_entries(TextEmbeddingEntry(f"prompt {edit}", embeddings[index]), index)
+        matcher.set_negative(index, edit % 2 == 0)
+        edit += 1
+        if edit_interval:
+            time.sleep(edit_interval)
+
+
+def sample_loop(matcher, stop, sample_interval):
+    """Simulate the GUI progress bars sampling the probabilities."""
+    while not stop.is_set():
+        matcher.get_snapshot().stats.sample()
+        time.sleep(sample_interval)
+
+
+def frame_latencies(matcher, frame, num_frames):
+    latencies = np.empty(num_frames)
+    for i in range(num_frames):
+        start = time.perf_counter()
+        matcher.match(frame, report_all=True)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000
+
+
+def run_benchmark(num_prompts, rows, num_frames, edit_intervals, seed=0):
+    """Compare match() latency alone and while another thread publishes edits. Returns a list of result dicts."""
+    rng = np.random.default_rng(seed)
+    matcher = TextImageMatcher()
+    embeddings = random_embeddings(rng, num_prompts)
+    matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding) for i, embedding in enumerate(embeddings)]
+    frame = random_embeddings(rng, rows)
+    matcher.match(frame)  # warmup
+
+    results = []
+    for edit_interval in [None] + list(edit_intervals):
+        stop = threading.Event()
+        threads = [threading.Thread(target=sample_loop, args=(matcher, stop, 0.01))]
+        if edit_interval is not None:
+            threads.append(threading.Thread(target=edit_loop, args=(matcher, embeddings, stop, edit_interval)))
+        for thread in threads:
+            thread.start()
+        latencies = frame_latencies(matcher, frame, num_frames)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        label = "no edits" if edit_interval is None else f"edit every {edit_interval * 1000:.0f} ms"
+        results.append({
+            "edit_interval": edit_interval,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "versions": matcher.version,
+        })
+        logger.info("%-20s: match() p50 %.3f ms, p99 %.3f ms", label, results[-1]["p50_ms"], results[-1]["p99_ms"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark match() latency while the GUI thread publishes edits")
+    parser.add_argument("--prompts", type=int, default=6, help="Number of text prompts")
+    parser.add_argument("--rows", type=int, default=8, help="Image embeddings per frame")
+    parser.add_argument("--frames", type=int, default=2000, help="Timed frames per configuration")
+    parser.add_argument("--edit-intervals", type=float, nargs='+', default=[0.1, 0.01, 0.0],
+                        help="Seconds between edits, 0 edits as fast as possible")
+    args = parser.parse_args()
+    run_benchmark(args.prompts, args.rows, args.frames, args.edit_intervals)
+
+
+if __name__ == "__main__":
+    main()
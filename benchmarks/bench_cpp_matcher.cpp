@@ -0,0 +1,153 @@
+// Benchmark of the C++ TextImageMatcher match path against the previous per-row implementation.
+// Only needs the xtensor and nlohmann/json headers:
+//   g++ -O3 -std=c++17 -I<xtensor/xtl include dir> benchmarks/bench_cpp_matcher.cpp -o bench_cpp_matcher
+//   ./bench_cpp_matcher [rows] [prompts] [dim] [iterations]
+#include <chrono>
+#include <random>
+#include <vector>
+#include <iostream>
+#include <iomanip>
+#include <algorithm>
+
+#include "../cpp/TextImageMatcher.hpp"
+#include "../cpp/TextImageMatcher.cpp"
+
+// The previous filter() gather: concatenate each detection embedding to the frame matrix
+static xt::xarray<double> legacy_gather(const std::vector<std::vector<float>>& detections)
+{
+    xt::xarray<double> image_embedding;
+    for (const auto& data : detections)
+    {
+        xt::xarray<float> embeddings = xt::adapt(data, {static_cast<size_t>(1), data.size()});
+        if (image_embedding.size() == 0 || image_embedding.dimension() == 0)
+        {
+            image_embedding = embeddings;
+        }
+        else
+        {
+            image_embedding = xt::concatenate(xt::xtuple(image_embedding, embeddings), 0);
+        }
+    }
+    return image_embedding;
+}
+
+// The previous match(): rebuild the prompt matrix and score one row at a time in double.
+// The per-row dot product is an xtensor expression here so the benchmark does not need xtensor-blas.
+static std::vector<Match> legacy_match(TextImageMatcher* matcher, const xt::xarray<double>& image_embedding)
+{
+    std::vector<Match> results;
+    std::vector<int> valid_entries = matcher->get_embeddings();
+    xt::xarray<double> text_embeddings_np;
+    text_embeddings_np.resize({valid_entries.size(), matcher->entries[valid_entries[0]].embedding.size()});
+    for (size_t i = 0; i < valid_entries.size(); ++i)
+    {
+        xt::view(text_embeddings_np, i, xt::all()) = matcher->entries[valid_entries[i]].embedding;
+    }
+    for (std::size_t row_idx = 0; row_idx < image_embedding.shape()[0]; ++row_idx)
+    {
+        auto image_embedding_1d = xt::view(image_embedding, row_idx);
+        xt::xarray<double> dot_products = xt::sum(text_embeddings_np * image_embedding_1d, {1});
+        xt::xarray<double> similarities = xt::exp(100 * dot_products);
+        similarities /= xt::sum(similarities)();
+        int best_idx = xt::argmax(similarities)();
+        for (size_t i = 0; i < similarities.size(); i++)
+        {
+            matcher->entries[valid_entries[i]].probability = similarities[i];
+        }
+        results.emplace_back(row_idx, matcher->entries[valid_entries[best_idx]].text, similarities[best_idx],
+                             valid_entries[best_idx], matcher->entries[valid_entries[best_idx]].negative, true);
+    }
+    return results;
+}
+
+// The new filter() gather: append each detection embedding to a reused buffer
+static void gather(const std::vector<std::vector<float>>& detections, std::vector<float>& buffer)
+{
+    buffer.clear();
+    for (const auto& data : detections)
+    {
+        buffer.insert(buffer.end(), data.begin(), data.end());
+    }
+}
+
+template <class F>
+static double median_microseconds(F&& run, int iterations)
+{
+    std::vector<double> times(iterations);
+    for (int i = 0; i < iterations; i++)
+    {
+        auto start = std::chrono::steady_clock::now();
+        run();
+        times[i] = std::chrono::duration<double, std::micro>(std::chrono::steady_clock::now() - start).count();
+    }
+    std::nth_element(times.begin(), times.begin() + iterations / 2, times.end());
+    return times[iterations / 2];
+}
+
+static std::vector<float> random_unit_vector(std::mt19937& rng, size_t dim)
+{
+    std::normal_distribution<float> normal;
+    std::vector<float> vector(dim);
+    float norm = 0;
+    for (auto& value : vector)
+    {
+        value = normal(rng);
+        norm += value * value;
+    }
+    for (auto& value : vector)
+    {
+        value /= std::sqrt(norm);
+    }
+    return vector;
+}
+
+int main(int argc, char** argv)
+{
+    const size_t rows = argc > 1 ? std::stoul(argv[1]) : 32;
+    const size_t prompts = argc > 2 ? std::stoul(argv[2]) : 6;
+    const size_t dim = argc > 3 ? std::stoul(argv[3]) : 640;  // RN50x4 embedding size
+    const int iterations = argc > 4 ? std::stoi(argv[4]) : 2000;
+
+    std::mt19937 rng(0);
+    TextImageMatcher* matcher = TextImageMatcher::getInstance("", 0.8f, prompts);
+    matcher->entries.clear();
+    for (size_t i = 0; i < prompts; i++)
+    {
+        matcher->entries.emplace_back("prompt " + std::to_string(i), random_unit_vector(rng, dim), false, false);
+    }
+    matcher->rebuild_prompt_matrix();
+    std::vector<std::vector<float>> detections;
+    for (size_t i = 0; i < rows; i++)
+    {
+        detections.push_back(random_unit_vector(rng, dim));
+    }
+
+    // Both implementations must agree before timing them
+    std::vector<float> buffer;
+    gather(detections, buffer);
+    std::vector<Match> expected = legacy_match(matcher, legacy_gather(detections));
+    std::vector<Match> actual = matcher->match(buffer.data(), rows, dim, true);
+    for (size_t i = 0; i < rows; i++)
+    {
+        if (expected[i].entry_index != actual[i].entry_index)
+        {
+            std::cout << "Row " << i << " matched entry " << actual[i].entry_index << ", expected "
+                      << expected[i].entry_index << std::endl;
+            return 1;
+        }
+    }
+
+    double legacy_gather_us = median_microseconds([&] { legacy_gather(detections); }, iterations);
+    double gather_us = median_microseconds([&] { gather(detections, buffer); }, iterations);
+    xt::xarray<double> image_embedding = legacy_gather(detections);
+    double legacy_match_us = median_microseconds([&] { legacy_match(matcher, image_embedding); }, iterations);
+    double match_us = median_microseconds([&] { matcher->match(buffer.data(), rows, dim, true); }, iterations);
+
+    std::cout << std::fixed << std::setprecision(2);
+    std::cout << rows << " rows x " << prompts << " prompts x " << dim << " dim, median of " << iterations << " runs" << std::endl;
+    std::cout << "gather: concatenate " << legacy_gather_us << " us, reused buffer " << gather_us << " us ("
+              << legacy_gather_us / gather_us << "x)" << std::endl;
+    std::cout << "match:  per row " << legacy_match_us << " us, float32 matrix " << match_us << " us ("
+              << legacy_match_us / match_us << "x)" << std::endl;
+    return 0;
+}
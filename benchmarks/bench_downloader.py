@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Add path for clip app and the ad_genie data preparation
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from data_preparation import download_images
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves image_size bytes for every path after delay_s, a stand-in for the image CDN."""
+    protocol_version = "HTTP/1.1"
+    image_size = 100 * 1024
+    delay_s = 0.02
+
+    def do_GET(self):
+        time.sleep(self.delay_s)
+        body = b"\xff" * self.image_size
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def write_dataset(base_dir, url, num_images, images_per_row=4):
+    os.makedirs(os.path.join(base_dir, "Men"))
+    with open(os.path.join(base_dir, "Men", "items.csv"), 'w') as f:
+        f.write("name,images\n")
+        for row in range(num_images // images_per_row):
+            images = repr([{f"{url}/{row}_{i}.jpg": "image"} for i in range(images_per_row)]).replace('"', '""')
+            f.write(f'ITEM {row},"{images}"\n')
+
+
+def run_benchmark(num_images, workers_list, delay_ms, image_kb):
+    """Download num_images from a local server answering after delay_ms. Returns a list of result dicts."""
+    ImageHandler.delay_s = delay_ms / 1000
+    ImageHandler.image_size = image_kb * 1024
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base_dir = os.path.join(tmp_dir, "zara")
+            write_dataset(base_dir, url, num_images)
+            for workers in workers_list:
+                dest_dir = os.path.join(tmp_dir, f"images_{workers}")
+                output = os.path.join(tmp_dir, "zara.json")
+                stats = download_images(base_dir, retries=0, dest_dir=dest_dir, output_json=output, workers=workers)
+                resume_start = time.perf_counter()
+                resumed = download_images(base_dir, retries=0, dest_dir=dest_dir, output_json=output, workers=workers)
+                resume_s = time.perf_counter() - resume_start
+                logger.info("%3d workers: %.1f images/s, %.1f MB/s, resume of %d done images in %.3f s", workers,
+                            stats["images_per_s"], stats["mb_per_s"], resumed["skipped"], resume_s)
+                results.append({"workers": workers, "images": num_images, "images_per_s": stats["images_per_s"],
+                                "mb_per_s": stats["mb_per_s"], "resume_s": resume_s})
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ad_genie image downloader against a local server")
+    parser.add_argument("--images", type=int, default=400, help="Images to download")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 4, 16], help="Concurrent downloads")
+    parser.add_argument("--delay-ms", type=float, default=20.0, help="Server response delay (network latency)")
+    parser.add_argument("--image-kb", type=int, default=100, help="Image size")
+    args = parser.parse_args()
+    run_benchmark(args.images, args.workers, args.delay_ms, args.image_kb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+from clip_app.embedding_store import BINARY_EXTENSION
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+
+
+def create_embeddings_files(directory, num_entries, seed=0):
+    """Save num_entries random prompts as JSON and binary. Returns (json_path, binary_path, save_ms) with the save time per format."""
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num_entries, EMBEDDING_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    matcher = TextImageMatcher()
+    matcher.entries = [TextEmbeddingEntry(f"a person wearing product {i}", embedding)
+                       for i, embedding in enumerate(embeddings)]
+    json_path = os.path.join(directory, f"embeddings_{num_entries}.json")
+    binary_path = os.path.join(directory, f"embeddings_{num_entries}{BINARY_EXTENSION}")
+    save_ms = {}
+    for fmt, path in (("json", json_path), ("binary", binary_path)):
+        start = time.perf_counter()
+        matcher.save_embeddings(path)
+        save_ms[fmt] = (time.perf_counter() - start) * 1000
+    return json_path, binary_path, save_ms
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux only)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def measure_load(filename):
+    """Load filename into a fresh matcher and run one match. Runs in a child process to isolate RSS."""
+    matcher = TextImageMatcher()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    matcher.load_embeddings(filename)
+    load_time = time.perf_counter() - start
+    matcher.match(np.zeros(EMBEDDING_DIM, dtype=np.float32))
+    first_match_time = time.perf_counter() - start - load_time
+    rss_after = current_rss_mb()
+    return {
+        "load_ms": load_time * 1000,
+        "first_match_ms": first_match_time * 1000,
+        "rss_increase_mb": rss_after - rss_before,
+        "entries": len(matcher.entries),
+    }
+
+
+def measure_load_in_subprocess(filename):
+    output = subprocess.check_output([sys.executable, __file__, "--measure", filename])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def run_benchmark(sizes):
+    """Compare JSON and binary load for every size. Returns a list of result dicts."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for num_entries in sizes:
+            json_path, binary_path, save_ms = create_embeddings_files(directory, num_entries)
+            for fmt, path in (("json", json_path), ("binary", binary_path)):
+                result = measure_load_in_subprocess(path)
+                result.update({"format": fmt, "num_entries": num_entries, "file_mb": os.path.getsize(path) / 2**20,
+                               "save_ms": save_ms[fmt]})
+                results.append(result)
+                logger.info("%6s %6d entries: file %.1f MB, save %.1f ms, load %.1f ms, first match %.1f ms, RSS +%.1f MB",
+                            fmt, num_entries, result["file_mb"], result["save_ms"], result["load_ms"],
+                            result["first_match_ms"], result["rss_increase_mb"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs binary embeddings save / load time and memory")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[100, 1000, 10000], help="Number of entries per file")
+    parser.add_argument("--measure", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        set_log_level(logger, logging.WARNING)
+        print(json.dumps(measure_load(args.measure)))
+        return
+    run_benchmark(args.sizes)
+
+
+if __name__ == "__main__":
+    main()
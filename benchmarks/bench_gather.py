@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.embedding_gatherer import EmbeddingGatherer
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+MATRIX_TYPE = 1  # Synthetic stand ins for hailo.HAILO_MATRIX / HAILO_UNIQUE_ID
+UNIQUE_ID_TYPE = 2
+CLASSIFICATION_TYPE = 3
+
+
+class SyntheticObject:
+    """Minimal stand in for the hailo ROI objects used by clip_hailopython.run()."""
+
+    def __init__(self, obj_type, data=None, track_id=None, children=()):
+        self.obj_type = obj_type
+        self.data = data
+        self.track_id = track_id
+        self.children = list(children)
+
+    def get_type(self):
+        return self.obj_type
+
+    def get_data(self):
+        # The hailo bindings return the matrix data as a Python list
+        return self.data.tolist()
+
+    def get_id(self):
+        return self.track_id
+
+    def get_objects(self):
+        return self.children
+
+    def get_objects_typed(self, obj_type):
+        return [child for child in self.children if child.obj_type == obj_type]
+
+
+def synthetic_detections(rng, count):
+    return [SyntheticObject(0, children=[
+        SyntheticObject(CLASSIFICATION_TYPE),
+        SyntheticObject(MATRIX_TYPE, data=rng.standard_normal(EMBEDDING_DIM).astype(np.float32)),
+        SyntheticObject(UNIQUE_ID_TYPE, track_id=i)]) for i in range(count)]
+
+
+def legacy_gather(detections, track_id_focus=0):
+    """The gathering loop clip_hailopython.run() used before EmbeddingGatherer."""
+    embeddings_np = None
+    used_detection = []
+    update_tracked_probability = None
+    for detection in detections:
+        results = detection.get_objects_typed(MATRIX_TYPE)
+        if len(results) == 0:
+            continue
+        detection_embeddings = np.array(results[0].get_data())
+        used_detection.append(detection)
+        if embeddings_np is None:
+            embeddings_np = detection_embeddings[np.newaxis, :]
+        else:
+            embeddings_np = np.vstack((embeddings_np, detection_embeddings))
+        if track_id_focus is not None:
+            track = detection.get_objects_typed(UNIQUE_ID_TYPE)
+            if len(track) == 1 and track[0].get_id() == track_id_focus:
+                update_tracked_probability = len(used_detection) - 1
+    return embeddings_np, used_detection, update_tracked_probability
+
+
+def time_frames(func, detections, iterations):
+    func(detections)  # warmup
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(detections)
+    return (time.perf_counter() - start) / iterations
+
+
+def run_benchmark(detection_counts, iterations, seed=0):
+    """Compare per frame gathering cost of the legacy loop and EmbeddingGatherer. Returns a list of result dicts."""
+    rng = np.random.default_rng(seed)
+    gatherer = EmbeddingGatherer(MATRIX_TYPE, UNIQUE_ID_TYPE)
+    results = []
+    for count in detection_counts:
+        detections = synthetic_detections(rng, count)
+        legacy_ms = time_frames(legacy_gather, detections, iterations) * 1000
+        gather_ms = time_frames(gatherer.gather, detections, iterations) * 1000
+        results.append({"detections": count, "legacy_ms": legacy_ms, "gather_ms": gather_ms})
+        logger.info("%4d detections: legacy %.3f ms, gatherer %.3f ms per frame (x%.1f)",
+                    count, legacy_ms, gather_ms, legacy_ms / gather_ms)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gathering detection embeddings in the hailopython matcher")
+    parser.add_argument("--detections", type=int, nargs='+', default=[1, 4, 16, 64, 256], help="Detections per frame")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed frames per configuration")
+    args = parser.parse_args()
+    run_benchmark(args.detections, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+
+
+def random_embeddings(rng, rows, dim=EMBEDDING_DIM):
+    embeddings = rng.standard_normal((rows, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def row_by_row_match(matcher, image_embedding_np):
+    """The per-row match loop match() used before it was vectorized, kept for comparison."""
+    valid_entries = matcher.get_embeddings()
+    text_embeddings_np = np.array([matcher.entries[i].embedding for i in valid_entries])
+    all_dot_products = None
+    for row_idx, image_embedding_1d in enumerate(image_embedding_np):
+        dot_products = np.dot(text_embeddings_np, image_embedding_1d)
+        all_dot_products = dot_products[np.newaxis, :] if all_dot_products is None else np.vstack((all_dot_products, dot_products))
+        similarities = np.exp(100 * dot_products)
+        similarities /= np.sum(similarities)
+        best_idx = np.argmax(similarities)
+        for i, _ in enumerate(similarities):
+            matcher.probabilities[valid_entries[i]] = similarities[i]
+            matcher.tracked_probabilities[valid_entries[i]] = similarities[i]
+
+
+def time_call(func, iterations):
+    func()  # warmup
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def run_benchmark(rows_list, prompts_list, iterations, seed=0):
+    """Time match() for every (rows, prompts) combination. Returns a list of result dicts."""
+    rng = np.random.default_rng(seed)
+    matcher = TextImageMatcher()
+    results = []
+    for prompts in prompts_list:
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding)
+                           for i, embedding in enumerate(random_embeddings(rng, prompts))]
+        for rows in rows_list:
+            images = random_embeddings(rng, rows)
+            vectorized = time_call(lambda: matcher.match(images, report_all=True), iterations)
+            row_by_row = time_call(lambda: row_by_row_match(matcher, images), iterations)
+            results.append({
+                "rows": rows,
+                "prompts": prompts,
+                "match_ms": vectorized * 1000,
+                "row_by_row_ms": row_by_row * 1000,
+                "speedup": row_by_row / vectorized,
+            })
+            logger.info("rows %4d prompts %5d: match() %.3f ms, row by row %.3f ms (x%.1f)",
+                        rows, prompts, vectorized * 1000, row_by_row * 1000, row_by_row / vectorized)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TextImageMatcher.match() scaling with rows and prompts")
+    parser.add_argument("--rows", type=int, nargs='+', default=[1, 8, 32, 128], help="Image embedding rows per frame")
+    parser.add_argument("--prompts", type=int, nargs='+', default=[6, 32, 256, 1024], help="Number of text prompts")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed iterations per combination")
+    args = parser.parse_args()
+    run_benchmark(args.rows, args.prompts, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+
+
+def normalize(embeddings):
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_vocabulary(rng, num_prompts, num_clusters, noise=0.6):
+    """Prompts grouped around num_clusters topics, like catalog prompts sharing a product type."""
+    centers = normalize(rng.standard_normal((num_clusters, EMBEDDING_DIM)))
+    noise_vectors = normalize(rng.standard_normal((num_prompts, EMBEDDING_DIM)))
+    return normalize(centers[rng.integers(num_clusters, size=num_prompts)] + noise * noise_vectors)
+
+
+def synthetic_queries(rng, prompts, rows, noise=0.6):
+    """Image embeddings close to random prompts."""
+    noise_vectors = normalize(rng.standard_normal((rows, EMBEDDING_DIM)))
+    return normalize(prompts[rng.integers(len(prompts), size=rows)] + noise * noise_vectors)
+
+
+def best_entries(matcher, queries):
+    return np.array([m.entry_index for m in matcher.match(queries, report_all=True)])
+
+
+def time_match(matcher, queries, iterations):
+    matcher.match(queries, report_all=True)  # warmup, builds the prompt matrix and index
+    start = time.perf_counter()
+    for _ in range(iterations):
+        matcher.match(queries, report_all=True)
+    return (time.perf_counter() - start) / iterations
+
+
+def run_benchmark(sizes, n_probes, top_k, rows, num_queries, iterations, seed=0):
+    """Compare brute force and indexed match() latency and top-1 recall. Returns a list of result dicts."""
+    rng = np.random.default_rng(seed)
+    matcher = TextImageMatcher()
+    results = []
+    for num_prompts in sizes:
+        prompts = synthetic_vocabulary(rng, num_prompts, max(16, num_prompts // 200))
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding) for i, embedding in enumerate(prompts)]
+        queries = synthetic_queries(rng, prompts, num_queries)
+        frame = queries[:rows]
+
+        matcher.set_index_mode(False)
+        brute_force_ms = time_match(matcher, frame, iterations) * 1000
+        expected = best_entries(matcher, queries)
+        logger.info("%6d prompts: brute force %.3f ms per frame of %d rows", num_prompts, brute_force_ms, rows)
+
+        for n_probe in n_probes:
+            matcher.set_index_mode(True, n_probe=n_probe, top_k=top_k, min_prompts=0)
+            start = time.perf_counter()
+            matcher.match(frame)
+            build_s = time.perf_counter() - start
+            indexed_ms = time_match(matcher, frame, iterations) * 1000
+            recall = float(np.mean(best_entries(matcher, queries) == expected))
+            results.append({
+                "num_prompts": num_prompts,
+                "n_lists": matcher._snapshot.prompt_index.n_lists,
+                "n_probe": n_probe,
+                "top_k": top_k,
+                "build_s": build_s,
+                "brute_force_ms": brute_force_ms,
+                "indexed_ms": indexed_ms,
+                "recall_at_1": recall,
+            })
+            logger.info("%6d prompts, %d lists, n_probe %3d: build %.2f s, match %.3f ms (x%.1f), recall@1 %.3f",
+                        num_prompts, matcher._snapshot.prompt_index.n_lists, n_probe, build_s, indexed_ms,
+                        brute_force_ms / indexed_ms, recall)
+        matcher.set_index_mode(False)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prompt index against brute force match()")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000], help="Vocabulary sizes")
+    parser.add_argument("--n-probe", type=int, nargs='+', default=[1, 4, 8, 16, 32], help="Lists probed per query")
+    parser.add_argument("--top-k", type=int, default=32, help="Candidates re-scored per query")
+    parser.add_argument("--rows", type=int, default=8, help="Image embeddings per frame")
+    parser.add_argument("--queries", type=int, default=512, help="Queries used to measure recall")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed iterations per configuration")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.n_probe, args.top_k, args.rows, args.queries, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.prompt_matrix import PromptMatrix, STORAGE_DTYPES
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+
+
+def normalize(embeddings):
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+
+def time_dot(prompt_matrix, frame, iterations):
+    prompt_matrix.dot(frame)  # warmup
+    start = time.perf_counter()
+    for _ in range(iterations):
+        prompt_matrix.dot(frame)
+    return (time.perf_counter() - start) / iterations
+
+
+def run_benchmark(sizes, dtypes, rows, num_queries, iterations, seed=0):
+    """Compare prompt matrix memory, scoring latency and top-1 agreement with float32. Returns a list of result dicts."""
+    rng = np.random.default_rng(seed)
+    results = []
+    for num_prompts in sizes:
+        prompts = normalize(rng.standard_normal((num_prompts, EMBEDDING_DIM)))
+        # Image embeddings close to random prompts
+        queries = normalize(prompts[rng.integers(num_prompts, size=num_queries)] +
+                            0.6 * normalize(rng.standard_normal((num_queries, EMBEDDING_DIM))))
+        frame = queries[:rows]
+        reference = queries @ prompts.T
+        expected = np.argmax(reference, axis=1)
+        for dtype in dtypes:
+            prompt_matrix = PromptMatrix.quantize(prompts, dtype)
+            match_ms = time_dot(prompt_matrix, frame, iterations) * 1000
+            dot_products = prompt_matrix.dot(queries)
+            results.append({
+                "num_prompts": num_prompts,
+                "dtype": dtype,
+                "matrix_mb": prompt_matrix.nbytes / 2**20,
+                "match_ms": match_ms,
+                "max_abs_error": float(np.abs(dot_products - reference).max()),
+                "top1_agreement": float(np.mean(np.argmax(dot_products, axis=1) == expected)),
+            })
+            logger.info("%7d prompts %-7s: %8.2f MB, %.3f ms per frame of %d rows, max error %.2e, top-1 agreement %.4f",
+                        num_prompts, dtype, results[-1]["matrix_mb"], match_ms, rows,
+                        results[-1]["max_abs_error"], results[-1]["top1_agreement"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float16 / int8 prompt matrix storage against float32")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000], help="Vocabulary sizes")
+    parser.add_argument("--dtypes", type=str, nargs='+', default=list(STORAGE_DTYPES), choices=list(STORAGE_DTYPES), help="Storage types")
+    parser.add_argument("--rows", type=int, default=8, help="Image embeddings per frame")
+    parser.add_argument("--queries", type=int, default=512, help="Queries used to measure top-1 agreement")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed iterations per configuration")
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.dtypes, args.rows, args.queries, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
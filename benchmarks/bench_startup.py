@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+
+# Add path for clip app
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_DIR)
+
+from clip_app.logger_setup import setup_logger, set_log_level
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+# Modules that must not be imported unless text is encoded
+HEAVY_MODULES = ["torch", "clip", "PIL"]
+IMPORT_MODULES = ["clip_app.text_image_matcher", "clip_app.clip_app_pipeline"]
+
+
+def measure_import(module, repeats):
+    """Import module in fresh interpreters. Returns the median import time and the heavy modules it pulled in."""
+    code = (f"import sys, time, json; start = time.perf_counter(); import {module}; "
+            f"print(json.dumps([time.perf_counter() - start, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))")
+    times = []
+    heavy = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.warning("Could not import %s: %s", module, result.stderr.strip().splitlines()[-1])
+            return None
+        import_time, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(import_time)
+    return {"module": module, "import_ms": statistics.median(times) * 1000, "heavy_modules": heavy}
+
+
+def run_first_frame(app_args):
+    """Run the app until the first buffer reaches identity_callback. Prints the elapsed time as JSON and exits."""
+    start = time.perf_counter()
+    from gi.repository import Gst
+    from clip_app.clip_app_pipeline import ClipApp
+    from clip_app.clip_callback import app_callback_class
+
+    def first_frame_callback(self, pad, info, user_data):
+        print(json.dumps({"time_to_first_frame_s": time.perf_counter() - start}), flush=True)
+        os._exit(0)
+        return Gst.PadProbeReturn.OK
+
+    sys.argv = [sys.argv[0]] + app_args
+    app = ClipApp(app_callback_class(), first_frame_callback)
+    app.run()
+
+
+def measure_first_frame(app_args, timeout):
+    try:
+        result = subprocess.run([sys.executable, __file__, "--run-first-frame", "--"] + app_args,
+                                cwd=REPO_DIR, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning("No frame received within %s seconds", timeout)
+        return None
+    for line in reversed(result.stdout.strip().splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    logger.warning("App exited without reaching the first frame: %s", result.stderr.strip()[-500:])
+    return None
+
+
+def run_benchmark(repeats, app_args=None, timeout=120):
+    results = []
+    for module in IMPORT_MODULES:
+        result = measure_import(module, repeats)
+        if result is None:
+            continue
+        results.append(result)
+        logger.info("import %s: %.1f ms, heavy modules imported: %s", module, result["import_ms"], result["heavy_modules"] or "none")
+        if result["heavy_modules"]:
+            logger.error("Regression: %s imports %s at module level", module, result["heavy_modules"])
+    if app_args is not None:
+        result = measure_first_frame(app_args, timeout)
+        if result is not None:
+            results.append(result)
+            logger.info("Time to first frame (%s): %.2f s", " ".join(app_args), result["time_to_first_frame_s"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time and time to first frame of the CLIP app")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreter imports per module")
+    parser.add_argument("--first-frame", action="store_true", help="Also measure time to first frame, requires a Hailo device")
+    parser.add_argument("--timeout", type=int, default=120, help="Time to first frame timeout in seconds")
+    parser.add_argument("--run-first-frame", action="store_true", help=argparse.SUPPRESS)
+    args, app_args = parser.parse_known_args()
+    app_args = [arg for arg in app_args if arg != "--"]
+    if args.run_first_frame:
+        run_first_frame(app_args)
+        return
+    results = run_benchmark(args.repeats, (app_args or ["--input", "demo"]) if args.first_frame else None, args.timeout)
+    if any(result.get("heavy_modules") for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
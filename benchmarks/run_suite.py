@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import numpy as np
+
+# Add path for clip app and the benchmark modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clip_app.logger_setup import setup_logger, set_log_level
+
+"""
+CPU only benchmark suite: runs the matcher, embedding I/O and per frame callback benchmarks, writes the
+results as JSON and compares them with a stored baseline.
+A result is a regression when a timing is more than threshold (relative) above the baseline result with the
+same configuration. Create or refresh the baseline on the reference machine with --update-baseline.
+"""
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARKS_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 0.2  # 20% slower than the baseline
+DEFAULT_MIN_DELTA_MS = 0.01  # Smaller differences are timer noise
+
+
+class Suite:
+    def __init__(self, name, run, key_fields, metrics):
+        self.name = name
+        self.run = run  # run(quick) returns a list of result dicts
+        self.key_fields = key_fields  # Fields identifying the configuration of a result
+        self.metrics = metrics  # Timings compared with the baseline, lower is better
+
+    def key(self, result):
+        return tuple(result.get(field) for field in self.key_fields)
+
+
+def run_match(quick):
+    import bench_match
+    if quick:
+        return bench_match.run_benchmark([1, 8], [6, 256], 10)
+    return bench_match.run_benchmark([1, 8, 32], [6, 64, 1024], 50)
+
+
+def run_embedding_io(quick):
+    import bench_embedding_io
+    return bench_embedding_io.run_benchmark([100] if quick else [100, 1000, 10000])
+
+
+def run_callbacks(quick):
+    import bench_callbacks
+    if quick:
+        return bench_callbacks.run_benchmark([1, 8], 50)
+    return bench_callbacks.run_benchmark([1, 8, 32], 500)
+
+
+SUITES = {suite.name: suite for suite in (
+    Suite("match", run_match, ["rows", "prompts"], ["match_ms"]),
+    Suite("embedding_io", run_embedding_io, ["format", "num_entries"], ["save_ms", "load_ms", "first_match_ms"]),
+    Suite("callbacks", run_callbacks, ["callback", "detections", "label"], ["frame_ms"]),
+)}
+
+
+def run_suites(names, quick=False):
+    """Run the named suites. Returns the results document written to JSON."""
+    results = {}
+    for name in names:
+        logger.info("Running %s benchmarks", name)
+        start = time.perf_counter()
+        results[name] = SUITES[name].run(quick)
+        logger.info("%s benchmarks done in %.1f s", name, time.perf_counter() - start)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "quick": quick,
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Compare two results documents. Returns a list of comparison dicts, one per metric of every result found in
+    both, with "regression" set when the current timing is above the baseline by more than threshold.
+    """
+    comparisons = []
+    for name, results in current["results"].items():
+        suite = SUITES.get(name)
+        if suite is None:
+            continue
+        baseline_results = {suite.key(result): result for result in baseline.get("results", {}).get(name, [])}
+        for result in results:
+            baseline_result = baseline_results.get(suite.key(result))
+            if baseline_result is None:
+                continue
+            for metric in suite.metrics:
+                if metric not in result or metric not in baseline_result:
+                    continue
+                value, reference = result[metric], baseline_result[metric]
+                ratio = value / reference if reference > 0 else float("inf")
+                comparisons.append({
+                    "suite": name,
+                    "config": dict(zip(suite.key_fields, suite.key(result))),
+                    "metric": metric,
+                    "baseline": reference,
+                    "current": value,
+                    "ratio": ratio,
+                    "regression": ratio > 1 + threshold and value - reference > min_delta_ms,
+                })
+    return comparisons
+
+
+def log_comparisons(comparisons):
+    for comparison in comparisons:
+        config = ", ".join(f"{field}={value}" for field, value in comparison["config"].items() if value is not None)
+        log = logger.warning if comparison["regression"] else logger.info
+        log("%s%-12s %-30s %-14s %9.3f ms -> %9.3f ms (x%.2f)", "REGRESSION " if comparison["regression"] else "",
+            comparison["suite"], config, comparison["metric"], comparison["baseline"], comparison["current"],
+            comparison["ratio"])
+
+
+def load_json(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(document, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CPU benchmark suite and compare it with a baseline")
+    parser.add_argument("--suites", type=str, nargs='+', default=list(SUITES), choices=list(SUITES), help="Suites to run")
+    parser.add_argument("--quick", action="store_true", help="Run smaller configurations, for a quick check")
+    parser.add_argument("--output", type=str, default=DEFAULT_OUTPUT, help="Results JSON file")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown reported as a regression, 0.2 is 20%% slower than the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help="Ignore slowdowns smaller than this, in ms")
+    parser.add_argument("--update-baseline", action="store_true", help="Save the results as the new baseline")
+    args = parser.parse_args()
+
+    document = run_suites(args.suites, args.quick)
+    save_json(document, args.output)
+    logger.info("Results saved to %s", args.output)
+    if args.update_baseline:
+        save_json(document, args.baseline)
+        logger.info("Baseline saved to %s", args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        logger.info("No baseline at %s, run with --update-baseline to create it", args.baseline)
+        return 0
+    baseline = load_json(args.baseline)
+    if baseline.get("quick") != document["quick"]:
+        logger.warning("Comparing %s results with a %s baseline", "quick" if document["quick"] else "full",
+                       "quick" if baseline.get("quick") else "full")
+    comparisons = compare(document, baseline, args.threshold, args.min_delta_ms)
+    log_comparisons(comparisons)
+    regressions = [comparison for comparison in comparisons if comparison["regression"]]
+    logger.info("%s timings compared, %s regressions above %.0f%%", len(comparisons), len(regressions), args.threshold * 100)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
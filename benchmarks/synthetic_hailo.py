@@ -0,0 +1,164 @@
+import sys
+import types
+import importlib
+import numpy as np
+
+"""
+Synthetic ROI / detection objects for benchmarking the per frame callbacks on a machine without a Hailo device.
+The objects implement the subset of the hailo Python bindings used by clip_hailopython.run() and the app callbacks.
+When the hailo, gsthailo or gi modules are not installed, install() registers minimal synthetic modules so the
+callback modules can be imported; installed modules are always used as they are.
+"""
+
+EMBEDDING_DIM = 640  # RN50x4 embedding size
+
+# Object types, the same values as the hailo bindings
+HAILO_UNIQUE_ID = 2
+HAILO_DETECTION = 3
+HAILO_CLASSIFICATION = 4
+HAILO_MATRIX = 9
+
+
+class SyntheticObject:
+    """Stand in for the hailo ROI objects: a type, optional data and child objects."""
+
+    def __init__(self, obj_type, data=None, track_id=None, children=()):
+        self.obj_type = obj_type
+        self.data = data
+        self.track_id = track_id
+        self.children = list(children)
+
+    def get_type(self):
+        return self.obj_type
+
+    def get_data(self):
+        # The hailo bindings return the matrix data as a Python list
+        return self.data.tolist()
+
+    def get_id(self):
+        return self.track_id
+
+    def get_objects(self):
+        return self.children
+
+    def get_objects_typed(self, obj_type):
+        return [child for child in self.children if child.get_type() == obj_type]
+
+    def add_object(self, obj):
+        self.children.append(obj)
+
+    def remove_object(self, obj):
+        self.children.remove(obj)
+
+
+class HailoClassification(SyntheticObject):
+    def __init__(self, classification_type, label, confidence):
+        super().__init__(HAILO_CLASSIFICATION)
+        self.classification_type = classification_type
+        self.label = label
+        self.confidence = confidence
+
+    def get_label(self):
+        return self.label
+
+    def get_confidence(self):
+        return self.confidence
+
+    def get_classification_type(self):
+        return self.classification_type
+
+
+class HailoDetection(SyntheticObject):
+    def __init__(self, label="person", confidence=0.9, children=()):
+        super().__init__(HAILO_DETECTION, children=children)
+        self.label = label
+        self.confidence = confidence
+
+    def get_label(self):
+        return self.label
+
+    def get_bbox(self):
+        return (0.0, 0.0, 1.0, 1.0)
+
+    def get_confidence(self):
+        return self.confidence
+
+
+class SyntheticBuffer:
+    def __init__(self, roi):
+        self.roi = roi
+
+
+class SyntheticProbeInfo:
+    """Stand in for Gst.PadProbeInfo, get_buffer() returns a buffer holding the ROI."""
+
+    def __init__(self, roi):
+        self.buffer = SyntheticBuffer(roi)
+
+    def get_buffer(self):
+        return self.buffer
+
+
+class SyntheticVideoFrame:
+    """Stand in for gsthailo.VideoFrame."""
+
+    def __init__(self, roi):
+        self.roi = roi
+
+
+def synthetic_roi(rng, num_detections, track_ids=True, dim=EMBEDDING_DIM):
+    """Return an ROI holding num_detections detections, each with a CLIP embedding and a track id."""
+    hailo = sys.modules.get("hailo")
+    matrix_type = getattr(hailo, "HAILO_MATRIX", HAILO_MATRIX)
+    unique_id_type = getattr(hailo, "HAILO_UNIQUE_ID", HAILO_UNIQUE_ID)
+    embeddings = rng.standard_normal((num_detections, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    detections = []
+    for i, embedding in enumerate(embeddings):
+        children = [SyntheticObject(matrix_type, data=embedding)]
+        if track_ids:
+            children.append(SyntheticObject(unique_id_type, track_id=i))
+        detections.append(HailoDetection(children=children))
+    return SyntheticObject(0, children=detections)
+
+
+def _synthetic_hailo():
+    module = types.ModuleType("hailo")
+    module.HAILO_UNIQUE_ID = HAILO_UNIQUE_ID
+    module.HAILO_DETECTION = HAILO_DETECTION
+    module.HAILO_CLASSIFICATION = HAILO_CLASSIFICATION
+    module.HAILO_MATRIX = HAILO_MATRIX
+    module.HailoClassification = HailoClassification
+    module.HailoDetection = HailoDetection
+    module.get_roi_from_buffer = lambda buffer: buffer.roi
+    return module
+
+
+def _synthetic_gi():
+    gi = types.ModuleType("gi")
+    gi.require_version = lambda namespace, version: None
+    repository = types.ModuleType("gi.repository")
+    gst = types.SimpleNamespace(PadProbeReturn=types.SimpleNamespace(OK=0), FlowReturn=types.SimpleNamespace(OK=0))
+    repository.Gst = gst
+    gi.repository = repository
+    return {"gi": gi, "gi.repository": repository}
+
+
+def _synthetic_gsthailo():
+    module = types.ModuleType("gsthailo")
+    module.VideoFrame = SyntheticVideoFrame
+    return module
+
+
+def install():
+    """Register synthetic modules for the missing hailo / gsthailo / gi modules. Returns the names installed."""
+    installed = []
+    for name, factory in (("hailo", lambda: {"hailo": _synthetic_hailo()}),
+                          ("gi", _synthetic_gi),
+                          ("gsthailo", lambda: {"gsthailo": _synthetic_gsthailo()})):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            sys.modules.update(factory())
+            installed.append(name)
+    return installed
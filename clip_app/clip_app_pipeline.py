@@ -11,11 +11,14 @@ gi.require_version('Gtk', '3.0')
 gi.require_version('Gst', '1.0')
 from gi.repository import Gtk, Gst, GLib
 from clip_app.logger_setup import setup_logger, set_log_level
-from clip_app.clip_pipeline import get_pipeline
+from clip_app.clip_pipeline import get_pipeline, add_pipeline_arguments
 from clip_app.text_image_matcher import text_image_matcher
+from clip_app.embeddings_watcher import EmbeddingsWatcher
+from clip_app.prompt_encoder import PromptEncodingWorker
+from clip_app.embedding_log import configure_recording
+from clip_app.pipeline_metrics import PipelineMetrics
 from clip_app.clip_callback import app_callback_class, dummy_callback
 from clip_app import gui
-from hailo_apps_infra.gstreamer_app import picamera_thread
 from hailo_apps_infra.gstreamer_helper_pipelines import get_source_type
 
 # add logging
@@ -44,15 +47,7 @@ class ClipApp():
         
     def parse_arguments(self):
         parser = argparse.ArgumentParser(description="Hailo online CLIP app")
-        parser.add_argument("--input", "-i", type=str, default="/dev/video0", help="Input source. Can be a file, USB (webcam), RPi camera (CSI camera module). \
-        For RPi camera use '-i rpi' \
-        For demo video use '--input demo'. \
-        Default is /dev/video0.")
-        parser.add_argument("--detector", "-d", type=str, choices=["person", "face", "none"], default="none", help="Which detection pipeline to use.")
-        parser.add_argument("--json-path", type=str, default=None, help="Path to JSON file to load and save embeddings. If not set, embeddings.json will be used.")
-        parser.add_argument("--disable-sync", action="store_true",help="Disables display sink sync, will run as fast as possible. Relevant when using file source.")
-        parser.add_argument("--dump-dot", action="store_true", help="Dump the pipeline graph to a dot file.")
-        parser.add_argument("--detection-threshold", type=float, default=0.5, help="Detection threshold.")
+        add_pipeline_arguments(parser)
         parser.add_argument("--show-fps", "-f", action="store_true", help="Print FPS on sink.")
         parser.add_argument("--disable-runtime-prompts", action="store_true", help="When set, app will not support runtime prompts. Default is False.")
 
@@ -74,6 +69,12 @@ class AppWindow(Gtk.Window):
     update_progress_bars = gui.update_progress_bars
     on_track_id_update = gui.on_track_id_update
     disable_text_boxes = gui.disable_text_boxes
+    enable_text_boxes = gui.enable_text_boxes
+    on_model_ready = gui.on_model_ready
+    on_embeddings_reloaded = gui.on_embeddings_reloaded
+    submit_text = gui.submit_text
+    update_pending_state = gui.update_pending_state
+    on_prompts_encoded = gui.on_prompts_encoded
 
     # Add the get_pipeline function to the AppWindow class
     get_pipeline = get_pipeline
@@ -97,6 +98,7 @@ class AppWindow(Gtk.Window):
 
         # Create options menu
         self.options_menu = args
+        configure_recording(self.options_menu)
 
         self.dump_dot = self.options_menu.dump_dot
         self.video_source = self.options_menu.input
@@ -116,6 +118,8 @@ class AppWindow(Gtk.Window):
         Gst.init(None)
         self.pipeline = self.create_pipeline()
         if self.input == "rpi":
+            # Imported here to keep picamera dependencies off the startup path of other sources
+            from hailo_apps_infra.gstreamer_app import picamera_thread
             picam_thread = threading.Thread(target=picamera_thread, args=(self.pipeline, 1280, 720, 'RGB'))
             picam_thread.start()
         bus = self.pipeline.get_bus()
@@ -125,6 +129,10 @@ class AppWindow(Gtk.Window):
         # get text_image_matcher instance
         self.text_image_matcher = text_image_matcher
         self.text_image_matcher.set_threshold(self.options_menu.detection_threshold)
+        # Text prompts are encoded in the background, results are shown from the GTK thread
+        self.prompt_encoder = PromptEncodingWorker(
+            self.text_image_matcher, on_applied=lambda indices: GLib.idle_add(self.on_prompts_encoded, indices))
+        self.prompt_encoder.start()
 
         # build UI
         self.max_entries = 6
@@ -136,12 +144,19 @@ class AppWindow(Gtk.Window):
             self.disable_text_boxes()
             self.on_load_button_clicked(None)
         else:
-            self.text_image_matcher.init_clip()
-
-        if self.text_image_matcher.model_runtime is not None:
-            logger.info("Using %s for text embedding", self.text_image_matcher.model_runtime)
+            # Start streaming with the saved embeddings, text boxes are enabled once the model is loaded
+            logger.info("Loading text embedding model in the background. Loading %s", self.json_file)
             self.on_load_button_clicked(None)
+            self.disable_text_boxes()
+            self.text_image_matcher.init_clip_async(on_ready=lambda: GLib.idle_add(self.on_model_ready))
 
+        self.embeddings_watcher = None
+        if self.options_menu.watch_embeddings:
+            self.embeddings_watcher = EmbeddingsWatcher(
+                self.text_image_matcher, self.json_file,
+                on_reload=lambda success, latency, error: GLib.idle_add(self.on_embeddings_reloaded, success),
+                before_publish=self.prompt_encoder.cancel)
+            self.embeddings_watcher.start()
 
         identity = self.pipeline.get_by_name("identity_callback")
         if identity is None:
@@ -149,6 +164,8 @@ class AppWindow(Gtk.Window):
         else:
             identity_pad = identity.get_static_pad("src")
             identity_pad.add_probe(Gst.PadProbeType.BUFFER, partial(self.app_callback, self), self.user_data)
+        self.pipeline_metrics = PipelineMetrics(self.pipeline, self.options_menu)
+        self.pipeline_metrics.start()
         # start the pipeline
         self.pipeline.set_state(Gst.State.PLAYING)
 
@@ -176,6 +193,7 @@ class AppWindow(Gtk.Window):
     def dump_dot_file(self):
         logger.info("Dumping dot file...")
         Gst.debug_bin_to_dot_file(self.pipeline, Gst.DebugGraphDetails.ALL, "pipeline")
+        self.pipeline_metrics.dump(self.current_path)
         return False
 
 
@@ -192,6 +210,7 @@ class AppWindow(Gtk.Window):
             # print which element is reporting QOS
             src = message.src.get_name()
             logger.info("QOS from %s", src)
+            self.pipeline_metrics.on_qos(src)
         return True
 
 
@@ -208,6 +227,8 @@ class AppWindow(Gtk.Window):
 
     def shutdown(self):
         logger.info("Sending EOS event to the pipeline...")
+        self.prompt_encoder.stop()
+        self.pipeline_metrics.stop()
         self.pipeline.send_event(Gst.Event.new_eos())
 
     def create_pipeline(self):
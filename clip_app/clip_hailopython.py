@@ -1,9 +1,30 @@
+import atexit
 import hailo
-import numpy as np
 # Importing VideoFrame before importing GST is must
 from gsthailo import VideoFrame
 from gi.repository import Gst
 from clip_app.text_image_matcher import text_image_matcher
+from clip_app.track_match_cache import TrackMatchCache
+from clip_app.embedding_gatherer import EmbeddingGatherer
+from clip_app.embedding_log import EmbeddingRecorder
+
+track_match_cache = TrackMatchCache()
+embedding_gatherer = EmbeddingGatherer(hailo.HAILO_MATRIX, hailo.HAILO_UNIQUE_ID)
+# Set CLIP_EMBEDDINGS_LOG to record the frames' embeddings for offline replay (see embedding_log.py)
+embedding_recorder = EmbeddingRecorder.from_environment()
+if embedding_recorder is not None:
+    atexit.register(embedding_recorder.close)
+
+def record_frame(video_frame, embeddings_np, used_detection, track_ids):
+    bboxes = []
+    for detection in used_detection:
+        bbox = detection.get_bbox()
+        bboxes.append((bbox.xmin(), bbox.ymin(), bbox.width(), bbox.height()))
+    buffer = getattr(video_frame, "buffer", None)
+    pts = getattr(buffer, "pts", None)
+    if pts is not None and pts == Gst.CLOCK_TIME_NONE:
+        pts = None
+    embedding_recorder.record(embeddings_np, track_ids, bboxes, pts=pts)
 
 def run(video_frame: VideoFrame):
     top_level_matrix = video_frame.roi.get_objects_typed(hailo.HAILO_MATRIX)
@@ -12,31 +33,28 @@ def run(video_frame: VideoFrame):
     else:
         detections = [video_frame.roi] # Use the ROI as the detection
 
-    embeddings_np = None
-    used_detection = []
+    embeddings_np, used_detection, track_ids = embedding_gatherer.gather(detections)
+    if embedding_recorder is not None:
+        record_frame(video_frame, embeddings_np, used_detection, track_ids)
     track_id_focus = text_image_matcher.track_id_focus # Used to focus on a specific track_id
     update_tracked_probability = None
-    for detection in detections:
-        results = detection.get_objects_typed(hailo.HAILO_MATRIX)
-        if len(results) == 0:
-            # print("No matrix found in detection")
-            continue
-        # Convert the matrix to a NumPy array
-        detection_embeddings = np.array(results[0].get_data())
-        used_detection.append(detection)
-        if embeddings_np is None:
-            embeddings_np = detection_embeddings[np.newaxis, :]
-        else:
-            embeddings_np = np.vstack((embeddings_np, detection_embeddings))
-        if track_id_focus is not None:
-            track = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
-            if len(track) == 1:
-                track_id = track[0].get_id()
-                # If we have a track_id_focus, update only the tracked_probability of the focused track
-                if track_id == track_id_focus:
-                    update_tracked_probability = len(used_detection) - 1
-    if embeddings_np is not None:
-        matches = text_image_matcher.match(embeddings_np, report_all=True, update_tracked_probability=update_tracked_probability)
+    if track_id_focus is not None and track_id_focus in track_ids:
+        # If we have a track_id_focus, update only the tracked_probability of the focused track
+        update_tracked_probability = track_ids.index(track_id_focus)
+    if embeddings_np is not None and text_image_matcher.get_active_profiles():
+        # Named profiles replace the matcher entries, every profile can add a classification
+        profile_matches = text_image_matcher.match_profiles(embeddings_np)
+        for detection in used_detection:
+            for old in detection.get_objects_typed(hailo.HAILO_CLASSIFICATION):
+                detection.remove_object(old)
+        for name, matches in profile_matches.items():
+            for match in matches:
+                classification = hailo.HailoClassification(name, match.text, match.similarity)
+                used_detection[match.row_idx].add_object(classification)
+    elif embeddings_np is not None:
+        # Tracks that were not re-cropped since the last frame reuse their cached match
+        matches = track_match_cache.match(text_image_matcher, embeddings_np, track_ids,
+                                          update_tracked_probability=update_tracked_probability)
         for match in matches:
             # (row_idx, label, confidence, entry_index) = match
             detection = used_detection[match.row_idx]
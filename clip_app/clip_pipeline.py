@@ -1,5 +1,6 @@
 import os
 import re
+from clip_app.pipeline_metrics import add_metrics_arguments
 
 # Pipeline parameters
 video_width = 1280
@@ -35,6 +36,35 @@ from hailo_apps_infra.gstreamer_helper_pipelines import (
 # NEW helper function to add in your gstreamer_helper_pipelines.py
 ###################################################################
 
+def HEADLESS_SINK_PIPELINE(sink="fakesink", sync="false", name="hailo_display"):
+    """
+    Replaces DISPLAY_PIPELINE when running without a display: no overlay, no video conversion.
+    sink is fakesink, or appsink for applications pulling the frames.
+    """
+    if sink == "appsink":
+        sink_element = f'appsink name={name} sync={sync} max-buffers=1 drop=true emit-signals=true'
+    else:
+        sink_element = f'fakesink name={name} sync={sync}'
+    return f'{QUEUE(name=f"{name}_q")} ! {sink_element}'
+
+
+def add_pipeline_arguments(parser):
+    """Arguments shared by the GUI app and the headless runner."""
+    parser.add_argument("--input", "-i", type=str, default="/dev/video0", help="Input source. Can be a file, USB (webcam), RPi camera (CSI camera module). \
+    For RPi camera use '-i rpi' \
+    For demo video use '--input demo'. \
+    Default is /dev/video0.")
+    parser.add_argument("--detector", "-d", type=str, choices=["person", "face", "none"], default="none", help="Which detection pipeline to use.")
+    parser.add_argument("--json-path", type=str, default=None, help="Path to JSON file to load and save embeddings. If not set, embeddings.json will be used.")
+    parser.add_argument("--disable-sync", action="store_true",help="Disables display sink sync, will run as fast as possible. Relevant when using file source.")
+    parser.add_argument("--dump-dot", action="store_true", help="Dump the pipeline graph to a dot file.")
+    parser.add_argument("--detection-threshold", type=float, default=0.5, help="Detection threshold.")
+    parser.add_argument("--watch-embeddings", action="store_true", help="Reload the --json-path file whenever it changes on disk.")
+    parser.add_argument("--record-embeddings", type=str, default=None, help="Record the frames' image embeddings to this log file, for offline replay.")
+    parser.add_argument("--record-shard-frames", type=int, default=None, help="Start a new --record-embeddings shard file every this many frames.")
+    add_metrics_arguments(parser)
+    return parser
+
 
 def get_pipeline(self):
     # Initialize directories and paths
@@ -121,7 +151,12 @@ def get_pipeline(self):
     # TBD aggregator does not support ROI classification
     # clip_pipeline_wrapper = INFERENCE_PIPELINE_WRAPPER(clip_pipeline, name='clip')
 
-    display_pipeline = DISPLAY_PIPELINE(sync=self.sync, show_fps=self.show_fps)
+    if getattr(self, "headless", False):
+        # Frames are timestamped after the source to measure the end to end latency at the sink
+        source_pipeline = f'{source_pipeline} ! identity name=headless_source_stamp '
+        display_pipeline = HEADLESS_SINK_PIPELINE(sink=self.headless_sink, sync=self.sync)
+    else:
+        display_pipeline = DISPLAY_PIPELINE(sync=self.sync, show_fps=self.show_fps)
 
     # Text to image matcher
     CLIP_PYTHON_MATCHER = f'hailopython name=pyproc module={hailopython_path} qos=false '
@@ -0,0 +1,91 @@
+import numpy as np
+
+from clip_app.logger_setup import setup_logger
+
+"""
+Gathers the CLIP embeddings attached to the detections of a frame into one float32 matrix.
+The matrix is a preallocated buffer reused between frames, grown to the largest number of detections seen.
+Every detection's sub objects are listed once to find both its embedding (HAILO_MATRIX) and its track id
+(HAILO_UNIQUE_ID). Embedding data is copied straight from the matrix buffer when the hailo bindings expose one,
+otherwise from get_data().
+Embeddings whose size differs from the first embedding of the frame are skipped, as in the C++ matcher filter().
+This module does not import hailo, the object type ids are passed in, so it can be used with synthetic objects.
+"""
+
+logger = setup_logger()
+
+DEFAULT_MAX_DETECTIONS = 32
+
+
+class EmbeddingGatherer:
+    def __init__(self, matrix_type, unique_id_type, max_detections=DEFAULT_MAX_DETECTIONS):
+        self.matrix_type = matrix_type
+        self.unique_id_type = unique_id_type
+        self.max_detections = max_detections
+        self._buffer = None  # (max_detections x dim) float32, allocated on the first embedding
+        self._buffer_protocol = None  # Whether the matrix objects support the buffer protocol, checked once
+        self.skipped = 0  # Embeddings skipped because their size differs from the first one of their frame
+
+    def _ensure_capacity(self, rows, dim):
+        """Make room for rows embeddings of dim. The dim only changes on the first row of a frame, nothing to keep then."""
+        if self._buffer is not None and self._buffer.shape[1] == dim and rows <= len(self._buffer):
+            return
+        capacity = max(self.max_detections, rows)
+        if self._buffer is not None and self._buffer.shape[1] == dim:
+            capacity = max(capacity, 2 * len(self._buffer))
+            grown = np.empty((capacity, dim), dtype=np.float32)
+            grown[:len(self._buffer)] = self._buffer
+            self._buffer = grown
+        else:
+            self._buffer = np.empty((capacity, dim), dtype=np.float32)
+        self.max_detections = capacity
+
+    def _matrix_data(self, matrix):
+        """Return the matrix data as a flat array view if possible, otherwise as the get_data() sequence."""
+        if self._buffer_protocol is None:
+            try:
+                memoryview(matrix)
+                self._buffer_protocol = True
+            except TypeError:
+                self._buffer_protocol = False
+        if self._buffer_protocol:
+            return np.asarray(memoryview(matrix)).reshape(-1)
+        return matrix.get_data()
+
+    def gather(self, detections):
+        """
+        Return (embeddings, used_detections, track_ids) for the detections holding an embedding.
+        embeddings is a (len(used_detections) x dim) view of the reused buffer, valid until the next call.
+        track_ids holds the track id of every used detection, or None for untracked detections.
+        """
+        used_detections = []
+        track_ids = []
+        rows = 0
+        dim = None
+        for detection in detections:
+            matrix = None
+            track_id = None
+            for obj in detection.get_objects():
+                obj_type = obj.get_type()
+                if obj_type == self.matrix_type and matrix is None:
+                    matrix = obj
+                elif obj_type == self.unique_id_type:
+                    track_id = obj.get_id()
+            if matrix is None:
+                continue
+            data = self._matrix_data(matrix)
+            if dim is None:
+                dim = len(data)
+            elif len(data) != dim:
+                if self.skipped == 0:
+                    logger.warning("Skipping a detection embedding of size %s, expected %s", len(data), dim)
+                self.skipped += 1
+                continue
+            self._ensure_capacity(rows + 1, dim)
+            self._buffer[rows] = data
+            rows += 1
+            used_detections.append(detection)
+            track_ids.append(track_id)
+        if rows == 0:
+            return None, used_detections, track_ids
+        return self._buffer[:rows], used_detections, track_ids
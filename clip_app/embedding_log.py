@@ -0,0 +1,425 @@
+import os
+import sys
+import glob
+import json
+import time
+import struct
+import logging
+import argparse
+import multiprocessing
+import numpy as np
+
+from clip_app.logger_setup import setup_logger, set_log_level
+
+"""
+Record and replay of the per frame image embeddings, to work on the matcher without a Hailo device.
+
+The recorder appends every frame's detection embeddings, track ids, bboxes and timestamps to a binary log.
+The replayer streams one or more logs back through TextImageMatcher.match(), as fast as possible or at the
+recorded rate, and reports the match time and the matches per prompt. Logs recorded with shard_frames are split
+in several files, which can be replayed by several worker processes.
+
+Log layout (little endian):
+    file header   magic b"HCLIPLOG" (8 bytes), version uint32, dtype uint32 (0 float32, 1 float16)
+    frame record  timestamp float64 (seconds), pts int64 (ns, -1 if unknown), rows uint32, dim uint32,
+                  then rows int64 track ids (-1 for untracked detections),
+                  rows x 4 float32 bboxes (xmin, ymin, width, height, normalized),
+                  rows x dim embeddings of the file dtype.
+Records are only appended, a log cut by a crash is read up to its last complete record.
+
+Recording from the pipeline: set CLIP_EMBEDDINGS_LOG (or run the app with --record-embeddings).
+Replay: python -m clip_app.embedding_log replay logs/*.clog --embeddings example_embeddings.json --workers 4
+"""
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+LOG_MAGIC = b"HCLIPLOG"
+LOG_FORMAT_VERSION = 1
+LOG_EXTENSION = ".clog"
+FILE_HEADER_STRUCT = struct.Struct("<8sII")
+RECORD_STRUCT = struct.Struct("<dqII")
+LOG_DTYPES = {"float32": 0, "float16": 1}
+NO_PTS = -1
+NO_TRACK_ID = -1
+FLUSH_INTERVAL = 30  # Frames between flushes of the log file
+
+RECORD_ENV = "CLIP_EMBEDDINGS_LOG"
+RECORD_SHARD_FRAMES_ENV = "CLIP_EMBEDDINGS_LOG_SHARD_FRAMES"
+RECORD_DTYPE_ENV = "CLIP_EMBEDDINGS_LOG_DTYPE"
+
+
+def _record_size(rows, dim, dtype):
+    return RECORD_STRUCT.size + rows * 8 + rows * 16 + rows * dim * dtype.itemsize
+
+
+def _read_file_header(f, filename):
+    header = f.read(FILE_HEADER_STRUCT.size)
+    if len(header) != FILE_HEADER_STRUCT.size:
+        raise ValueError(f"{filename} is too short to be an embeddings log")
+    magic, version, dtype_code = FILE_HEADER_STRUCT.unpack(header)
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{filename} is not an embeddings log")
+    if version != LOG_FORMAT_VERSION:
+        raise ValueError(f"Unsupported embeddings log version {version} in {filename}")
+    names = {code: name for name, code in LOG_DTYPES.items()}
+    if dtype_code not in names:
+        raise ValueError(f"Unknown embeddings log dtype {dtype_code} in {filename}")
+    return np.dtype(names[dtype_code]).newbyteorder('<')
+
+
+def _complete_length(filename):
+    """Return (dtype, length of the file up to the end of its last complete record)."""
+    with open(filename, 'rb') as f:
+        dtype = _read_file_header(f, filename)
+        size = os.fstat(f.fileno()).st_size
+        offset = FILE_HEADER_STRUCT.size
+        while offset + RECORD_STRUCT.size <= size:
+            f.seek(offset)
+            _, _, rows, dim = RECORD_STRUCT.unpack(f.read(RECORD_STRUCT.size))
+            end = offset + _record_size(rows, dim, dtype)
+            if end > size:
+                break
+            offset = end
+    return dtype, offset
+
+
+def shard_path(path, index):
+    """Path of shard index of a log recorded with shard_frames: logs/run.clog -> logs/run-00003.clog."""
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index:05d}{ext or LOG_EXTENSION}"
+
+
+class EmbeddingRecorder:
+    """
+    Appends frames to an embeddings log. With shard_frames, a new shard file (see shard_path) is started every
+    shard_frames frames. Appending to an existing log continues it, after dropping an incomplete last record.
+    """
+
+    def __init__(self, path, dtype="float32", shard_frames=None, clock=time.time):
+        if dtype not in LOG_DTYPES:
+            raise ValueError(f"Unsupported embeddings log dtype {dtype}, use one of {list(LOG_DTYPES)}")
+        self.path = path
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.shard_frames = shard_frames
+        self.clock = clock
+        self.frames = 0
+        self.paths = []
+        self._file = None
+        self._shard = 0
+        self._shard_count = 0
+
+    @classmethod
+    def from_environment(cls, environ=os.environ):
+        """Return a recorder configured by the CLIP_EMBEDDINGS_LOG* variables, or None if recording is off."""
+        path = environ.get(RECORD_ENV)
+        if not path:
+            return None
+        shard_frames = environ.get(RECORD_SHARD_FRAMES_ENV)
+        return cls(path, dtype=environ.get(RECORD_DTYPE_ENV, "float32"),
+                   shard_frames=int(shard_frames) if shard_frames else None)
+
+    def _open(self, filename):
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.isfile(filename) and os.path.getsize(filename) > 0:
+            dtype, length = _complete_length(filename)
+            if dtype != self.dtype:
+                raise ValueError(f"{filename} holds {dtype.name} embeddings, cannot append {self.dtype.name}")
+            f = open(filename, 'r+b')
+            f.truncate(length)
+            f.seek(length)
+        else:
+            f = open(filename, 'wb')
+            f.write(FILE_HEADER_STRUCT.pack(LOG_MAGIC, LOG_FORMAT_VERSION, LOG_DTYPES[self.dtype.name]))
+        self.paths.append(filename)
+        logger.info("Recording embeddings to %s", filename)
+        return f
+
+    def _current_file(self):
+        if self._file is not None and self.shard_frames and self._shard_count >= self.shard_frames:
+            self._file.close()
+            self._file = None
+            self._shard += 1
+        if self._file is None:
+            self._shard_count = 0
+            self._file = self._open(shard_path(self.path, self._shard) if self.shard_frames else self.path)
+        return self._file
+
+    def record(self, embeddings, track_ids=None, bboxes=None, timestamp=None, pts=None):
+        """
+        Append a frame. embeddings is (rows x dim) or None for a frame without embeddings, track_ids holds a track id
+        or None per row, bboxes a (xmin, ymin, width, height) per row. timestamp defaults to the clock.
+        """
+        if embeddings is None:
+            embeddings = np.zeros((0, 0), dtype=self.dtype)
+        embeddings = np.asarray(embeddings, dtype=self.dtype)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        rows, dim = embeddings.shape
+        ids = np.full(rows, NO_TRACK_ID, dtype='<i8')
+        if track_ids is not None:
+            ids[:] = [NO_TRACK_ID if track_id is None else track_id for track_id in track_ids]
+        boxes = np.zeros((rows, 4), dtype='<f4')
+        if bboxes is not None and rows:
+            boxes[:] = bboxes
+        header = RECORD_STRUCT.pack(self.clock() if timestamp is None else timestamp,
+                                    NO_PTS if pts is None else pts, rows, dim)
+        f = self._current_file()
+        f.write(b"".join((header, ids.tobytes(), boxes.tobytes(), embeddings.tobytes())))
+        self.frames += 1
+        self._shard_count += 1
+        if self.frames % FLUSH_INTERVAL == 0:
+            f.flush()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LoggedFrame:
+    def __init__(self, timestamp, pts, track_ids, bboxes, embeddings):
+        self.timestamp = timestamp  # Recording time in seconds
+        self.pts = pts  # Buffer PTS in ns, None if unknown
+        self.track_ids = track_ids  # int64 array, -1 for untracked detections
+        self.bboxes = bboxes  # (rows x 4) float32 (xmin, ymin, width, height)
+        self.embeddings = embeddings  # (rows x dim) float32
+
+    def track_id_list(self):
+        """Track ids as TrackMatchCache expects them, None for untracked detections."""
+        return [None if track_id == NO_TRACK_ID else int(track_id) for track_id in self.track_ids]
+
+
+def read_log(filename):
+    """Yield the LoggedFrames of an embeddings log. A truncated last record is skipped with a warning."""
+    with open(filename, 'rb') as f:
+        dtype = _read_file_header(f, filename)
+        while True:
+            header = f.read(RECORD_STRUCT.size)
+            if len(header) == 0:
+                return
+            if len(header) < RECORD_STRUCT.size:
+                break
+            timestamp, pts, rows, dim = RECORD_STRUCT.unpack(header)
+            payload_size = _record_size(rows, dim, dtype) - RECORD_STRUCT.size
+            payload = f.read(payload_size)
+            if len(payload) < payload_size:
+                break
+            track_ids = np.frombuffer(payload, dtype='<i8', count=rows)
+            bboxes = np.frombuffer(payload, dtype='<f4', count=rows * 4, offset=rows * 8).reshape(rows, 4)
+            embeddings = np.frombuffer(payload, dtype=dtype, count=rows * dim, offset=rows * 24).reshape(rows, dim)
+            yield LoggedFrame(timestamp, None if pts == NO_PTS else pts, track_ids, bboxes,
+                              embeddings.astype(np.float32))
+    logger.warning("%s ends with an incomplete record, it was skipped", filename)
+
+
+def log_info(filename):
+    """Return a dict describing a log: frames, detections, embedding dim, dtype and recorded duration."""
+    with open(filename, 'rb') as f:
+        dtype = _read_file_header(f, filename)
+    frames = detections = dim = 0
+    first = last = None
+    for frame in read_log(filename):
+        frames += 1
+        detections += len(frame.embeddings)
+        dim = frame.embeddings.shape[1] or dim
+        first = frame.timestamp if first is None else first
+        last = frame.timestamp
+    return {"file": filename, "dtype": dtype.name, "frames": frames, "detections": detections, "dim": dim,
+            "duration_s": last - first if frames else 0.0}
+
+
+def expand_log_paths(paths):
+    """Expand directories (to their *.clog files) and keep files as they are, sorted by name."""
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob.glob(os.path.join(path, f"*{LOG_EXTENSION}"))))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+class ReplayResult:
+    """Match times and best matches of replayed frames. Results of several shards are combined with merge()."""
+
+    def __init__(self):
+        self.frames = 0
+        self.detections = 0
+        self.elapsed = 0.0
+        self.match_times = []  # Seconds per frame with detections
+        self.similarities = {}  # Best matching text -> similarities of the rows it was the best match for
+        self.negative = {}  # text -> True for negative prompts
+        self.passed = {}  # text -> rows matched above the threshold (positive prompts only)
+
+    def add_frame(self, matches, match_time):
+        self.frames += 1
+        if match_time is None:
+            return
+        self.detections += len(matches)
+        self.match_times.append(match_time)
+        for match in matches:
+            self.similarities.setdefault(match.text, []).append(float(match.similarity))
+            self.negative[match.text] = match.negative
+            if match.passed_threshold and not match.negative:
+                self.passed[match.text] = self.passed.get(match.text, 0) + 1
+
+    def merge(self, other):
+        self.frames += other.frames
+        self.detections += other.detections
+        self.elapsed = max(self.elapsed, other.elapsed)  # Shards are replayed in parallel
+        self.match_times.extend(other.match_times)
+        for text, similarities in other.similarities.items():
+            self.similarities.setdefault(text, []).extend(similarities)
+        self.negative.update(other.negative)
+        for text, count in other.passed.items():
+            self.passed[text] = self.passed.get(text, 0) + count
+        return self
+
+    def summary(self, thresholds=()):
+        """
+        Return the summary dict. thresholds lists extra thresholds to evaluate, for calibration:
+        for every one, the number of rows whose best match is a positive prompt at or above it.
+        """
+        times = np.array(self.match_times) * 1000
+        prompts = {}
+        for text, similarities in sorted(self.similarities.items()):
+            values = np.array(similarities)
+            prompts[text] = {
+                "negative": self.negative[text],
+                "best": len(values),
+                "passed": self.passed.get(text, 0),
+                "similarity_p50": float(np.percentile(values, 50)),
+                "similarity_p90": float(np.percentile(values, 90)),
+            }
+        sweep = {}
+        for threshold in thresholds:
+            sweep[str(threshold)] = int(sum(np.count_nonzero(np.array(similarities) >= threshold)
+                                            for text, similarities in self.similarities.items()
+                                            if not self.negative[text]))
+        return {
+            "frames": self.frames,
+            "detections": self.detections,
+            "elapsed_s": self.elapsed,
+            "fps": self.frames / self.elapsed if self.elapsed > 0 else 0.0,
+            "match_mean_ms": float(times.mean()) if len(times) else 0.0,
+            "match_p50_ms": float(np.percentile(times, 50)) if len(times) else 0.0,
+            "match_p99_ms": float(np.percentile(times, 99)) if len(times) else 0.0,
+            "prompts": prompts,
+            "threshold_sweep": sweep,
+        }
+
+
+def replay(filenames, matcher, realtime=False, speed=1.0, result=None):
+    """
+    Stream logged frames through matcher.match(report_all=True), in file order.
+    realtime waits between frames to keep the recorded timing (divided by speed), otherwise frames are matched
+    as fast as possible. Returns a ReplayResult.
+    """
+    result = ReplayResult() if result is None else result
+    start = time.perf_counter()
+    first_timestamp = None
+    for filename in filenames:
+        for frame in read_log(filename):
+            if realtime:
+                if first_timestamp is None:
+                    first_timestamp = frame.timestamp
+                delay = (frame.timestamp - first_timestamp) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if len(frame.embeddings) == 0:
+                result.add_frame([], None)
+                continue
+            match_start = time.perf_counter()
+            matches = matcher.match(frame.embeddings, report_all=True)
+            result.add_frame(matches, time.perf_counter() - match_start)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _replay_worker(filename, embeddings_file, threshold, realtime, speed):
+    """Replay one shard in a worker process, with the process' own matcher."""
+    from clip_app.text_image_matcher import text_image_matcher
+    text_image_matcher.load_embeddings(embeddings_file)
+    if threshold is not None:
+        text_image_matcher.set_threshold(threshold)
+    return replay([filename], text_image_matcher, realtime, speed)
+
+
+def replay_shards(filenames, embeddings_file, workers=1, threshold=None, realtime=False, speed=1.0):
+    """
+    Replay log files against the prompts of embeddings_file. With more than one worker, every file is replayed
+    by one of workers processes and the results are merged. Returns a ReplayResult.
+    """
+    if workers <= 1 or len(filenames) <= 1:
+        from clip_app.text_image_matcher import text_image_matcher
+        text_image_matcher.load_embeddings(embeddings_file)
+        if threshold is not None:
+            text_image_matcher.set_threshold(threshold)
+        return replay(filenames, text_image_matcher, realtime, speed)
+    result = ReplayResult()
+    tasks = [(filename, embeddings_file, threshold, realtime, speed) for filename in filenames]
+    with multiprocessing.get_context("spawn").Pool(min(workers, len(filenames))) as pool:
+        for shard_result in pool.starmap(_replay_worker, tasks):
+            result.merge(shard_result)
+    return result
+
+
+def configure_recording(args):
+    """Set the recording environment of the pipeline's hailopython module from the app arguments."""
+    if getattr(args, "record_embeddings", None):
+        os.environ[RECORD_ENV] = os.path.abspath(args.record_embeddings)
+        if args.record_shard_frames:
+            os.environ[RECORD_SHARD_FRAMES_ENV] = str(args.record_shard_frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded image embeddings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info_parser = subparsers.add_parser("info", help="Print the frames, detections and duration of logs")
+    info_parser.add_argument("logs", type=str, nargs='+', help=f"Log files or directories of {LOG_EXTENSION} files")
+    replay_parser = subparsers.add_parser("replay", help="Replay logs through the matcher")
+    replay_parser.add_argument("logs", type=str, nargs='+', help=f"Log files or directories of {LOG_EXTENSION} files")
+    replay_parser.add_argument("--embeddings", type=str, required=True, help="Prompts to match, JSON or binary embeddings file")
+    replay_parser.add_argument("--threshold", type=float, default=None, help="Override the embeddings file threshold")
+    replay_parser.add_argument("--thresholds", type=float, nargs='+', default=[], help="Thresholds to count positive matches at, for calibration")
+    replay_parser.add_argument("--rate", type=str, choices=["max", "original"], default="max", help="Replay as fast as possible or at the recorded rate")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Speed up factor of --rate original")
+    replay_parser.add_argument("--workers", type=int, default=1, help="Worker processes, each replays whole files")
+    replay_parser.add_argument("--summary-json", type=str, default=None, help="Write the replay summary to this JSON file")
+    args = parser.parse_args()
+
+    filenames = expand_log_paths(args.logs)
+    if not filenames:
+        print("No log files found")
+        sys.exit(1)
+    if args.command == "info":
+        for filename in filenames:
+            info = log_info(filename)
+            logger.info("%s: %s frames, %s detections, dim %s (%s), %.1f s", filename, info["frames"],
+                        info["detections"], info["dim"], info["dtype"], info["duration_s"])
+        return
+
+    result = replay_shards(filenames, args.embeddings, args.workers, args.threshold, args.rate == "original", args.speed)
+    summary = result.summary(args.thresholds)
+    logger.info("Replayed %s frames (%s detections) in %.2f s: %.1f FPS, match mean %.3f ms, p99 %.3f ms",
+                summary["frames"], summary["detections"], summary["elapsed_s"], summary["fps"],
+                summary["match_mean_ms"], summary["match_p99_ms"])
+    for text, prompt in summary["prompts"].items():
+        logger.info("%-40s %s best: %6d, passed: %6d, similarity p50 %.3f, p90 %.3f", text,
+                    "(negative)" if prompt["negative"] else "          ", prompt["best"], prompt["passed"],
+                    prompt["similarity_p50"], prompt["similarity_p90"])
+    for threshold, count in summary["threshold_sweep"].items():
+        logger.info("Positive matches at threshold %s: %s", threshold, count)
+    if args.summary_json is not None:
+        with open(args.summary_json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
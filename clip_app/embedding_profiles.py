@@ -0,0 +1,41 @@
+import numpy as np
+
+from clip_app.prompt_matrix import PromptMatrix
+
+"""
+Named embedding profiles held in memory by the TextImageMatcher.
+A profile is a set of prompts with its own threshold and negatives, usually loaded from an embeddings file.
+The active profiles are stacked into a single ProfileSet so that one matrix product per frame scores all
+of them. ProfileSets are immutable and built once per set of names, switching the active set only swaps
+the matcher's reference to a prebuilt ProfileSet.
+"""
+
+
+class EmbeddingProfile:
+    def __init__(self, name, entries, threshold):
+        self.name = name
+        self.entries = list(entries)
+        self.threshold = threshold
+        self.valid_entries = np.array([i for i, entry in enumerate(self.entries) if entry.text != ""], dtype=np.intp)
+        self.valid_texts = [self.entries[i].text for i in self.valid_entries]
+        self.negative_mask = np.array([self.entries[i].negative for i in self.valid_entries], dtype=bool)
+
+    def embeddings(self):
+        """Return the (valid entries x dim) float32 prompt matrix of the profile."""
+        return np.array([self.entries[i].embedding for i in self.valid_entries], dtype=np.float32)
+
+
+class ProfileSet:
+    def __init__(self, profiles, storage_dtype="float32"):
+        self.profiles = tuple(profiles)
+        self.names = tuple(profile.name for profile in self.profiles)
+        self.storage_dtype = storage_dtype
+        sizes = [len(profile.valid_entries) for profile in self.profiles]
+        # Profile i owns the columns offsets[i]:offsets[i + 1] of the stacked matrix
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.intp)
+        stacked = [profile.embeddings() for profile in self.profiles if len(profile.valid_entries)]
+        matrix = np.concatenate(stacked) if stacked else np.zeros((0, 0), dtype=np.float32)
+        self.prompt_matrix = PromptMatrix.quantize(matrix, storage_dtype)
+
+    def __len__(self):
+        return len(self.profiles)
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import struct
+import tempfile
+import argparse
+import numpy as np
+
+from clip_app.prompt_matrix import PromptMatrix, STORAGE_DTYPES
+
+"""
+Binary embeddings file format, readable by both the Python and the C++ TextImageMatcher.
+
+Layout (little endian):
+    offset 0   magic        8 bytes  b"HCLIPEMB"
+    offset 8   version      uint32
+    offset 12  meta_length  uint32   length of the UTF-8 JSON metadata
+    offset 16  rows         uint32   rows in the embedding matrix
+    offset 20  dim          uint32   embedding dimension
+    offset 24  metadata     JSON: threshold, text_prefix, ensemble_template, dtype and entries
+                            (text, negative, ensemble, row). row is -1 for entries without embedding.
+    data_offset             rows x dim matrix, data_offset is 24 + meta_length rounded up to 64.
+    scales_offset           int8 only: float32 scale per row, at the end of the matrix rounded up to 64.
+
+dtype is float32 (version 1 files, the default), float16 or int8 (version 2 files).
+The matrix is memory mapped at load, so loading does not depend on the number of entries.
+"""
+
+EMBEDDINGS_MAGIC = b"HCLIPEMB"
+EMBEDDINGS_FORMAT_VERSION = 1
+EMBEDDINGS_QUANTIZED_FORMAT_VERSION = 2
+BINARY_EXTENSION = ".emb"
+HEADER_STRUCT = struct.Struct("<8sIIII")
+DATA_ALIGNMENT = 64
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Mode of the files written through a temporary file, as open() would create them (mkstemp() creates them 0600).
+# Read once at import, os.umask() changes the mask of the whole process while it is read.
+FILE_MODE = 0o666 & ~_umask()
+
+
+def is_binary_embeddings_file(filename):
+    """Return True if filename starts with the binary embeddings magic."""
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(EMBEDDINGS_MAGIC)) == EMBEDDINGS_MAGIC
+    except OSError:
+        return False
+
+
+def _align(offset):
+    return (offset + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+
+def _data_offset(meta_length):
+    return _align(HEADER_STRUCT.size + meta_length)
+
+
+def write_binary_embeddings(filename, metadata, prompt_matrix):
+    """
+    Write metadata and a PromptMatrix to filename.
+    The file is written to a temporary file and renamed, so readers that memory mapped
+    the previous version keep a valid mapping.
+    """
+    matrix = np.ascontiguousarray(prompt_matrix.data, dtype=np.dtype(prompt_matrix.dtype).newbyteorder('<'))
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(0, 0)
+    metadata = dict(metadata, dtype=prompt_matrix.dtype)
+    version = EMBEDDINGS_FORMAT_VERSION if prompt_matrix.dtype == "float32" else EMBEDDINGS_QUANTIZED_FORMAT_VERSION
+    meta_bytes = json.dumps(metadata).encode('utf-8')
+    header = HEADER_STRUCT.pack(EMBEDDINGS_MAGIC, version, len(meta_bytes), matrix.shape[0], matrix.shape[1])
+    data_offset = _data_offset(len(meta_bytes))
+    padding = data_offset - HEADER_STRUCT.size - len(meta_bytes)
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=BINARY_EXTENSION)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(meta_bytes)
+            f.write(b"\0" * padding)
+            f.write(matrix.tobytes())
+            if prompt_matrix.scales is not None:
+                matrix_end = data_offset + matrix.nbytes
+                f.write(b"\0" * (_align(matrix_end) - matrix_end))
+                f.write(np.ascontiguousarray(prompt_matrix.scales, dtype='<f4').tobytes())
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_binary_embeddings(filename, mmap=True):
+    """
+    Read a binary embeddings file.
+    Returns (metadata, prompt_matrix). With mmap the matrix data is a read-only np.memmap of the file.
+    Raises ValueError if the file is not a valid binary embeddings file.
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(HEADER_STRUCT.size)
+        if len(header) != HEADER_STRUCT.size:
+            raise ValueError(f"{filename} is too short to be a binary embeddings file")
+        magic, version, meta_length, rows, dim = HEADER_STRUCT.unpack(header)
+        if magic != EMBEDDINGS_MAGIC:
+            raise ValueError(f"{filename} is not a binary embeddings file")
+        if version not in (EMBEDDINGS_FORMAT_VERSION, EMBEDDINGS_QUANTIZED_FORMAT_VERSION):
+            raise ValueError(f"Unsupported embeddings format version {version} in {filename}")
+        metadata = json.loads(f.read(meta_length).decode('utf-8'))
+        dtype = np.dtype(metadata.get("dtype", "float32")).newbyteorder('<')
+        offset = _data_offset(meta_length)
+        matrix_bytes = rows * dim * dtype.itemsize
+        scales_offset = _align(offset + matrix_bytes)
+        has_scales = dtype.name == "int8"
+        expected_size = scales_offset + rows * 4 if has_scales else offset + matrix_bytes
+        if os.fstat(f.fileno()).st_size < expected_size:
+            raise ValueError(f"{filename} is truncated, expected {expected_size} bytes")
+        if rows * dim == 0:
+            matrix = np.zeros((rows, dim), dtype=dtype)
+        elif mmap:
+            matrix = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(rows, dim))
+        else:
+            f.seek(offset)
+            matrix = np.fromfile(f, dtype=dtype, count=rows * dim).reshape(rows, dim)
+        scales = None
+        if has_scales:
+            f.seek(scales_offset)
+            scales = np.fromfile(f, dtype='<f4', count=rows)
+    return metadata, PromptMatrix(matrix, scales)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert embeddings files between JSON and the binary format.")
+    parser.add_argument("input", type=str, help="Input embeddings file (JSON or binary)")
+    parser.add_argument("output", type=str, help=f"Output embeddings file, binary if it ends with {BINARY_EXTENSION}, JSON otherwise")
+    parser.add_argument("--storage-dtype", type=str, default="float32", choices=list(STORAGE_DTYPES),
+                        help="Binary output matrix type, default=float32")
+    args = parser.parse_args()
+
+    from clip_app.text_image_matcher import text_image_matcher
+    if not os.path.isfile(args.input):
+        print(f"Input file {args.input} does not exist")
+        sys.exit(1)
+    text_image_matcher.load_embeddings(args.input)
+    text_image_matcher.set_storage_dtype(args.storage_dtype)
+    text_image_matcher.save_embeddings(args.output)
+
+
+if __name__ == "__main__":
+    main()
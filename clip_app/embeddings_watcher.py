@@ -0,0 +1,210 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+import numpy as np
+
+from clip_app.logger_setup import setup_logger
+
+"""
+Watches an embeddings file and hot reloads it into the TextImageMatcher.
+Changes are detected with inotify on the file's directory (so files replaced by a rename are seen),
+or by polling the file's modification time, size and inode where inotify is not available.
+The file is parsed, validated and turned into a prompt snapshot on the watcher thread, then published
+with TextImageMatcher.publish_entries(); frames being matched keep using the previous snapshot.
+"""
+
+logger = setup_logger()
+
+DEFAULT_POLL_INTERVAL = 1.0  # Seconds between checks when polling, and between stop checks with inotify
+DEFAULT_SETTLE_TIME = 0.1  # Seconds without further changes before a modified file is reloaded
+
+# inotify(7) constants
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len, followed by len bytes of name
+
+
+class InotifyWatch:
+    """Minimal inotify watch of a directory, through libc with ctypes."""
+
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Return the names of the files changed within timeout seconds."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+        names = set()
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            names.add(os.fsdecode(data[offset:offset + name_length].rstrip(b"\0")))
+            offset += name_length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+def validate_embeddings(data, entries):
+    """Raise ValueError if the loaded embeddings can not be used by the matcher."""
+    threshold = data.get('threshold')
+    if not isinstance(threshold, (int, float)):
+        raise ValueError(f"invalid threshold {threshold!r}")
+    dims = set()
+    for entry in entries:
+        if entry.text == "":
+            continue
+        embedding = np.asarray(entry.embedding)
+        if embedding.ndim != 1 or embedding.size == 0:
+            raise ValueError(f"entry {entry.text!r} has no embedding")
+        if not np.all(np.isfinite(embedding)):
+            raise ValueError(f"entry {entry.text!r} has non finite values")
+        dims.add(embedding.size)
+    if len(dims) > 1:
+        raise ValueError(f"entries have different embedding sizes {sorted(dims)}")
+
+
+class EmbeddingsWatcher:
+    def __init__(self, matcher, filename, on_reload=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                 settle_time=DEFAULT_SETTLE_TIME, use_inotify=True, before_publish=None):
+        """
+        Reload filename into matcher whenever it changes.
+        on_reload(success, latency, error) is called from the watcher thread after every reload attempt.
+        before_publish() is called from the watcher thread once the file is valid, just before its entries replace
+        the matcher entries (PromptEncodingWorker.cancel, so queued text updates do not overwrite them).
+        """
+        self.matcher = matcher
+        self.before_publish = before_publish
+        self.filename = os.path.abspath(filename)
+        self.on_reload = on_reload
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.use_inotify = use_inotify
+        self.reloads = 0
+        self.failures = 0
+        self.last_latency = None  # Seconds to parse, validate and publish the last reload
+        self.last_error = None
+        self._signature = self._file_signature()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def mark_current(self):
+        """Do not reload the current file content, call after the app saved the file itself."""
+        self._signature = self._file_signature()
+
+    def start(self):
+        """Start watching on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="EmbeddingsWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = InotifyWatch(os.path.dirname(self.filename))
+            except OSError as e:
+                logger.info("inotify is not available (%s), polling %s", e, self.filename)
+        name = os.path.basename(self.filename)
+        try:
+            while not self._stop_event.is_set():
+                if inotify is not None:
+                    if name not in inotify.wait(self.poll_interval):
+                        continue
+                elif self._stop_event.wait(self.poll_interval):
+                    break
+                if self._file_signature() != self._signature:
+                    self._settle()
+                    self.reload()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _settle(self):
+        # Wait until the writer is done, files written in place change over several events
+        signature = self._file_signature()
+        while not self._stop_event.wait(self.settle_time):
+            current = self._file_signature()
+            if current == signature:
+                return
+            signature = current
+
+    def reload(self):
+        """Parse, validate and publish the file. Returns True on success."""
+        start_time = time.perf_counter()
+        self._signature = self._file_signature()
+        try:
+            data, entries, storage_dtype = self.matcher.read_embeddings_file(self.filename)
+            validate_embeddings(data, entries)
+            if self.before_publish is not None:
+                self.before_publish()
+            self.matcher.publish_entries(entries, data['threshold'], data.get('text_prefix'),
+                                         data.get('ensemble_template'), storage_dtype)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error("Failed to reload embeddings from %s: %s", self.filename, e)
+            if self.on_reload is not None:
+                self.on_reload(False, None, self.last_error)
+            return False
+        self.reloads += 1
+        self.last_latency = time.perf_counter() - start_time
+        self.last_error = None
+        logger.info("Reloaded %s entries from %s in %.1f ms", len(entries), self.filename, self.last_latency * 1000)
+        if self.on_reload is not None:
+            self.on_reload(True, self.last_latency, None)
+        return True
+
+    def stats(self):
+        return {
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_latency": self.last_latency,
+            "last_error": self.last_error,
+        }
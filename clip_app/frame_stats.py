@@ -0,0 +1,65 @@
+import time
+import threading
+from collections import OrderedDict
+
+from clip_app.latency_tracer import LatencyHistogram
+
+"""
+Throughput and latency of frames flowing through the pipeline.
+Frames are identified by their PTS: start(pts) is called where frames enter the pipeline and finish(pts)
+where they leave it, both usually from pad probes running on different streaming threads.
+Latencies go to a streaming log scale histogram, so memory and summary() time stay constant on long runs.
+"""
+
+MAX_IN_FLIGHT = 1024  # Frames dropped inside the pipeline are forgotten after this many newer frames
+
+
+class FrameStats:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.frames = 0
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.latencies = LatencyHistogram()  # Milliseconds from start() to finish()
+        self._in_flight = OrderedDict()  # pts -> start time
+        self._lock = threading.Lock()
+
+    def start(self, pts):
+        now = self.clock()
+        with self._lock:
+            self._in_flight[pts] = now
+            if len(self._in_flight) > MAX_IN_FLIGHT:
+                self._in_flight.popitem(last=False)
+
+    def finish(self, pts=None):
+        """Count a frame leaving the pipeline, its latency is recorded if start(pts) was called."""
+        now = self.clock()
+        with self._lock:
+            self.frames += 1
+            if self.first_frame_time is None:
+                self.first_frame_time = now
+            self.last_frame_time = now
+            start_time = self._in_flight.pop(pts, None) if pts is not None else None
+            if start_time is not None:
+                self.latencies.add((now - start_time) * 1000)
+            return self.frames
+
+    def summary(self):
+        """Return frames, fps between the first and last frame, and latency percentiles in ms."""
+        with self._lock:
+            elapsed = (self.last_frame_time - self.first_frame_time) if self.frames > 1 else 0.0
+            summary = {
+                "frames": self.frames,
+                "elapsed_s": elapsed,
+                "fps": (self.frames - 1) / elapsed if elapsed > 0 else 0.0,
+                "latency_frames": self.latencies.count,
+            }
+            if self.latencies.count:
+                summary.update({
+                    "latency_mean_ms": self.latencies.total / self.latencies.count,
+                    "latency_p50_ms": self.latencies.percentile(50),
+                    "latency_p95_ms": self.latencies.percentile(95),
+                    "latency_p99_ms": self.latencies.percentile(99),
+                    "latency_max_ms": self.latencies.max,
+                })
+            return summary
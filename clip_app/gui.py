@@ -140,11 +140,22 @@ def quit_button_clicked(self, widget):
     self.shutdown()
 
 
+def submit_text(self, idx):
+    """Queue encoding of text box idx with its check buttons, the entry is updated by the prompt encoding worker."""
+    self.prompt_encoder.submit(idx, self.text_boxes[idx].get_text(),
+                               self.negative_check_buttons[idx].get_active(),
+                               self.ensemble_check_buttons[idx].get_active())
+    self.update_pending_state()
+
 def on_text_box_updated(self, widget, event, idx):
     """Callback function for text box updates."""
     text = widget.get_text()
+    entries = self.text_image_matcher.entries
+    if (not self.prompt_encoder.is_pending(idx) and idx < len(entries) and entries[idx].text == text and
+            entries[idx].ensemble == self.ensemble_check_buttons[idx].get_active()):
+        return  # Focus changes without edits do not encode again
     logger.info("Text box %s updated: %s", idx, text)
-    self.text_image_matcher.add_text(widget.get_text(), idx)
+    self.submit_text(idx)
 
 def on_track_id_update(self, widget):
     """Callback function for track id updates."""
@@ -166,18 +177,25 @@ def on_slider_value_changed(self, widget):
 def on_negative_check_button_toggled(self, widget, idx):
     negative = widget.get_active()
     logger.info("Text box %s is set to negative: %s", idx, negative)
-    self.text_image_matcher.entries[idx].negative = negative
+    if self.prompt_encoder.is_pending(idx):
+        # The queued update would restore the previous flag
+        self.submit_text(idx)
+    else:
+        self.text_image_matcher.set_negative(idx, negative)
 
 def on_ensemble_check_button_toggled(self, widget, idx):
     ensemble = widget.get_active()
     logger.info("Text box %s is set to ensemble: %s", idx, ensemble)
     # Encode text with new ensemble option
-    self.text_image_matcher.add_text(self.text_boxes[idx].get_text(), idx, ensemble=ensemble)
+    self.submit_text(idx)
 
 def on_load_button_clicked(self, widget):
     """Callback function for the load button."""
     logger.info("Loading embeddings from %s\n", self.json_file)
+    # Queued text updates would overwrite the loaded entries
+    self.prompt_encoder.cancel()
     self.text_image_matcher.load_embeddings(self.json_file)
+    self.update_pending_state()
     if len(self.text_image_matcher.entries) > self.max_entries:
         print(f"Load more then {self.max_entries} embeddings.\nSkipping updating text boxes.")
     self.update_text_boxes()
@@ -188,18 +206,61 @@ def on_save_button_clicked(self, widget):
     """Callback function for the save button."""
     logger.info("Saving embeddings to %s\n", self.json_file)
     self.text_image_matcher.save_embeddings(self.json_file)
+    if self.embeddings_watcher is not None:
+        self.embeddings_watcher.mark_current()
 
 def update_progress_bars(self):
     """Updates the progress bars based on the current probability values."""
-    if len(self.text_image_matcher.entries) > self.max_entries:
-        return
-    for i, entry in enumerate(self.text_image_matcher.entries):
+    # Entries and probabilities are read from the same snapshot, the matcher thread may publish a new one meanwhile
+    snapshot = self.text_image_matcher.get_snapshot()
+    if len(snapshot.entries) > self.max_entries:
+        return True
+    _, tracked_probabilities = snapshot.stats.sample()
+    for i, entry in enumerate(snapshot.entries):
         if entry.text != "":
-            self.probability_progress_bars[i].set_fraction(entry.tracked_probability)
+            self.probability_progress_bars[i].set_fraction(float(tracked_probabilities[i]))
         else:
             self.probability_progress_bars[i].set_fraction(0.0)
+    self.update_pending_state()
     return True
 
+def update_pending_state(self):
+    """Show which text boxes are waiting for the prompt encoding worker."""
+    for i, progress_bar in enumerate(self.probability_progress_bars):
+        pending = self.prompt_encoder.is_pending(i)
+        progress_bar.set_show_text(pending)
+        if pending:
+            progress_bar.set_text("Encoding...")
+
+def on_prompts_encoded(self, indices):
+    """Called on the GTK thread after the prompt encoding worker published the entries of indices."""
+    self.update_pending_state()
+    stats = self.prompt_encoder.stats()
+    logger.debug("Prompt encoder: %s queued, last batch %.1f ms", stats["queue_depth"], (stats["last_latency"] or 0) * 1000)
+    return False  # Run once when scheduled with GLib.idle_add
+
 def disable_text_boxes(self):
     for text_box in self.text_boxes:
         text_box.set_editable(False)
+
+def enable_text_boxes(self):
+    for text_box in self.text_boxes:
+        text_box.set_editable(True)
+
+def on_model_ready(self):
+    """Called on the GTK main loop once the text embedding model is loaded in the background."""
+    logger.info("Using %s for text embedding", self.text_image_matcher.model_runtime)
+    self.enable_text_boxes()
+    # Queued updates may have changed the entries
+    self.update_text_boxes()
+    return False
+
+def on_embeddings_reloaded(self, success):
+    """Called on the GTK thread after the embeddings watcher reloaded the JSON file."""
+    if success:
+        # The watcher cancelled the queued text updates before publishing the file
+        self.update_pending_state()
+        self.update_text_boxes()
+        self.slider.set_value(self.text_image_matcher.threshold)
+        self.update_text_prefix(self.text_image_matcher.text_prefix)
+    return False  # Run once when scheduled with GLib.idle_add
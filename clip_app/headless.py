@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+from functools import partial
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.clip_pipeline import get_pipeline, add_pipeline_arguments
+from clip_app.text_image_matcher import text_image_matcher
+from clip_app.embeddings_watcher import EmbeddingsWatcher
+from clip_app.frame_stats import FrameStats
+from clip_app.embedding_log import configure_recording
+from clip_app.pipeline_metrics import PipelineMetrics
+from hailo_apps_infra.gstreamer_helper_pipelines import get_source_type
+
+"""
+Runs the CLIP pipeline without GTK, for machines without a display and for throughput measurements.
+The pipeline is the one built by get_pipeline() with the display branch replaced by a fakesink (or an appsink),
+driven by a plain GLib main loop. Prompts come from the --json-path embeddings file (optionally hot reloaded
+with --watch-embeddings) or from the text_image_matcher API.
+The app stops at EOS, after --max-frames frames, after --duration seconds or on Ctrl-C, and reports the
+throughput and the source to sink latency of the frames.
+Maximum throughput with a file source: python -m clip_app.headless --input demo --disable-sync
+"""
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+EOS_TIMEOUT = 5  # Seconds to wait for EOS to reach the sink before stopping the pipeline anyway
+
+
+def parse_arguments(args=None):
+    parser = argparse.ArgumentParser(description="Hailo CLIP app without a display")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--sink", type=str, choices=["fakesink", "appsink"], default="fakesink", help="Sink replacing the display.")
+    parser.add_argument("--max-frames", type=int, default=None, help="Stop after this many frames reached the sink.")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds.")
+    parser.add_argument("--summary-json", type=str, default=None, help="Write the throughput and latency summary to this JSON file.")
+    return parser.parse_args(args)
+
+
+class HeadlessClipApp:
+    # Same pipeline as the GUI app, get_pipeline swaps the display for HEADLESS_SINK_PIPELINE
+    get_pipeline = get_pipeline
+
+    def __init__(self, args, user_data=None, app_callback=None, on_sample=None):
+        """
+        app_callback(self, pad, info, user_data) is called on every buffer, like in the GUI app.
+        on_sample(sample) is called with every frame pulled from the appsink (--sink appsink).
+        """
+        self.options_menu = args
+        configure_recording(args)
+        self.headless = True
+        self.headless_sink = args.sink
+        self.current_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        os.environ["GST_DEBUG_DUMP_DOT_DIR"] = self.current_path
+
+        self.tappas_postprocess_dir = os.environ.get('TAPPAS_POST_PROC_DIR', '')
+        if self.tappas_postprocess_dir == '':
+            logger.error("TAPPAS_POST_PROC_DIR environment variable is not set. Please set it by sourcing setup_env.sh")
+            sys.exit(1)
+
+        self.dump_dot = args.dump_dot
+        self.video_source = args.input
+        self.source_type = get_source_type(self.video_source)
+        self.sync = "false" if (args.disable_sync or self.source_type != "file") else "true"
+        self.show_fps = False
+        self.json_file = os.path.join(self.current_path, "embeddings.json") if args.json_path is None else args.json_path
+        if args.input == "demo":
+            self.input = os.path.join(self.current_path, "resources", "clip_example.mp4")
+            self.json_file = os.path.join(self.current_path, "example_embeddings.json") if args.json_path is None else args.json_path
+        else:
+            self.input = args.input
+        self.detector = args.detector
+        self.user_data = user_data
+        self.app_callback = app_callback
+        self.on_sample = on_sample
+        self.max_frames = args.max_frames
+        self.duration = args.duration
+        self.summary_json = args.summary_json
+
+        self.text_image_matcher = text_image_matcher
+        self.text_image_matcher.set_threshold(args.detection_threshold)
+        self.load_embeddings(self.json_file)
+        self.embeddings_watcher = None
+        if args.watch_embeddings:
+            self.embeddings_watcher = EmbeddingsWatcher(self.text_image_matcher, self.json_file)
+
+        self.stats = FrameStats()
+        self.exit_status = 0
+        self.start_time = None
+        self._stopping = False
+
+        Gst.init(None)
+        self.pipeline = self.create_pipeline()
+        if self.input == "rpi":
+            from hailo_apps_infra.gstreamer_app import picamera_thread
+            picam_thread = threading.Thread(target=picamera_thread, args=(self.pipeline, 1280, 720, 'RGB'))
+            picam_thread.start()
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.on_message)
+        self.add_probes()
+        self.pipeline_metrics = PipelineMetrics(self.pipeline, args)
+        self.loop = GLib.MainLoop()
+
+    def load_embeddings(self, filename):
+        """Load the prompts and threshold from an embeddings file, can be called while running."""
+        logger.info("Loading embeddings from %s", filename)
+        self.text_image_matcher.load_embeddings(filename)
+        logger.info("Matching %s prompts: %s", len(self.text_image_matcher.get_embeddings()),
+                    [text for text in self.text_image_matcher.get_texts() if text])
+
+    def create_pipeline(self):
+        pipeline_str = self.get_pipeline()
+        logger.info('PIPELINE:\ngst-launch-1.0 %s', pipeline_str)
+        return Gst.parse_launch(pipeline_str)
+
+    def add_probes(self):
+        source_stamp = self.pipeline.get_by_name("headless_source_stamp")
+        source_stamp.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.on_source_buffer)
+        sink = self.pipeline.get_by_name("hailo_display")
+        sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self.on_sink_buffer)
+        if self.headless_sink == "appsink":
+            sink.connect("new-sample", self.on_new_sample)
+        if self.app_callback is not None:
+            identity = self.pipeline.get_by_name("identity_callback")
+            identity.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, partial(self.app_callback, self), self.user_data)
+
+    @staticmethod
+    def buffer_pts(info):
+        buffer = info.get_buffer()
+        if buffer is None or buffer.pts == Gst.CLOCK_TIME_NONE:
+            return None
+        return buffer.pts
+
+    def on_source_buffer(self, pad, info):
+        pts = self.buffer_pts(info)
+        if pts is not None:
+            self.stats.start(pts)
+        return Gst.PadProbeReturn.OK
+
+    def on_sink_buffer(self, pad, info):
+        frames = self.stats.finish(self.buffer_pts(info))
+        if self.max_frames is not None and frames == self.max_frames:
+            GLib.idle_add(self.stop)
+        return Gst.PadProbeReturn.OK
+
+    def on_new_sample(self, sink):
+        sample = sink.emit("pull-sample")
+        if sample is not None and self.on_sample is not None:
+            self.on_sample(sample)
+        return Gst.FlowReturn.OK
+
+    def on_message(self, bus, message):
+        t = message.type
+        if t == Gst.MessageType.EOS:
+            logger.info("EOS received, stopping the pipeline.")
+            self.quit()
+        elif t == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            logger.error("Error: %s %s", err, debug)
+            self.exit_status = 1
+            self.quit()
+        elif t == Gst.MessageType.QOS:
+            self.pipeline_metrics.on_qos(message.src.get_name())
+        return True
+
+    def stop(self, *args):
+        """Send EOS so the frames in flight are counted, the main loop quits when it reaches the sink."""
+        if not self._stopping:
+            self._stopping = True
+            logger.info("Sending EOS event to the pipeline...")
+            self.pipeline.send_event(Gst.Event.new_eos())
+            GLib.timeout_add_seconds(EOS_TIMEOUT, self.quit)
+        return False
+
+    def quit(self):
+        self.pipeline.set_state(Gst.State.NULL)
+        self.loop.quit()
+        return False
+
+    def dump_dot_file(self):
+        logger.info("Dumping dot file...")
+        Gst.debug_bin_to_dot_file(self.pipeline, Gst.DebugGraphDetails.ALL, "pipeline")
+        self.pipeline_metrics.dump(self.current_path)
+        return False
+
+    def summary(self):
+        summary = self.stats.summary()
+        summary.update({
+            "input": self.video_source,
+            "detector": self.detector,
+            "sync": self.sync == "true",
+            "sink": self.headless_sink,
+            "prompts": len(self.text_image_matcher.get_embeddings()),
+            "wall_time_s": time.monotonic() - self.start_time if self.start_time is not None else 0.0,
+            "exit_status": self.exit_status,
+        })
+        if self.pipeline_metrics.latency_tracer is not None:
+            summary["stage_latency"] = self.pipeline_metrics.latency_tracer.summary()
+        if self.pipeline_metrics.queue_monitor is not None:
+            summary["queues"] = self.pipeline_metrics.queue_monitor.report()
+        return summary
+
+    def run(self):
+        """Run until EOS or stop(), returns the summary."""
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGINT, self.stop)
+        if self.duration is not None:
+            GLib.timeout_add(int(self.duration * 1000), self.stop)
+        if self.dump_dot:
+            GLib.timeout_add_seconds(5, self.dump_dot_file)
+        if self.embeddings_watcher is not None:
+            self.embeddings_watcher.start()
+        self.pipeline_metrics.start()
+        self.start_time = time.monotonic()
+        self.pipeline.set_state(Gst.State.PLAYING)
+        self.loop.run()
+        self.pipeline_metrics.stop()
+        if self.embeddings_watcher is not None:
+            self.embeddings_watcher.stop()
+
+        summary = self.summary()
+        logger.info("Processed %s frames in %.2f s: %.1f FPS", summary["frames"], summary["elapsed_s"], summary["fps"])
+        if summary["latency_frames"]:
+            logger.info("Latency ms: mean %.1f, p50 %.1f, p95 %.1f, p99 %.1f, max %.1f",
+                        summary["latency_mean_ms"], summary["latency_p50_ms"], summary["latency_p95_ms"],
+                        summary["latency_p99_ms"], summary["latency_max_ms"])
+        if self.summary_json is not None:
+            with open(self.summary_json, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            logger.info("Summary saved to %s", self.summary_json)
+        return summary
+
+
+def main():
+    app = HeadlessClipApp(parse_arguments())
+    app.run()
+    sys.exit(app.exit_status)
+
+
+if __name__ == "__main__":
+    main()
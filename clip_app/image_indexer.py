@@ -0,0 +1,175 @@
+import os
+import glob
+import json
+import time
+import logging
+import multiprocessing
+from collections import deque
+import numpy as np
+
+from clip_app.logger_setup import setup_logger, set_log_level
+
+"""
+Embeds directories of images with the CLIP image encoder, for reference sets and test fixtures.
+Images are decoded and preprocessed by a pool of worker processes, a bounded number of batches ahead of the encoder.
+The workers reproduce the CLIP preprocessing (resize, center crop, normalize) with PIL and numpy only, they do not
+import torch. The encoder runs on batches in the main process.
+
+The index is a directory:
+    embeddings.npy  (images x dim) float32, memory mappable with np.load(..., mmap_mode='r')
+    paths.json      the image paths, row i of embeddings.npy is the embedding of paths[i]
+    status.npy      uint8 per image: 0 pending, 1 embedded, 2 failed to decode
+    meta.json       model, dimension and input resolution
+Embeddings are flushed before their status, an interrupted run is resumed by running it again with the same output.
+"""
+
+logger = setup_logger()
+set_log_level(logger, logging.INFO)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+STATUS_PENDING = 0
+STATUS_DONE = 1
+STATUS_FAILED = 2
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_PREFETCH = 4  # Batches preprocessed ahead of the encoder
+PROGRESS_INTERVAL = 5.0  # Seconds between progress logs
+
+
+def list_images(patterns):
+    """Return the sorted image files of patterns: directories (searched recursively), glob patterns or files."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.update(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def preprocess_image(image, n_px):
+    """
+    CLIP preprocessing of a PIL image without torch: resize the short side to n_px (bicubic), center crop to
+    n_px x n_px, convert to RGB and normalize. Returns a (3 x n_px x n_px) float32 array.
+    """
+    from PIL import Image
+    width, height = image.size
+    if width <= height:
+        size = (n_px, int(n_px * height / width))
+    else:
+        size = (int(n_px * width / height), n_px)
+    if size != image.size:
+        image = image.resize(size, Image.BICUBIC)
+    left = int(round((size[0] - n_px) / 2.0))
+    top = int(round((size[1] - n_px) / 2.0))
+    image = image.crop((left, top, left + n_px, top + n_px))
+    pixels = np.asarray(image.convert("RGB"), dtype=np.float32) / 255
+    return ((pixels - CLIP_MEAN) / CLIP_STD).transpose(2, 0, 1)
+
+
+def _preprocess_batch(items, n_px):
+    """Worker task: decode and preprocess (index, path) items. Returns (indices, pixels, failed [(index, error)])."""
+    from PIL import Image
+    indices = []
+    pixels = []
+    failed = []
+    for index, path in items:
+        try:
+            with Image.open(path) as image:
+                pixels.append(preprocess_image(image, n_px))
+            indices.append(index)
+        except Exception as e:
+            failed.append((index, str(e)))
+    batch = np.stack(pixels) if pixels else np.zeros((0, 3, n_px, n_px), dtype=np.float32)
+    return indices, batch, failed
+
+
+def open_image_index(directory, paths=None, dim=None, metadata=None):
+    """
+    Open the index in directory for writing, creating it for paths and dim if it does not exist.
+    Returns (paths, embeddings, status), embeddings and status are writable memory maps.
+    Raises ValueError when resuming an index built from other images.
+    """
+    paths_file = os.path.join(directory, "paths.json")
+    if os.path.isfile(paths_file):
+        with open(paths_file, 'r', encoding='utf-8') as f:
+            stored_paths = json.load(f)
+        if paths is not None and stored_paths != paths:
+            raise ValueError(f"{directory} indexes other images, use another output directory")
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode='r+')
+        status = np.load(os.path.join(directory, "status.npy"), mmap_mode='r+')
+        return stored_paths, embeddings, status
+    if paths is None or dim is None:
+        raise ValueError(f"No image index in {directory}")
+    os.makedirs(directory, exist_ok=True)
+    embeddings = np.lib.format.open_memmap(os.path.join(directory, "embeddings.npy"), mode='w+',
+                                           dtype=np.float32, shape=(len(paths), dim))
+    status = np.lib.format.open_memmap(os.path.join(directory, "status.npy"), mode='w+',
+                                       dtype=np.uint8, shape=(len(paths),))
+    with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(dict(metadata or {}, dim=dim, images=len(paths)), f, indent=2)
+    # paths.json is written last, an index without it is recreated
+    with open(paths_file, 'w', encoding='utf-8') as f:
+        json.dump(paths, f)
+    return paths, embeddings, status
+
+
+def load_image_index(directory):
+    """Return (paths, embeddings, status) of an index, embeddings is a read-only memory map."""
+    with open(os.path.join(directory, "paths.json"), 'r', encoding='utf-8') as f:
+        paths = json.load(f)
+    embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode='r')
+    status = np.load(os.path.join(directory, "status.npy"))
+    return paths, embeddings, status
+
+
+def build_image_index(paths, directory, encode, n_px, dim, batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                      prefetch=DEFAULT_PREFETCH, metadata=None):
+    """
+    Embed the images of paths into the index in directory, skipping the ones already embedded.
+    encode(pixels) maps a (n x 3 x n_px x n_px) float32 batch to (n x dim) embeddings.
+    Returns a dict of statistics: images, skipped (embedded before), encoded, failed, elapsed_s and images_per_s.
+    """
+    paths, embeddings, status = open_image_index(directory, paths, dim, metadata)
+    pending = [(index, path) for index, path in enumerate(paths) if status[index] == STATUS_PENDING]
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    stats = {"images": len(paths), "skipped": len(paths) - len(pending), "encoded": 0, "failed": 0}
+    if stats["skipped"]:
+        logger.info("Resuming %s: %s of %s images already done", directory, stats["skipped"], len(paths))
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    last_log = start
+    # Spawned workers do not inherit the encoder's threads (torch)
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        in_flight = deque()
+        next_batch = 0
+        while next_batch < len(batches) or in_flight:
+            while next_batch < len(batches) and len(in_flight) < prefetch:
+                in_flight.append(pool.apply_async(_preprocess_batch, (batches[next_batch], n_px)))
+                next_batch += 1
+            indices, pixels, failed = in_flight.popleft().get()
+            if indices:
+                embeddings[indices] = encode(pixels)
+                embeddings.flush()
+                status[indices] = STATUS_DONE
+            for index, error in failed:
+                logger.warning("Skipping %s: %s", paths[index], error)
+                status[index] = STATUS_FAILED
+            status.flush()
+            stats["encoded"] += len(indices)
+            stats["failed"] += len(failed)
+            now = time.perf_counter()
+            if now - last_log >= PROGRESS_INTERVAL:
+                done = stats["encoded"] + stats["failed"]
+                rate = stats["encoded"] / (now - start)
+                logger.info("Embedded %s/%s images, %.1f images/s, %.0f s left", done, len(pending), rate,
+                            (len(pending) - done) / rate if rate > 0 else 0.0)
+                last_log = now
+    stats["elapsed_s"] = time.perf_counter() - start
+    stats["images_per_s"] = stats["encoded"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else 0.0
+    logger.info("Embedded %s images in %.1f s (%.1f images/s), %s failed, %s done before", stats["encoded"],
+                stats["elapsed_s"], stats["images_per_s"], stats["failed"], stats["skipped"])
+    return stats
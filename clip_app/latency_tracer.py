@@ -0,0 +1,247 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from clip_app.logger_setup import setup_logger
+
+"""
+Per stage latency tracing of the CLIP pipeline.
+A stage is a named sub-pipeline of clip_pipeline.get_pipeline(): the elements named after it (name or name_*).
+Its entry pads are the sink pads fed from outside the stage, its exit pads the src pads leaving it; links that leave
+the stage and come back (the cropper's branch through the inner pipeline) are internal. A stage without an entry
+(the source) is timed from its sink pads linked once playing (after decodebin), or else from its source element.
+Buffers are stamped at the entry pads and matched by PTS at the exit pads, the latencies go to streaming log scale
+histograms. The tracer adds pad probes only, the pipeline is not changed, and does nothing unless attached.
+"""
+
+logger = setup_logger()
+
+DEFAULT_STAGES = ("source", "detection_inference", "clip_cropper", "clip_inference", "pyproc", "identity_callback")
+DEFAULT_REPORT_INTERVAL = 10.0  # Seconds between log summaries
+MAX_IN_FLIGHT = 1024  # Buffers stamped at a stage entry and not seen at its exit yet, older ones are dropped
+
+HISTOGRAM_MIN_MS = 0.001
+HISTOGRAM_MAX_MS = 100000.0
+HISTOGRAM_GROWTH = 1.05  # Bucket width ratio, percentiles are within 2.5% of the real value
+
+
+class LatencyHistogram:
+    """Streaming histogram with log scale buckets, for latency percentiles in constant memory."""
+
+    def __init__(self):
+        self._log_growth = math.log(HISTOGRAM_GROWTH)
+        self.buckets = [0] * (self._bucket(HISTOGRAM_MAX_MS) + 1)
+        self.reset()
+
+    def _bucket(self, value_ms):
+        if value_ms <= HISTOGRAM_MIN_MS:
+            return 0
+        return int(math.log(value_ms / HISTOGRAM_MIN_MS) / self._log_growth) + 1
+
+    def reset(self):
+        self.buckets = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value_ms):
+        self.buckets[min(self._bucket(value_ms), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def percentile(self, q):
+        """Return the q-th percentile (0 to 100), the geometric middle of its bucket clipped to the observed range."""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                break
+        if index == 0:
+            value = HISTOGRAM_MIN_MS
+        else:
+            value = HISTOGRAM_MIN_MS * HISTOGRAM_GROWTH ** (index - 0.5)
+        return min(max(value, self.min), self.max)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+        }
+
+
+def find_stage_boundaries(graph, stage):
+    """
+    Return (entry_pads, exit_pads) of a stage in graph, a dict of element name -> {"sink": [(pad, peer name)],
+    "src": [(pad, peer name)]} with the peer name None for unlinked pads. A stage without any other entry is entered
+    at its unlinked sink pads (dynamic links), or at the src pads of its elements without sink pads (sources).
+    Returns ([], []) if no element belongs to stage.
+    """
+    members = {name for name in graph if name == stage or name.startswith(stage + "_")}
+    if not members:
+        return [], []
+
+    def reaches_stage(start, direction):
+        # Follow the links from start (outside the stage) and tell whether they come back into the stage
+        seen = set()
+        pending = [start]
+        while pending:
+            name = pending.pop()
+            if name in members:
+                return True
+            if name in seen or name not in graph:
+                continue
+            seen.add(name)
+            pending.extend(peer for _, peer in graph[name][direction] if peer is not None)
+        return False
+
+    entries = []
+    exits = []
+    for name in sorted(members):
+        element = graph[name]
+        for pad, peer in element["sink"]:
+            if peer is not None and peer not in members and not reaches_stage(peer, "sink"):
+                entries.append(pad)
+        for pad, peer in element["src"]:
+            if peer is not None and peer not in members and not reaches_stage(peer, "src"):
+                exits.append(pad)
+    if not entries:
+        entries = [pad for name in sorted(members) for pad, peer in graph[name]["sink"] if peer is None]
+    if not entries:
+        entries = [pad for name in sorted(members) if not graph[name]["sink"] for pad, _ in graph[name]["src"]]
+    return entries, exits
+
+
+def pipeline_graph(pipeline):
+    """
+    Return the graph of the pipeline's top level elements, as find_stage_boundaries() expects it.
+    Every element also has its "element" and "factory" name.
+    """
+    from gi.repository import Gst
+    graph = {}
+    for element in pipeline.iterate_elements():
+        factory = element.get_factory()
+        pads = {"sink": [], "src": [], "element": element, "factory": factory.get_name() if factory is not None else None}
+        for pad in element.iterate_pads():
+            peer = pad.get_peer()
+            peer_element = peer.get_parent_element() if peer is not None else None
+            direction = "src" if pad.get_direction() == Gst.PadDirection.SRC else "sink"
+            pads[direction].append((pad, peer_element.get_name() if peer_element is not None else None))
+        graph[element.get_name()] = pads
+    return graph
+
+
+class StageLatency:
+    """Entry stamps and latency histograms of one stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.total = LatencyHistogram()  # Since the start
+        self.interval = LatencyHistogram()  # Since the last log summary
+        self.dropped = 0  # Entry stamps dropped without reaching the exit
+        self._entries = OrderedDict()  # pts -> entry time
+        self._lock = threading.Lock()
+
+    def enter(self, pts, now):
+        with self._lock:
+            if pts in self._entries:
+                return
+            self._entries[pts] = now
+            if len(self._entries) > MAX_IN_FLIGHT:
+                self._entries.popitem(last=False)
+                self.dropped += 1
+
+    def exit(self, pts, now):
+        with self._lock:
+            start = self._entries.pop(pts, None)
+            if start is None:
+                return
+            latency_ms = (now - start) * 1000
+            self.total.add(latency_ms)
+            self.interval.add(latency_ms)
+
+    def summary(self, interval=False):
+        with self._lock:
+            summary = (self.interval if interval else self.total).summary()
+            summary["in_flight"] = len(self._entries)
+            summary["dropped"] = self.dropped
+            if interval:
+                self.interval.reset()
+        return summary
+
+
+class LatencyTracer:
+    def __init__(self, stages=DEFAULT_STAGES, report_interval=DEFAULT_REPORT_INTERVAL, clock=time.monotonic):
+        self.stage_names = stages
+        self.report_interval = report_interval
+        self.clock = clock
+        self.stages = OrderedDict()  # Stages found in the attached pipeline
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def attach(self, pipeline):
+        """Add the pad probes timing the stages found in pipeline. Call before the pipeline starts."""
+        from gi.repository import Gst
+        graph = pipeline_graph(pipeline)
+
+        def probe(stage, enter):
+            def on_buffer(pad, info):
+                buffer = info.get_buffer()
+                if buffer is not None and buffer.pts != Gst.CLOCK_TIME_NONE:
+                    (stage.enter if enter else stage.exit)(buffer.pts, self.clock())
+                return Gst.PadProbeReturn.OK
+            return on_buffer
+
+        for name in self.stage_names:
+            entries, exits = find_stage_boundaries(graph, name)
+            if not entries or not exits:
+                logger.debug("Stage %s not found in the pipeline, not traced", name)
+                continue
+            stage = StageLatency(name)
+            for pad in entries:
+                pad.add_probe(Gst.PadProbeType.BUFFER, probe(stage, True))
+            for pad in exits:
+                pad.add_probe(Gst.PadProbeType.BUFFER, probe(stage, False))
+            self.stages[name] = stage
+        logger.info("Tracing the latency of stages: %s", ", ".join(self.stages))
+
+    def summary(self):
+        """Return a dict of stage name -> latency summary since the start."""
+        return {name: stage.summary() for name, stage in self.stages.items()}
+
+    def log_summary(self):
+        """Log the latency of every stage since the last log summary."""
+        for name, stage in self.stages.items():
+            summary = stage.summary(interval=True)
+            if summary["count"]:
+                logger.info("Latency %-20s %6d buffers, mean %.2f, p50 %.2f, p90 %.2f, p99 %.2f, max %.2f ms", name,
+                            summary["count"], summary["mean_ms"], summary["p50_ms"], summary["p90_ms"],
+                            summary["p99_ms"], summary["max_ms"])
+
+    def start(self):
+        """Start logging summaries every report_interval seconds on a daemon thread."""
+        if self._thread is not None or not self.report_interval:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._report, name="LatencyTracer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _report(self):
+        while not self._stop_event.wait(self.report_interval):
+            self.log_summary()
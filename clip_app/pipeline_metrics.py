@@ -0,0 +1,152 @@
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from clip_app.logger_setup import setup_logger
+from clip_app.latency_tracer import LatencyTracer
+from clip_app.queue_monitor import QueueMonitor
+
+"""
+Pipeline metrics of the CLIP apps, opt in from the command line (see add_metrics_arguments).
+MetricsServer serves the metrics on a local HTTP endpoint: /metrics as text, one "name value" line per metric,
+and /metrics.json. Every metrics source is a callable returning a (nested) dict, called on each request.
+PipelineMetrics creates the latency tracer, queue monitor and server requested by the arguments, for the GUI app and
+the headless runner alike.
+"""
+
+logger = setup_logger()
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+QUEUE_DUMP_NAME = "pipeline_queues.json"  # Written next to the --dump-dot pipeline.dot
+
+
+def flatten_metrics(metrics, prefix=""):
+    """Return (name, value) pairs of the numeric leaves of a nested dict, names joined with dots."""
+    pairs = []
+    for key, value in metrics.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            pairs.extend(flatten_metrics(value, name))
+        elif isinstance(value, (bool, int, float)):
+            pairs.append((name, float(value)))
+    return pairs
+
+
+def render_text(metrics):
+    return "".join(f"{name} {value:.6g}\n" for name, value in flatten_metrics(metrics))
+
+
+class MetricsServer:
+    def __init__(self, port, host=DEFAULT_METRICS_HOST):
+        self.host = host
+        self.port = port
+        self.sources = {}  # name -> callable returning a dict
+        self._server = None
+        self._thread = None
+
+    def add_source(self, name, collect):
+        self.sources[name] = collect
+
+    def collect(self):
+        return {name: collect() for name, collect in self.sources.items()}
+
+    def start(self):
+        """Serve on a daemon thread. port 0 picks a free port, self.port is updated."""
+        if self._server is not None:
+            return
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics.json":
+                    body = json.dumps(server.collect(), indent=2).encode("utf-8")
+                    content_type = "application/json"
+                elif path in ("/", "/metrics"):
+                    body = render_text(server.collect()).encode("utf-8")
+                    content_type = "text/plain; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics request: " + format, *args)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        logger.info("Serving pipeline metrics on http://%s:%s/metrics", self.host, self.port)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--trace-latency", action="store_true", help="Measure the latency of every pipeline stage.")
+    parser.add_argument("--trace-interval", type=float, default=10.0, help="Seconds between latency and queue log summaries, 0 disables them.")
+    parser.add_argument("--monitor-queues", action="store_true", help="Sample the pipeline queue levels and report the bottleneck element.")
+    parser.add_argument("--monitor-interval", type=float, default=0.1, help="Seconds between queue level samples.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve the pipeline metrics on this local HTTP port.")
+    return parser
+
+
+class PipelineMetrics:
+    """The latency tracer, queue monitor and metrics server requested by the arguments, attached to a pipeline."""
+
+    def __init__(self, pipeline, args):
+        self.latency_tracer = None
+        self.queue_monitor = None
+        self.server = None
+        self.report_interval = getattr(args, "trace_interval", None)
+        if getattr(args, "trace_latency", False):
+            self.latency_tracer = LatencyTracer(report_interval=args.trace_interval)
+            self.latency_tracer.attach(pipeline)
+        if getattr(args, "monitor_queues", False):
+            self.queue_monitor = QueueMonitor(sample_interval=args.monitor_interval)
+            self.queue_monitor.attach(pipeline)
+        if getattr(args, "metrics_port", None) is not None:
+            self.server = MetricsServer(args.metrics_port)
+            if self.latency_tracer is not None:
+                self.server.add_source("latency", self.latency_tracer.summary)
+            if self.queue_monitor is not None:
+                self.server.add_source("queues", self.queue_monitor.report)
+
+    def on_qos(self, element_name):
+        """Forward a QOS message from the bus to the queue monitor."""
+        if self.queue_monitor is not None:
+            self.queue_monitor.on_qos(element_name)
+
+    def dump(self, directory):
+        """Write the queue levels ring buffer to directory, next to the dot file."""
+        if self.queue_monitor is not None:
+            self.queue_monitor.dump(os.path.join(directory, QUEUE_DUMP_NAME))
+
+    def start(self):
+        if self.latency_tracer is not None:
+            self.latency_tracer.start()
+        if self.queue_monitor is not None:
+            self.queue_monitor.start(self.report_interval)
+        if self.server is not None:
+            self.server.start()
+
+    def stop(self):
+        if self.latency_tracer is not None:
+            self.latency_tracer.stop()
+            self.latency_tracer.log_summary()
+        if self.queue_monitor is not None:
+            self.queue_monitor.stop()
+            self.queue_monitor.log_report()
+        if self.server is not None:
+            self.server.stop()
@@ -0,0 +1,50 @@
+import time
+import numpy as np
+
+"""
+Per entry probabilities written by TextImageMatcher.match() and sampled by the GUI, without locks.
+The buffer is a sequence lock: the writer makes the sequence odd while it writes and even again when done,
+a reader copies the arrays and retries if the sequence was odd or changed meanwhile.
+Readers always get the probabilities of a single frame and never block the writer.
+There must be a single writer at a time, the thread running match().
+"""
+
+
+class ProbabilityBuffer:
+    def __init__(self, size):
+        self._sequence = 0
+        self._probabilities = np.zeros(size, dtype=np.float32)
+        self._tracked_probabilities = np.zeros(size, dtype=np.float32)
+
+    def __len__(self):
+        return len(self._probabilities)
+
+    def write(self, indices, probabilities, tracked_probabilities=None):
+        """Write the probabilities of indices, tracked_probabilities are left unchanged if None."""
+        self._sequence += 1
+        try:
+            self._probabilities[indices] = probabilities
+            if tracked_probabilities is not None:
+                self._tracked_probabilities[indices] = tracked_probabilities
+        finally:
+            # Even again if the assignment raised, readers would spin forever on an odd sequence
+            self._sequence += 1
+
+    def write_tracked(self, tracked_probabilities):
+        """Replace all the tracked probabilities."""
+        self._sequence += 1
+        try:
+            self._tracked_probabilities[:] = tracked_probabilities
+        finally:
+            self._sequence += 1
+
+    def sample(self):
+        """Return copies of (probabilities, tracked_probabilities) written by the same frame."""
+        while True:
+            sequence = self._sequence
+            if sequence % 2 == 0:
+                probabilities = self._probabilities.copy()
+                tracked_probabilities = self._tracked_probabilities.copy()
+                if self._sequence == sequence:
+                    return probabilities, tracked_probabilities
+            time.sleep(0)  # Let the writer finish
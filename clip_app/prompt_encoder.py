@@ -0,0 +1,171 @@
+import time
+import threading
+from collections import OrderedDict
+
+from clip_app.logger_setup import setup_logger
+from clip_app.text_image_matcher import TextEmbeddingEntry
+
+"""
+Background worker encoding the GUI text prompts, so the GTK main loop never waits for the text encoder.
+Requests are queued per entry index and coalesced: a newer request for an index replaces the pending one,
+and the result of a request superseded while it was being encoded is dropped.
+All the pending requests are encoded with a single TextImageMatcher.embed_texts() call and published
+together as one prompt snapshot.
+While the model is loading in the background requests wait in the queue, so only the last text of each
+index is encoded once it is ready.
+"""
+
+logger = setup_logger()
+
+MODEL_WAIT_INTERVAL = 0.1  # Seconds between checks while the model is loading
+
+
+class EncodingRequest:
+    def __init__(self, index, text, negative, ensemble):
+        self.index = index
+        self.text = text
+        self.negative = negative
+        self.ensemble = ensemble
+
+
+class PromptEncodingWorker:
+    def __init__(self, matcher, on_applied=None, batch_size=64):
+        """
+        Encode text prompts for matcher on a background thread.
+        on_applied(indices) is called from the worker thread after the entries of indices were published.
+        """
+        self.matcher = matcher
+        self.on_applied = on_applied
+        self.batch_size = batch_size
+        self.submitted = 0
+        self.coalesced = 0  # Requests replaced by a newer one before their result was applied
+        self.batches = 0
+        self.encoded = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+        self.last_latency = None  # Seconds to encode and publish the last batch
+        self.total_latency = 0.0
+        self._pending = OrderedDict()  # index -> EncodingRequest waiting to be encoded
+        self._in_flight = {}  # index -> EncodingRequest being encoded
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Start the worker on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="PromptEncodingWorker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, index, text, negative=False, ensemble=False):
+        """Queue an update of entry index, replacing any pending update of the same index."""
+        with self._condition:
+            if index in self._pending or index in self._in_flight:
+                self.coalesced += 1
+            self._pending[index] = EncodingRequest(index, text, negative, ensemble)
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+            self._condition.notify_all()
+
+    def cancel(self):
+        """Drop the pending requests and the results being encoded, call before replacing all the entries."""
+        with self._condition:
+            self._pending.clear()
+            self._in_flight = {}
+            self._condition.notify_all()
+
+    def is_pending(self, index):
+        """Return True if an update of entry index is queued or being encoded."""
+        with self._condition:
+            return index in self._pending or index in self._in_flight
+
+    def pending_request(self, index):
+        """Return the latest EncodingRequest of index that was not applied yet, or None."""
+        with self._condition:
+            return self._pending.get(index) or self._in_flight.get(index)
+
+    def wait_idle(self, timeout=None):
+        """Wait until every submitted request was applied or dropped. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and (not self._pending or self.matcher.is_model_loading()):
+                    self._condition.wait(MODEL_WAIT_INTERVAL if self._pending else None)
+                if self._stopping:
+                    return
+                batch, self._pending = self._pending, OrderedDict()
+                self._in_flight = dict(batch)
+            self._encode(batch)
+
+    def _encode(self, batch):
+        start_time = time.perf_counter()
+        requests = list(batch.values())
+        embeddings = {}
+        error = None
+        if self.matcher.model_runtime is None:
+            error = "no model is loaded"
+        else:
+            texts = [request for request in requests if request.text != ""]
+            try:
+                # Empty entries are never matched, they need no embedding
+                results = self.matcher.embed_texts([request.text for request in texts],
+                                                   [request.ensemble for request in texts], self.batch_size)
+                embeddings = {request.index: embedding for request, embedding in zip(texts, results)}
+            except Exception as e:
+                error = str(e)
+
+        with self._condition:
+            # Requests cancelled or superseded while they were encoded are not applied
+            current = [request for request in requests
+                       if self._in_flight.get(request.index) is request and request.index not in self._pending]
+            self._in_flight = {}
+            if error is not None:
+                self.failures += len(current)
+                logger.error("Failed to encode %s text updates: %s", len(current), error)
+                self._condition.notify_all()
+                return
+            new_entries = {request.index: TextEmbeddingEntry(request.text, embeddings.get(request.index),
+                                                             request.negative, request.ensemble)
+                           for request in current}
+            if new_entries:
+                # Published while holding the condition, so cancel() can not run between the check and the update
+                self.matcher.set_text_entries(new_entries)
+            self.batches += 1
+            self.encoded += len(embeddings)
+            latency = time.perf_counter() - start_time
+            self.last_latency = latency
+            self.total_latency += latency
+            queue_depth = len(self._pending)
+            self._condition.notify_all()
+        logger.info("Encoded %s prompts in %.1f ms (%s applied, %s still queued)",
+                    len(embeddings), latency * 1000, len(new_entries), queue_depth)
+        if self.on_applied is not None and new_entries:
+            self.on_applied(sorted(new_entries))
+
+    def stats(self):
+        with self._condition:
+            return {
+                "queue_depth": len(self._pending),
+                "in_flight": len(self._in_flight),
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "encoded": self.encoded,
+                "failures": self.failures,
+                "last_latency": self.last_latency,
+                "mean_latency": self.total_latency / self.batches if self.batches else None,
+            }
@@ -0,0 +1,103 @@
+import numpy as np
+
+from clip_app.logger_setup import setup_logger
+
+"""
+Inverted file (IVF) index used by TextImageMatcher for large prompt vocabularies.
+The prompts are clustered with spherical k-means; a query is scored against the cluster centroids,
+only the prompts of the n_probe best clusters are scored exactly, and the top_k of those are returned.
+Recall and speed are traded with n_probe (clusters scanned) and top_k (candidates returned).
+"""
+
+logger = setup_logger()
+
+ASSIGN_CHUNK_ROWS = 16384  # Rows scored against the centroids at once, bounds memory while building
+TRAIN_POINTS_PER_LIST = 64  # k-means is trained on a sample of this many points per list
+
+
+class PromptIndex:
+    def __init__(self, matrix, ids=None, n_lists=None, n_iter=10, seed=0):
+        """
+        Build the index over the rows ids of matrix (a PromptMatrix with normalized rows), all rows by default.
+        search() returns these row ids. n_lists defaults to sqrt(len(ids)). The matrix is referenced, not copied.
+        """
+        self.matrix = matrix
+        ids = np.arange(len(matrix)) if ids is None else np.asarray(ids, dtype=np.intp)
+        num_prompts = len(ids)
+        if n_lists is None:
+            n_lists = int(np.sqrt(num_prompts))
+        n_lists = max(1, min(n_lists, num_prompts))
+        rng = np.random.default_rng(seed)
+
+        train_size = min(num_prompts, n_lists * TRAIN_POINTS_PER_LIST)
+        train = matrix.take(ids[np.sort(rng.choice(num_prompts, train_size, replace=False))])
+        centroids = train[rng.choice(train_size, n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            centroids = self._update_centroids(train, assign, centroids, rng)
+
+        assign = np.concatenate([np.argmax(matrix.take(ids[start:start + ASSIGN_CHUNK_ROWS]) @ centroids.T, axis=1)
+                                 for start in range(0, num_prompts, ASSIGN_CHUNK_ROWS)])
+        # Drop empty lists so every probed list returns candidates
+        counts = np.bincount(assign, minlength=n_lists)
+        non_empty = np.flatnonzero(counts)
+        remap = np.full(n_lists, -1)
+        remap[non_empty] = np.arange(len(non_empty))
+        assign = remap[assign]
+        self.centroids = np.ascontiguousarray(centroids[non_empty])
+        # Prompt ids sorted by list, list l holds ids[offsets[l]:offsets[l + 1]]
+        self.ids = ids[np.argsort(assign, kind='stable')]
+        self.offsets = np.concatenate(([0], np.cumsum(counts[non_empty])))
+        logger.debug("Built prompt index: %s prompts in %s lists", num_prompts, len(non_empty))
+
+    @staticmethod
+    def _update_centroids(train, assign, centroids, rng):
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=len(centroids))
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[non_empty])[:-1]))
+        new_centroids = centroids.copy()
+        new_centroids[non_empty] = np.add.reduceat(train[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        # Re-seed empty clusters with random training points
+        new_centroids[empty] = train[rng.choice(len(train), len(empty))]
+        new_centroids /= np.maximum(np.linalg.norm(new_centroids, axis=1, keepdims=True), 1e-12)
+        return new_centroids
+
+    @classmethod
+    def from_arrays(cls, matrix, centroids, ids, offsets):
+        """Return an index over matrix with the lists saved by to_arrays(), without clustering again."""
+        index = cls.__new__(cls)
+        index.matrix = matrix
+        index.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        index.ids = np.asarray(ids, dtype=np.intp)
+        index.offsets = np.asarray(offsets, dtype=np.intp)
+        return index
+
+    def to_arrays(self):
+        """Return (centroids, ids, offsets), the lists of the index, to save with the matrix."""
+        return self.centroids, self.ids, self.offsets
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def search(self, queries, n_probe=8, top_k=32):
+        """
+        Return a (rows x top_k) array of prompt ids with the highest dot product among the prompts
+        of the n_probe closest lists. Rows with fewer candidates are padded with -1.
+        """
+        n_probe = max(1, min(n_probe, self.n_lists))
+        centroid_scores = queries @ self.centroids.T
+        if n_probe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), (len(queries), self.n_lists))
+        candidates = np.full((len(queries), top_k), -1, dtype=np.intp)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            ids = np.concatenate([self.ids[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            if len(ids) > top_k:
+                scores = self.matrix.take(ids) @ query
+                ids = ids[np.argpartition(-scores, top_k - 1)[:top_k]]
+            candidates[row, :len(ids)] = ids
+        return candidates
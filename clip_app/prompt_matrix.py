@@ -0,0 +1,86 @@
+import numpy as np
+
+"""
+Prompt embedding matrix stored as float32, float16 or int8 with a float32 scale per row.
+Quantized matrices are scored in chunks: each chunk is converted to float32 and multiplied with the
+image embeddings, and int8 scores are multiplied by the row scales (dequantized) at the end.
+This keeps the full matrix at 1/2 (float16) or ~1/4 (int8) of its float32 size.
+
+For normalized embeddings, dot products differ from float32 by at most QUANTIZATION_TOLERANCE.
+"""
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+QUANTIZATION_TOLERANCE = {"float32": 1e-6, "float16": 1e-3, "int8": 5e-3}
+CHUNK_ROWS = 4096  # Rows converted to float32 at once while scoring a quantized matrix
+INT8_MAX = 127
+
+
+class PromptMatrix:
+    def __init__(self, data, scales=None):
+        """data is a (prompts x dim) float32, float16 or int8 array, scales the float32 row scales of int8 data."""
+        self.data = data
+        self.scales = scales
+        self.dtype = np.dtype(data.dtype).name
+        if self.dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported prompt matrix dtype {self.dtype}")
+        if self.dtype == "int8" and scales is None:
+            raise ValueError("int8 prompt matrix requires row scales")
+
+    @classmethod
+    def quantize(cls, matrix, dtype="float32"):
+        """Return a PromptMatrix holding matrix (prompts x dim, float) stored as dtype."""
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported storage dtype {dtype}, expected one of {STORAGE_DTYPES}")
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if dtype == "int8":
+            scales = np.abs(matrix).max(axis=1) / INT8_MAX if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            data = np.clip(np.rint(matrix / scales[:, np.newaxis]), -INT8_MAX, INT8_MAX).astype(np.int8)
+            return cls(data, scales)
+        return cls(np.ascontiguousarray(matrix, dtype=dtype))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @staticmethod
+    def _dequantize(data, scales):
+        dequantized = data.astype(np.float32)
+        if scales is not None:
+            dequantized *= scales[:, np.newaxis]
+        return dequantized
+
+    def row(self, index):
+        """Return row index as float32, a view for float32 storage."""
+        if self.dtype == "float32":
+            return self.data[index]
+        return self._dequantize(self.data[index:index + 1], None if self.scales is None else self.scales[index:index + 1])[0]
+
+    def take(self, ids):
+        """Return the rows ids as a float32 (len(ids) x dim) array."""
+        if self.dtype == "float32":
+            return self.data[ids]
+        return self._dequantize(self.data[ids], None if self.scales is None else self.scales[ids])
+
+    def slice(self, start, stop):
+        """Return a PromptMatrix view of rows start:stop."""
+        return PromptMatrix(self.data[start:stop], None if self.scales is None else self.scales[start:stop])
+
+    def dot(self, queries):
+        """Return the float32 (rows x prompts) dot products of queries (rows x dim) with every prompt."""
+        if self.dtype == "float32":
+            return queries @ self.data.T
+        result = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), CHUNK_ROWS):
+            chunk = self.data[start:start + CHUNK_ROWS].astype(np.float32)
+            np.matmul(queries, chunk.T, out=result[:, start:start + CHUNK_ROWS])
+        if self.scales is not None:
+            result *= self.scales
+        return result
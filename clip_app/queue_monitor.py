@@ -0,0 +1,224 @@
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+
+from clip_app.logger_setup import setup_logger
+from clip_app.latency_tracer import pipeline_graph
+
+"""
+Queue occupancy and backpressure monitor of the CLIP pipeline.
+Every queue's level is sampled at a fixed rate into a ring buffer, next to its overrun count (a full queue, a dropped
+buffer for a leaky queue) and the QOS messages posted by the pipeline elements.
+Over the last window of samples, the most downstream queue that stays full points at the element draining it as the
+one blocking the pipeline. When no queue is full, the first queue that stays empty down to the sink points at the
+element feeding it as the one starving the pipeline (the source, for a live camera, is expected).
+The ring buffer is dumped as JSON next to the --dump-dot graph.
+"""
+
+logger = setup_logger()
+
+DEFAULT_SAMPLE_INTERVAL = 0.1  # Seconds between samples
+DEFAULT_CAPACITY = 3000  # Samples kept in the ring buffer, 5 minutes at the default rate
+DEFAULT_WINDOW = 50  # Samples used for the bottleneck report
+FULL_FILL = 0.8  # Mean fill ratio of a queue considered full
+EMPTY_FILL = 0.1  # Mean fill ratio of a queue considered empty
+
+
+def element_depths(graph):
+    """Return element name -> length of the longest upstream path, to sort elements in pipeline order."""
+    depths = {}
+
+    def depth(name):
+        if name not in depths:
+            depths[name] = 0  # Guards against cycles
+            upstream = [peer for _, peer in graph[name]["sink"] if peer in graph]
+            depths[name] = 1 + max(depth(peer) for peer in upstream) if upstream else 0
+        return depths[name]
+    for name in graph:
+        depth(name)
+    return depths
+
+
+class QueueSeries:
+    """Ring buffer of queue level samples: a time and the level of every queue per sample."""
+
+    def __init__(self, num_queues, capacity=DEFAULT_CAPACITY):
+        self.times = np.zeros(capacity)
+        self.levels = np.zeros((capacity, num_queues), dtype=np.uint32)
+        self.count = 0  # Samples appended since the start
+
+    def append(self, timestamp, levels):
+        index = self.count % len(self.times)
+        self.times[index] = timestamp
+        self.levels[index] = levels
+        self.count += 1
+
+    def last(self, samples=None):
+        """Return (times, levels) of the last samples (all the kept ones by default), oldest first."""
+        kept = min(self.count, len(self.times))
+        samples = kept if samples is None else min(samples, kept)
+        order = (np.arange(self.count - samples, self.count)) % len(self.times)
+        return self.times[order], self.levels[order]
+
+
+def find_bottleneck(queues, fills):
+    """
+    queues lists (name, upstream element, downstream element) in pipeline order, fills their mean fill ratio.
+    Returns (kind, element, queue): "blocking" with the element draining the most downstream full queue,
+    "starving" with the element feeding the first queue that is empty like all the queues after it, or (None, None, None).
+    """
+    for (name, _, downstream), fill in reversed(list(zip(queues, fills))):
+        if fill >= FULL_FILL:
+            return "blocking", downstream, name
+    for index, (name, upstream, _) in enumerate(queues):
+        if all(fill <= EMPTY_FILL for fill in fills[index:]):
+            return "starving", upstream, name
+    return None, None, None
+
+
+class QueueMonitor:
+    def __init__(self, sample_interval=DEFAULT_SAMPLE_INTERVAL, capacity=DEFAULT_CAPACITY, window=DEFAULT_WINDOW,
+                 clock=time.monotonic):
+        self.sample_interval = sample_interval
+        self.capacity = capacity
+        self.window = window
+        self.clock = clock
+        self.queues = []  # (name, upstream element, downstream element), in pipeline order
+        self.elements = []  # The queue elements, read with get_property
+        self.max_levels = []  # max-size-buffers of every queue, 0 if unlimited
+        self.leaky = []  # True for leaky queues
+        self.overruns = []
+        self.qos = deque(maxlen=capacity)  # (time, element name) of the QOS messages
+        self.series = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def add_queue(self, name, element, upstream=None, downstream=None):
+        """Monitor a queue element. Queues are expected in pipeline order."""
+        index = len(self.queues)
+        self.queues.append((name, upstream, downstream))
+        self.elements.append(element)
+        self.max_levels.append(int(element.get_property("max-size-buffers")))
+        self.leaky.append(int(element.get_property("leaky")) != 0)
+        self.overruns.append(0)
+        element.connect("overrun", lambda queue: self._on_overrun(index))
+
+    def attach(self, pipeline):
+        """Monitor every queue at the top level of pipeline."""
+        graph = pipeline_graph(pipeline)
+        depths = element_depths(graph)
+        names = sorted((name for name, node in graph.items() if node["factory"] == "queue"),
+                       key=lambda name: (depths[name], name))
+        for name in names:
+            node = graph[name]
+            upstream = next((peer for _, peer in node["sink"] if peer is not None), None)
+            downstream = next((peer for _, peer in node["src"] if peer is not None), None)
+            self.add_queue(name, node["element"], upstream, downstream)
+        logger.info("Monitoring %s queues", len(self.queues))
+
+    def _on_overrun(self, index):
+        with self._lock:
+            self.overruns[index] += 1
+
+    def on_qos(self, element_name):
+        """Record a QOS message, called from the bus message handler."""
+        with self._lock:
+            self.qos.append((self.clock(), element_name))
+
+    def sample(self):
+        levels = [element.get_property("current-level-buffers") for element in self.elements]
+        with self._lock:
+            if self.series is None:
+                self.series = QueueSeries(len(self.queues), self.capacity)
+            self.series.append(self.clock(), levels)
+
+    def _fills(self, levels):
+        # Queues without a buffer limit are full at the largest limit of the pipeline
+        limits = np.array([limit or max(self.max_levels + [1]) for limit in self.max_levels], dtype=np.float64)
+        return levels.mean(axis=0) / limits, levels.max(axis=0) / limits
+
+    def report(self):
+        """Return the queue fills, overruns and QOS messages of the last window, and the bottleneck they point at."""
+        with self._lock:
+            if self.series is None or self.series.count == 0:
+                return {"samples": 0, "queues": {}, "qos": {}, "bottleneck": None}
+            times, levels = self.series.last(self.window)
+            overruns = list(self.overruns)
+            qos = {}
+            for timestamp, element_name in self.qos:
+                if timestamp >= times[0]:
+                    qos[element_name] = qos.get(element_name, 0) + 1
+        mean_fills, max_fills = self._fills(levels)
+        kind, element, queue = find_bottleneck(self.queues, list(mean_fills))
+        bottleneck = None
+        if kind is not None:
+            bottleneck = {"kind": kind, "element": element, "queue": queue, "qos": qos.get(element, 0)}
+        return {
+            "samples": len(times),
+            "window_s": float(times[-1] - times[0]),
+            "queues": {name: {"mean_fill": float(mean_fill), "max_fill": float(max_fill), "overruns": overrun,
+                              "leaky": leaky}
+                       for (name, _, _), mean_fill, max_fill, overrun, leaky
+                       in zip(self.queues, mean_fills, max_fills, overruns, self.leaky)},
+            "qos": qos,
+            "bottleneck": bottleneck,
+        }
+
+    def log_report(self):
+        report = self.report()
+        bottleneck = report["bottleneck"]
+        if bottleneck is None:
+            return
+        qos = ", ".join(f"{name} ({count})" for name, count in report["qos"].items()) or "none"
+        if bottleneck["kind"] == "blocking":
+            logger.warning("Pipeline blocked by %s: %s is %.0f%% full. QOS messages from: %s", bottleneck["element"],
+                           bottleneck["queue"], report["queues"][bottleneck["queue"]]["mean_fill"] * 100, qos)
+        elif report["qos"]:
+            logger.warning("Pipeline starved by %s: queues from %s on are empty. QOS messages from: %s",
+                           bottleneck["element"], bottleneck["queue"], qos)
+
+    def dump(self, filename):
+        """Write the ring buffer (queue levels over time), the QOS messages and the report as JSON."""
+        with self._lock:
+            times, levels = self.series.last() if self.series is not None else (np.zeros(0), np.zeros((0, 0)))
+            qos = list(self.qos)
+            document = {
+                "queues": [name for name, _, _ in self.queues],
+                "upstream": [upstream for _, upstream, _ in self.queues],
+                "downstream": [downstream for _, _, downstream in self.queues],
+                "max_size_buffers": list(self.max_levels),
+                "leaky": list(self.leaky),
+                "overruns": list(self.overruns),
+                "times": times.tolist(),
+                "levels": levels.tolist(),
+                "qos": qos,
+            }
+        document["report"] = self.report()
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(document, f)
+        logger.info("Queue levels saved to %s", filename)
+
+    def start(self, report_interval=None):
+        """Sample on a daemon thread, and log the bottleneck every report_interval seconds if set."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(report_interval,), name="QueueMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, report_interval):
+        next_report = self.clock() + report_interval if report_interval else None
+        while not self._stop_event.wait(self.sample_interval):
+            self.sample()
+            if next_report is not None and self.clock() >= next_report:
+                self.log_report()
+                next_report += report_interval
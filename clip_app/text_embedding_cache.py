@@ -0,0 +1,143 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+from clip_app.logger_setup import setup_logger
+from clip_app.embedding_store import FILE_MODE
+
+"""
+Persistent, content addressed cache of text embeddings.
+Every embedding is stored in its own .npy file named by the hash of the model name and
+the final prompt strings (the templated strings for ensemble prompts).
+Files are written to a temporary file and renamed, so several app instances can share a cache directory.
+Reading a file refreshes its modification time, which is used for LRU eviction when the
+directory grows above max_bytes.
+"""
+
+logger = setup_logger()
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                 "hailo_clip", "text_embeddings")
+DEFAULT_MAX_BYTES = 64 * 2**20
+CACHE_EXTENSION = ".npy"
+
+
+class TextEmbeddingCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._approx_size = None  # Computed lazily, other instances may write to the same directory
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model_name, text_entries):
+        """Return the cache key of the prompt strings encoded by model_name."""
+        payload = json.dumps([model_name, list(text_entries)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_EXTENSION)
+
+    def get(self, model_name, text_entries):
+        """Return the cached embedding for the prompt strings, or None on a miss."""
+        path = self._path(self.make_key(model_name, text_entries))
+        try:
+            embedding = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            # Missing, being evicted by another instance or corrupted
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return embedding
+
+    def put(self, model_name, text_entries, embedding):
+        """Store an embedding for the prompt strings."""
+        path = self._path(self.make_key(model_name, text_entries))
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp_", suffix=CACHE_EXTENSION)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(embedding, dtype=np.float32), allow_pickle=False)
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write text embedding cache file %s: %s", path, e)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = self._scan_size()
+            else:
+                self._approx_size += os.path.getsize(path)
+            over_budget = self._approx_size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _list_files(self):
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for dir_entry in it:
+                if dir_entry.name.endswith(CACHE_EXTENSION) and not dir_entry.name.startswith(".tmp_"):
+                    try:
+                        stat = dir_entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, dir_entry.path))
+        return files
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._list_files())
+
+    def evict(self):
+        """Delete the least recently used files until the cache fits in max_bytes."""
+        files = sorted(self._list_files())
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass  # Already evicted by another instance
+            total -= size
+        with self._lock:
+            self._approx_size = total
+            self.evictions += evicted
+        if evicted:
+            logger.debug("Evicted %s text embeddings from %s", evicted, self.cache_dir)
+
+    def clear(self):
+        """Delete all cached embeddings."""
+        for _, _, path in self._list_files():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._approx_size = 0
+
+    def stats(self):
+        """Return the hit / miss counters of this instance."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -4,10 +4,21 @@ import os
 import logging
 import sys
 import argparse
+import threading
 import numpy as np
-from PIL import Image
 
 from clip_app.logger_setup import setup_logger, set_log_level
+from clip_app.embedding_store import (
+    BINARY_EXTENSION,
+    is_binary_embeddings_file,
+    read_binary_embeddings,
+    write_binary_embeddings
+)
+from clip_app.prompt_matrix import PromptMatrix, STORAGE_DTYPES
+from clip_app.text_embedding_cache import TextEmbeddingCache, DEFAULT_CACHE_DIR
+from clip_app.prompt_index import PromptIndex
+from clip_app.embedding_profiles import EmbeddingProfile, ProfileSet
+from clip_app.probability_buffer import ProbabilityBuffer
 
 """
 This class is used to store the text embeddings and match them to image embeddings
@@ -23,18 +34,34 @@ logger = setup_logger()
 set_log_level(logger, logging.INFO)
 
 # Set up global variables. Only required imports are done in the init functions
+# torch, clip and PIL are never imported on paths that do not encode text or images
 clip = None
 torch = None
 
 
 class TextEmbeddingEntry:
-    def __init__(self, text="", embedding=None, negative=False, ensemble=False):
+    def __init__(self, text="", embedding=None, negative=False, ensemble=False, store=None, row=-1):
         self.text = text
         self.embedding = embedding if embedding is not None else np.array([])
         self.negative = negative
         self.ensemble = ensemble
-        self.probability = 0.0
-        self.tracked_probability = 0.0
+        # Entries loaded from a binary embeddings file reference their row of the file's PromptMatrix
+        self.store = store
+        self.row = row
+
+    def copy(self):
+        return TextEmbeddingEntry(self.text, self._embedding, self.negative, self.ensemble, self.store, self.row)
+
+    @property
+    def embedding(self):
+        if self.store is not None:
+            return self.store.row(self.row)
+        return self._embedding
+
+    @embedding.setter
+    def embedding(self, embedding):
+        self._embedding = embedding
+        self.store = None
 
     def to_dict(self):
         return {
@@ -65,6 +92,26 @@ class Match:
         }
 
 
+class PromptSnapshot:
+    """
+    State used by match(): the entries, the prompt matrix of the valid ones, their masks and the optional prompt index.
+    A snapshot is never modified once published, match() reads the current one with a single reference read.
+    Writers never modify published entries, they publish a new snapshot of an edited copy (read-copy-update).
+    """
+    def __init__(self, version, entries, prompt_matrix, valid_entries, negative_mask):
+        self.version = version
+        self.entries = entries
+        self.prompt_matrix = prompt_matrix
+        self.valid_entries = valid_entries
+        self.valid_texts = [entries[i].text for i in valid_entries]
+        self.negative_mask = negative_mask
+        self.positive_positions = np.flatnonzero(~negative_mask)  # Positions in the valid entries
+        self.negative_positions = np.flatnonzero(negative_mask)
+        self.prompt_index = None
+        # Probabilities of the last match() per entry, indexed like entries
+        self.stats = ProbabilityBuffer(len(entries))
+
+
 class TextImageMatcher:
     _instance = None
 
@@ -83,6 +130,22 @@ class TextImageMatcher:
         self.device = "cpu"
 
         self.max_entries = max_entries
+        # The PromptSnapshot used by match() is rebuilt only when self.version changes
+        self.version = 0
+        self._snapshot = PromptSnapshot(-1, [], PromptMatrix(np.zeros((0, 0), dtype=np.float32)),
+                                        np.zeros(0, dtype=np.intp), np.zeros(0, dtype=bool))
+        self._snapshot_lock = threading.Lock()  # Serializes writers and snapshot builds, match() takes it only to rebuild
+        self.storage_dtype = "float32"  # Prompt matrix storage, see set_storage_dtype
+        # Optional IVF index for large prompt vocabularies, see set_index_mode
+        self.use_index = False
+        self.index_n_lists = None
+        self.index_n_probe = 8
+        self.index_top_k = 32
+        self.index_min_prompts = 1024
+        # Named profiles scored together by match_profiles, see add_profile
+        self.profiles = {}
+        self._profile_sets = {}  # Tuple of names -> ProfileSet, built once per set of active profiles
+        self._active_profile_set = None
         self.entries = [TextEmbeddingEntry() for _ in range(max_entries)]
         self.user_data = None  # user data can be used to store additional information
         self.text_prefix = "A photo of a "
@@ -94,6 +157,211 @@ class TextImageMatcher:
             'a photo of a small {}.',
         ]
         self.track_id_focus = None  # Used to focus on specific track id when showing confidence
+        self.embedding_cache_dir = DEFAULT_CACHE_DIR  # Set to None before init_clip to disable the on disk cache
+        self.embedding_cache = None  # embedding_cache is initialized in init_clip
+        # Background model loading, see init_clip_async
+        self._loader_thread = None
+        self._loading = False
+        self._pending_lock = threading.Lock()
+        self._pending_calls = []  # add_text / add_texts calls made while the model is loading
+
+    @property
+    def entries(self):
+        return self._entries
+
+    @entries.setter
+    def entries(self, new_entries):
+        self._entries = new_entries
+        self.invalidate_cache()
+
+    @property
+    def probabilities(self):
+        """Copy of the probabilities of the last match() per entry, indexed like the entries of the current snapshot."""
+        return self._snapshot.stats.sample()[0]
+
+    @property
+    def tracked_probabilities(self):
+        """Copy of the tracked probabilities, see probabilities."""
+        return self._snapshot.stats.sample()[1]
+
+    def set_tracked_probabilities(self, tracked_probabilities):
+        """Replace the tracked probabilities of the current snapshot, ignored if the entries changed meanwhile."""
+        stats = self._snapshot.stats
+        if len(stats) == len(tracked_probabilities):
+            stats.write_tracked(tracked_probabilities)
+
+    def get_snapshot(self):
+        """Return the current PromptSnapshot. Its entries and stats are consistent with each other."""
+        return self._refresh_cache()
+
+    def invalidate_cache(self):
+        """Mark the cached prompt matrix as stale. Call after modifying entries in place."""
+        self.version += 1
+
+    def _refresh_cache(self):
+        """Return the current PromptSnapshot, rebuilding it if the entries changed since it was built."""
+        snapshot = self._snapshot
+        if snapshot.version >= self.version:
+            return snapshot
+        with self._snapshot_lock:
+            # Another thread may have published a newer snapshot while we waited
+            snapshot = self._snapshot
+            version = self.version
+            if snapshot.version < version:
+                snapshot = self._build_snapshot(self._entries, version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def _build_snapshot(self, entries, version):
+        """Build the contiguous prompt matrix, masks and optional index of entries."""
+        valid_entries = [i for i, entry in enumerate(entries) if entry.text != ""]
+        if valid_entries:
+            stored = self._stored_prompt_matrix(entries, valid_entries)
+            if stored is not None:
+                # Entries loaded from a binary file are scored directly from the mapped file
+                prompt_matrix = stored
+            else:
+                matrix = np.ascontiguousarray([entries[i].embedding for i in valid_entries], dtype=np.float32)
+                prompt_matrix = PromptMatrix.quantize(matrix, self.storage_dtype)
+        else:
+            prompt_matrix = PromptMatrix(np.zeros((0, 0), dtype=np.float32))
+        snapshot = PromptSnapshot(version, entries, prompt_matrix, np.array(valid_entries, dtype=np.intp),
+                                  np.array([entries[i].negative for i in valid_entries], dtype=bool))
+        num_positives = len(snapshot.positive_positions)
+        if self.use_index and num_positives >= max(self.index_min_prompts, self.index_top_k + 1):
+            start_time = time.time()
+            snapshot.prompt_index = PromptIndex(prompt_matrix, ids=snapshot.positive_positions, n_lists=self.index_n_lists)
+            logger.info("Built prompt index over %s prompts with %s lists in %.2f seconds",
+                        num_positives, snapshot.prompt_index.n_lists, time.time() - start_time)
+        logger.debug("Rebuilt prompt matrix with %s entries (version %s)", len(valid_entries), version)
+        return snapshot
+
+    def publish_entries(self, entries, threshold=None, text_prefix=None, ensemble_template=None, storage_dtype=None):
+        """
+        Replace the entries (and optionally the settings loaded with them) as a single update.
+        The new snapshot is built on the calling thread, frames being matched meanwhile use the previous one.
+        """
+        with self._snapshot_lock:
+            if storage_dtype is not None:
+                self.storage_dtype = storage_dtype
+            if threshold is not None:
+                self.threshold = threshold
+            if text_prefix is not None:
+                self.text_prefix = text_prefix
+            if ensemble_template is not None:
+                self.ensemble_template = ensemble_template
+            self._publish(entries)
+
+    def _publish(self, entries):
+        # Called with _snapshot_lock held. The snapshot is published before the version,
+        # so match() never rebuilds it from the previous entries.
+        version = self.version + 1
+        self._snapshot = self._build_snapshot(entries, version)
+        self._entries = entries
+        self.version = version
+
+    def _edit_entries(self, edit):
+        """
+        Read-copy-update of the entries: edit(entries) modifies a copy of the current entries, which is
+        published as a new snapshot unless edit returns False. Published entries are never modified.
+        """
+        with self._snapshot_lock:
+            entries = list(self._entries)
+            if edit(entries) is False:
+                return
+            self._publish(entries)
+
+    def _stored_prompt_matrix(self, entries, valid_entries):
+        """Return a view of the store holding the valid entries if they are consecutive rows of one store of storage_dtype."""
+        first = entries[valid_entries[0]]
+        if first.store is None or first.store.dtype != self.storage_dtype:
+            return None
+        for offset, i in enumerate(valid_entries):
+            if entries[i].store is not first.store or entries[i].row != first.row + offset:
+                return None
+        return first.store.slice(first.row, first.row + len(valid_entries))
+
+    def set_storage_dtype(self, dtype):
+        """
+        Store the prompt matrix used by match() as float32, float16 or int8 (scaled per row).
+        Quantized dot products differ from float32 by at most prompt_matrix.QUANTIZATION_TOLERANCE.
+        Binary embeddings files are saved with this dtype, loading a binary file sets it to the file's dtype.
+        """
+        if dtype not in STORAGE_DTYPES:
+            logger.error("Unsupported storage dtype %s, expected one of %s", dtype, STORAGE_DTYPES)
+            return
+        self.storage_dtype = dtype
+        self.invalidate_cache()
+        if self._active_profile_set is not None:
+            self.set_active_profiles(self._active_profile_set.names)
+
+    def add_profile(self, name, filename=None, entries=None, threshold=None):
+        """
+        Register a named profile from an embeddings file, or from a list of TextEmbeddingEntry.
+        The profile keeps its own threshold: the given one, the file's, or the matcher threshold.
+        A profile with the same name is replaced. Returns False if the file could not be read.
+        """
+        if filename is not None:
+            try:
+                data, entries, _ = self.read_embeddings_file(filename)
+            except Exception as e:
+                logger.error("Error while loading profile %s from %s: %s", name, filename, e)
+                return False
+            if threshold is None:
+                threshold = data['threshold']
+        if threshold is None:
+            threshold = self.threshold
+        self.profiles[name] = EmbeddingProfile(name, entries or [], threshold)
+        self._reset_profile_sets()
+        return True
+
+    def remove_profile(self, name):
+        """Unregister a profile, it is also removed from the active profiles."""
+        if self.profiles.pop(name, None) is not None:
+            self._reset_profile_sets()
+
+    def _reset_profile_sets(self):
+        active = self.get_active_profiles()
+        self._profile_sets = {}
+        if active:
+            self.set_active_profiles([name for name in active if name in self.profiles])
+
+    def set_active_profiles(self, names):
+        """
+        Select the profiles scored by match_profiles. Every set of names is stacked once,
+        switching back to a set that was already active does not copy any data.
+        Returns False if a profile is not registered.
+        """
+        names = tuple(names)
+        missing = [name for name in names if name not in self.profiles]
+        if missing:
+            logger.error("Unknown profiles %s, registered profiles are %s", missing, list(self.profiles))
+            return False
+        profile_set = self._profile_sets.get(names)
+        if names and (profile_set is None or profile_set.storage_dtype != self.storage_dtype):
+            profile_set = ProfileSet([self.profiles[name] for name in names], self.storage_dtype)
+            self._profile_sets[names] = profile_set
+        self._active_profile_set = profile_set if names else None
+        return True
+
+    def get_active_profiles(self):
+        """Return the names of the active profiles."""
+        profile_set = self._active_profile_set
+        return profile_set.names if profile_set is not None else ()
+
+    def set_index_mode(self, enabled, n_lists=None, n_probe=8, top_k=32, min_prompts=1024):
+        """
+        Enable the approximate prompt index, used once there are at least min_prompts positive prompts.
+        Each image row is then scored exactly against its top_k candidates from the n_probe closest of
+        n_lists prompt clusters, plus all the negative prompts. The softmax is computed over these
+        candidates only. n_probe and top_k can also be changed later without rebuilding the index.
+        """
+        self.use_index = enabled
+        self.index_n_lists = n_lists
+        self.index_n_probe = n_probe
+        self.index_top_k = top_k
+        self.index_min_prompts = min_prompts
+        self.invalidate_cache()
 
     def init_clip(self):
         """Initialize the CLIP model."""
@@ -103,6 +371,64 @@ class TextImageMatcher:
         logger.info("Loading model %s on device %s, this might take a while...", self.model_name, self.device)
         self.model, self.preprocess = clip.load(self.model_name, device=self.device)
         self.model_runtime = "clip"
+        if self.embedding_cache_dir is not None:
+            self.embedding_cache = TextEmbeddingCache(self.embedding_cache_dir)
+
+    def init_clip_async(self, on_ready=None):
+        """
+        Load the CLIP model in a background thread and return immediately.
+        add_text / add_texts calls made while the model is loading are queued and encoded,
+        in order, once it is ready. on_ready is called from the loader thread after that.
+        """
+        with self._pending_lock:
+            if self._loading or self.model_runtime is not None:
+                logger.warning("Model is already loaded or loading")
+                return
+            self._loading = True
+        self._loader_thread = threading.Thread(target=self._load_model_worker, args=(on_ready,), daemon=True)
+        self._loader_thread.start()
+
+    def _load_model_worker(self, on_ready):
+        start_time = time.time()
+        try:
+            self.init_clip()
+        except Exception as e:
+            logger.error("Failed to load model %s: %s", self.model_name, e)
+            with self._pending_lock:
+                if self._pending_calls:
+                    logger.error("Dropping %s queued text updates", len(self._pending_calls))
+                self._pending_calls = []
+                self._loading = False
+            return
+        logger.info("Model %s loaded in %.2f seconds", self.model_name, time.time() - start_time)
+        # Drain the queue; new calls keep being queued until it is empty so their order is preserved
+        while True:
+            with self._pending_lock:
+                if not self._pending_calls:
+                    self._loading = False
+                    break
+                pending, self._pending_calls = self._pending_calls, []
+            logger.info("Encoding %s queued text updates", len(pending))
+            for func, args, kwargs in pending:
+                try:
+                    func(*args, **kwargs)
+                except Exception as e:
+                    logger.error("Failed to apply queued %s%s: %s", func.__name__.lstrip('_'), args, e)
+        if on_ready is not None:
+            on_ready()
+
+    def is_model_loading(self):
+        """Return True while init_clip_async is loading the model or encoding queued texts."""
+        return self._loading
+
+    def _queue_if_loading(self, func, *args, **kwargs):
+        """Queue the call if the model is loading in the background. Returns True if queued."""
+        with self._pending_lock:
+            if not self._loading:
+                return False
+            self._pending_calls.append((func, args, kwargs))
+        logger.info("Model is still loading, queued %s%s", func.__name__.lstrip('_'), args)
+        return True
 
     def set_threshold(self, new_threshold):
         self.threshold = new_threshold
@@ -114,44 +440,187 @@ class TextImageMatcher:
         self.ensemble_template = new_ensemble_template
 
     def update_text_entries(self, new_entry, index=None):
-        if index is None:
-            for i, entry in enumerate(self.entries):
-                if entry.text == "":
-                    self.entries[i] = new_entry
-                    return
-            if len(self.entries) == self.max_entries:
-                logger.info(f"Entry list has more then {self.max_entries} entries, The gui will not show the prompts.")
-            self.entries.append(new_entry)
-        elif 0 <= index < len(self.entries):
-            self.entries[index] = new_entry
-        else:
-            logger.error("Index out of bounds: %s", index)
+        def edit(entries):
+            if index is None:
+                for i, entry in enumerate(entries):
+                    if entry.text == "":
+                        entries[i] = new_entry
+                        return True
+                if len(entries) == self.max_entries:
+                    logger.info(f"Entry list has more then {self.max_entries} entries, The gui will not show the prompts.")
+                entries.append(new_entry)
+            elif 0 <= index < len(entries):
+                entries[index] = new_entry
+            else:
+                logger.error("Index out of bounds: %s", index)
+                return False
+            return True
+        self._edit_entries(edit)
+
+    def set_negative(self, index, negative):
+        """Set the negative flag of an existing entry."""
+        def edit(entries):
+            if not 0 <= index < len(entries):
+                logger.error("Index out of bounds: %s", index)
+                return False
+            if entries[index].negative == negative:
+                return False
+            entry = entries[index].copy()
+            entry.negative = negative
+            entries[index] = entry
+            return True
+        self._edit_entries(edit)
 
     def add_text(self, text, index=None, negative=False, ensemble=False):
+        if self._queue_if_loading(self._add_text, text, index, negative, ensemble):
+            return
+        self._add_text(text, index, negative, ensemble)
+
+    def _add_text(self, text, index=None, negative=False, ensemble=False):
         if self.model_runtime is None:
             logger.error("No model is loaded. Please call init_clip before calling add_text.")
             return
-        text_entries = [template.format(text) for template in self.ensemble_template] if ensemble else [self.text_prefix + text]
+        if text == "":
+            # Empty entries are never matched, no need to run the text encoder
+            self.update_text_entries(TextEmbeddingEntry(text, None, negative, ensemble), index)
+            return
+        text_entries = self.get_text_entries(text, ensemble)
         logger.debug("Adding text entries: %s", text_entries)
 
-        global clip, torch
-        text_tokens = clip.tokenize(text_entries).to(self.device)
-        with torch.no_grad():
-            text_features = self.model.encode_text(text_tokens)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            ensemble_embedding = torch.mean(text_features, dim=0).cpu().numpy().flatten()
+        ensemble_embedding = None
+        if self.embedding_cache is not None:
+            ensemble_embedding = self.embedding_cache.get(self.model_name, text_entries)
+        if ensemble_embedding is None:
+            ensemble_embedding = self.encode_text_entries(text_entries)
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(self.model_name, text_entries, ensemble_embedding)
+        else:
+            logger.debug("Using cached embedding for %s", text_entries)
         new_entry = TextEmbeddingEntry(text, ensemble_embedding, negative, ensemble)
         self.update_text_entries(new_entry, index)
 
+    def add_texts(self, texts, negative=False, ensemble=False, batch_size=64):
+        """
+        Add many texts at once.
+        negative and ensemble can be a single bool or a list with a flag per text.
+        Texts missing from the embeddings cache are tokenized and encoded together in chunks of
+        batch_size prompt strings, and all the new entries are inserted with a single cache invalidation.
+        """
+        if self._queue_if_loading(self._add_texts, texts, negative, ensemble, batch_size):
+            return
+        self._add_texts(texts, negative, ensemble, batch_size)
+
+    def _add_texts(self, texts, negative=False, ensemble=False, batch_size=64):
+        if self.model_runtime is None:
+            logger.error("No model is loaded. Please call init_clip before calling add_texts.")
+            return
+        negatives = list(negative) if isinstance(negative, (list, tuple)) else [negative] * len(texts)
+        ensembles = list(ensemble) if isinstance(ensemble, (list, tuple)) else [ensemble] * len(texts)
+        if len(negatives) != len(texts) or len(ensembles) != len(texts):
+            logger.error("Got %s texts but %s negative and %s ensemble flags", len(texts), len(negatives), len(ensembles))
+            return
+        # Empty entries are never matched, skip them
+        prompts = [(text, neg, ens) for text, neg, ens in zip(texts, negatives, ensembles) if text != ""]
+        embeddings = self.embed_texts([text for text, _, _ in prompts], [ens for _, _, ens in prompts], batch_size)
+        new_entries = [TextEmbeddingEntry(text, embedding, neg, ens)
+                       for (text, neg, ens), embedding in zip(prompts, embeddings)]
+        self.insert_text_entries(new_entries)
+
+    def embed_texts(self, texts, ensembles, batch_size=64):
+        """
+        Return the embedding of each (non empty) text, ensembles holds the ensemble flag of each text.
+        Texts missing from the embeddings cache are encoded together in a single encoder call.
+        """
+        text_entries_list = [self.get_text_entries(text, ens) for text, ens in zip(texts, ensembles)]
+        embeddings = [None] * len(texts)
+        if self.embedding_cache is not None:
+            embeddings = [self.embedding_cache.get(self.model_name, text_entries) for text_entries in text_entries_list]
+        to_encode = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if to_encode:
+            # The prompt strings of each text are contiguous, so the ensemble means are segment sums
+            strings = [string for i in to_encode for string in text_entries_list[i]]
+            counts = np.array([len(text_entries_list[i]) for i in to_encode])
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            features = self.encode_prompt_strings(strings, batch_size)
+            means = np.add.reduceat(features, starts, axis=0) / counts[:, np.newaxis]
+            for i, embedding in zip(to_encode, means):
+                embeddings[i] = embedding
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(self.model_name, text_entries_list[i], embedding)
+        logger.debug("embed_texts: %s texts, %s encoded, %s from cache", len(texts), len(to_encode), len(texts) - len(to_encode))
+        return embeddings
+
+    def insert_text_entries(self, new_entries):
+        """Fill empty entries with new_entries and append the rest, publishing a single snapshot."""
+        new_entries = list(new_entries)
+
+        def edit(entries):
+            empty_slots = [i for i, entry in enumerate(entries) if entry.text == ""]
+            for i, new_entry in zip(empty_slots, new_entries):
+                entries[i] = new_entry
+            remaining = new_entries[len(empty_slots):]
+            if remaining and len(entries) + len(remaining) > self.max_entries:
+                logger.info(f"Entry list has more then {self.max_entries} entries, The gui will not show the prompts.")
+            entries.extend(remaining)
+        self._edit_entries(edit)
+
+    def set_text_entries(self, new_entries):
+        """Replace entries by index, new_entries maps an index to its TextEmbeddingEntry. Publishes a single snapshot."""
+        def edit(entries):
+            for index, new_entry in new_entries.items():
+                if 0 <= index < len(entries):
+                    entries[index] = new_entry
+                else:
+                    logger.error("Index out of bounds: %s", index)
+        self._edit_entries(edit)
+
+    def get_text_entries(self, text, ensemble=False):
+        """Return the prompt strings encoded for text."""
+        return [template.format(text) for template in self.ensemble_template] if ensemble else [self.text_prefix + text]
+
+    def encode_prompt_strings(self, strings, batch_size=64):
+        """Run the text encoder on strings in chunks of batch_size. Returns a (len(strings) x dim) array of normalized embeddings."""
+        global clip, torch
+        chunks = []
+        num_chunks = (len(strings) + batch_size - 1) // batch_size
+        for chunk_idx in range(num_chunks):
+            chunk = strings[chunk_idx * batch_size:(chunk_idx + 1) * batch_size]
+            start_time = time.time()
+            text_tokens = clip.tokenize(chunk).to(self.device)
+            with torch.no_grad():
+                text_features = self.model.encode_text(text_tokens)
+                text_features /= text_features.norm(dim=-1, keepdim=True)
+            chunks.append(text_features.cpu().numpy())
+            logger.info("Encoded chunk %s/%s (%s prompts) in %.4f seconds", chunk_idx + 1, num_chunks, len(chunk), time.time() - start_time)
+        return np.concatenate(chunks, axis=0)
+
+    def encode_text_entries(self, text_entries):
+        """Run the text encoder on text_entries and return the mean of the normalized embeddings."""
+        return self.encode_prompt_strings(text_entries).mean(axis=0)
+
     def get_embeddings(self):
         """Return a list of indexes to self.entries if entry.text != ""."""
         return [i for i, entry in enumerate(self.entries) if entry.text != ""]
 
+    def get_probability(self, index):
+        """Return the probability of an entry from the last match() call."""
+        probabilities = self.probabilities
+        return float(probabilities[index]) if index < len(probabilities) else 0.0
+
+    def get_tracked_probability(self, index):
+        """Return the tracked probability of an entry from the last match() call."""
+        tracked_probabilities = self.tracked_probabilities
+        return float(tracked_probabilities[index]) if index < len(tracked_probabilities) else 0.0
+
     def get_texts(self):
         """Return all entries' text (not only valid ones)."""
         return [entry.text for entry in self.entries]
 
     def save_embeddings(self, filename):
+        """Save the embeddings to filename, in the binary format if it ends with BINARY_EXTENSION, otherwise as JSON."""
+        if filename.endswith(BINARY_EXTENSION):
+            self._save_binary_embeddings(filename)
+            return
         data_to_save = {
             "threshold": self.threshold,
             "text_prefix": self.text_prefix,
@@ -161,25 +630,68 @@ class TextImageMatcher:
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(data_to_save, f)
 
+    def _save_binary_embeddings(self, filename):
+        metadata_entries = []
+        rows = []
+        for entry in self.entries:
+            row = -1
+            embedding = entry.embedding
+            if embedding.size > 0:
+                row = len(rows)
+                rows.append(embedding)
+            metadata_entries.append({
+                "text": entry.text,
+                "negative": entry.negative,
+                "ensemble": entry.ensemble,
+                "row": row
+            })
+        metadata = {
+            "threshold": self.threshold,
+            "text_prefix": self.text_prefix,
+            "ensemble_template": self.ensemble_template,
+            "entries": metadata_entries
+        }
+        matrix = np.array(rows, dtype=np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+        write_binary_embeddings(filename, metadata, PromptMatrix.quantize(matrix, self.storage_dtype))
+
+    @staticmethod
+    def read_embeddings_file(filename):
+        """
+        Read a binary or JSON embeddings file without changing the matcher.
+        Returns (data, entries, storage_dtype): data holds the threshold, text_prefix and ensemble_template,
+        storage_dtype is the binary file's matrix type or None for JSON files.
+        """
+        if is_binary_embeddings_file(filename):
+            data, prompt_matrix = read_binary_embeddings(filename)
+            entries = [TextEmbeddingEntry(text=entry['text'],
+                                          negative=entry['negative'],
+                                          ensemble=entry['ensemble'],
+                                          store=prompt_matrix if entry['row'] >= 0 else None,
+                                          row=entry['row'])
+                       for entry in data['entries']]
+            return data, entries, prompt_matrix.dtype
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = [TextEmbeddingEntry(text=entry['text'],
+                                      embedding=np.array(entry['embedding']),
+                                      negative=entry['negative'],
+                                      ensemble=entry['ensemble'])
+                   for entry in data['entries']]
+        return data, entries, None
+
     def load_embeddings(self, filename):
         if not os.path.isfile(filename):
             with open(filename, 'w', encoding='utf-8') as f:
                 f.write('')  # Create an empty file or initialize with some data
             logger.info("File %s does not exist, creating it.", filename)
-        else:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.threshold = data['threshold']
-                    self.text_prefix = data['text_prefix']
-                    self.ensemble_template = data['ensemble_template']
-                    self.entries = [TextEmbeddingEntry(text=entry['text'],
-                                                       embedding=np.array(entry['embedding']),
-                                                       negative=entry['negative'],
-                                                       ensemble=entry['ensemble'])
-                                    for entry in data['entries']]
-            except Exception as e:
-                logger.error("Error while loading file %s: %s. Maybe you forgot to save your embeddings?", filename, e)
+            return
+        try:
+            data, entries, storage_dtype = self.read_embeddings_file(filename)
+            threshold, text_prefix, ensemble_template = data['threshold'], data['text_prefix'], data['ensemble_template']
+        except Exception as e:
+            logger.error("Error while loading file %s: %s. Maybe you forgot to save your embeddings?", filename, e)
+            return
+        self.publish_entries(entries, threshold, text_prefix, ensemble_template, storage_dtype)
 
     def get_image_embedding(self, image):
         if self.model_runtime is None:
@@ -191,57 +703,170 @@ class TextImageMatcher:
             image_embedding /= image_embedding.norm(dim=-1, keepdim=True)
         return image_embedding.cpu().numpy().flatten()
 
+    def embed_images(self, pixels):
+        """
+        Encode a batch of preprocessed images, (n x 3 x n_px x n_px) float32 as image_indexer.preprocess_image returns.
+        Returns the normalized (n x dim) float32 embeddings.
+        """
+        image_input = torch.from_numpy(np.ascontiguousarray(pixels)).to(self.device)
+        with torch.no_grad():
+            image_embedding = self.model.encode_image(image_input).float()
+            image_embedding /= image_embedding.norm(dim=-1, keepdim=True)
+        return image_embedding.cpu().numpy()
+
+    def index_images(self, patterns, output_dir, batch_size=32, workers=None, prefetch=4):
+        """Embed the images of patterns (directories, globs or files) into an image index, see image_indexer.py."""
+        from clip_app.image_indexer import list_images, build_image_index
+        if self.model_runtime is None:
+            logger.error("No model is loaded. Please call init_clip before calling index_images.")
+            return None
+        paths = list_images(patterns)
+        logger.info("Found %s images", len(paths))
+        visual = self.model.visual
+        return build_image_index(paths, output_dir, self.embed_images, visual.input_resolution, visual.output_dim,
+                                 batch_size=batch_size, workers=workers, prefetch=prefetch,
+                                 metadata={"model": self.model_name, "n_px": visual.input_resolution})
+
+    def compute_similarities(self, dot_products):
+        """
+        Map a (rows x prompts) matrix of dot products to similarity scores.
+        With run_softmax a numerically stable softmax is applied on every row,
+        otherwise the dot products are linearly mapped to [0,1].
+        """
+        if self.run_softmax:
+            logits = 100 * dot_products
+            # Subtracting the row max does not change the softmax result but prevents exp overflow
+            logits -= np.max(logits, axis=1, keepdims=True)
+            similarities = np.exp(logits)
+            similarities /= np.sum(similarities, axis=1, keepdims=True)
+        else:
+            # These magic numbers were collected by running actual inferences and measureing statistics.
+            # stats min: 0.27013595659637846, max: 0.4043235050452188, avg: 0.33676838831786493
+            # map to [0,1]
+            similarities = (dot_products - 0.27) / (0.41 - 0.27)
+            np.clip(similarities, 0, 1, out=similarities)
+        return similarities
+
+    def _indexed_dot_products(self, snapshot, image_embedding_np):
+        """
+        Score every row against its prompt index candidates and all the negative prompts.
+        Returns (dot_products, columns), columns maps every score to its position in the valid entries.
+        Missing candidates get a score of -inf.
+        """
+        candidates = snapshot.prompt_index.search(image_embedding_np, self.index_n_probe, self.index_top_k)
+        missing = candidates < 0
+        negatives = np.broadcast_to(snapshot.negative_positions, (len(candidates), len(snapshot.negative_positions)))
+        columns = np.hstack((candidates, negatives))
+        candidate_embeddings = snapshot.prompt_matrix.take(columns.ravel()).reshape(columns.shape + (-1,))
+        dot_products = np.einsum('rd,rkd->rk', image_embedding_np, candidate_embeddings)
+        dot_products[:, :missing.shape[1]][missing] = -np.inf
+        return dot_products, columns
+
+    @staticmethod
+    def _row_probabilities(snapshot, similarities, columns, row):
+        """Return the similarities of a row for all valid entries, prompts that were not scored get 0."""
+        if columns is None:
+            return similarities[row]
+        probabilities = np.zeros(len(snapshot.valid_entries), dtype=similarities.dtype)
+        # Rows with fewer candidates are padded with -1, which would index the last entry
+        scored = columns[row] >= 0
+        np.maximum.at(probabilities, columns[row][scored], similarities[row][scored])
+        return probabilities
+
+    @staticmethod
+    def _best_matches(similarities, columns, valid_entries, valid_texts, negative_mask, threshold, report_all):
+        """
+        Return the Match of every row of similarities (rows x scored prompts).
+        columns maps every score to its position in valid_entries, None if all valid entries were scored in order.
+        """
+        row_indices = np.arange(similarities.shape[0])
+        best_idx = np.argmax(similarities, axis=1)
+        best_similarity = similarities[row_indices, best_idx]
+        if columns is not None:
+            best_idx = columns[row_indices, best_idx]
+        best_negative = negative_mask[best_idx]
+        passed_threshold = best_similarity > threshold
+
+        if report_all:
+            keep = row_indices
+        else:
+            keep = np.flatnonzero(passed_threshold & ~best_negative)
+        results = []
+        for row_idx in keep:
+            results.append(Match(int(row_idx),
+                                 valid_texts[best_idx[row_idx]],
+                                 float(best_similarity[row_idx]),
+                                 int(valid_entries[best_idx[row_idx]]),
+                                 bool(best_negative[row_idx]),
+                                 bool(passed_threshold[row_idx])))
+        return results
+
+    def match_profiles(self, image_embedding_np, report_all=False):
+        """
+        Match image embeddings against all the active profiles with a single matrix product.
+        Returns a dict of profile name -> list of Match, as returned by match() for that profile alone.
+        entry_index is the index of the entry in the profile entries.
+        """
+        profile_set = self._active_profile_set  # Read once, the active set may be swapped meanwhile
+        if profile_set is None:
+            return {}
+        image_embedding_np = np.asarray(image_embedding_np, dtype=np.float32)
+        if len(image_embedding_np.shape) == 1:
+            image_embedding_np = image_embedding_np.reshape(1, -1)
+        dot_products = None
+        if len(profile_set.prompt_matrix) and image_embedding_np.shape[0]:
+            dot_products = profile_set.prompt_matrix.dot(image_embedding_np)
+        results = {}
+        for profile, start, stop in zip(profile_set.profiles, profile_set.offsets[:-1], profile_set.offsets[1:]):
+            if dot_products is None or start == stop:
+                results[profile.name] = []
+                continue
+            similarities = self.compute_similarities(dot_products[:, start:stop])
+            results[profile.name] = self._best_matches(similarities, None, profile.valid_entries, profile.valid_texts,
+                                                       profile.negative_mask, profile.threshold, report_all)
+        return results
+
     def match(self, image_embedding_np, report_all=False, update_tracked_probability=None):
         """
         This function is used to match an image embedding to a text embedding
-        Returns a list of tuples: (row_idx, text, similarity, entry_index)
+        Returns a list of Match objects: (row_idx, text, similarity, entry_index, negative, passed_threshold)
         row_idx is the index of the row in the image embedding
         text is the best matching text
         similarity is the similarity between the image and text embeddings
         entry_index is the index of the entry in self.entries
-        If the best match is a negative entry, or if the similarity is below the threshold, the tuple is not returned
+        If the best match is a negative entry, or if the similarity is below the threshold, the match is not returned
         If no match is found, an empty list is returned
         If report_all is True, the function returns a list of all matches,
         including negative entries and entries below the threshold.
+        All rows are scored in a single (rows x prompts) matrix product, or against the prompt index
+        candidates if set_index_mode is enabled.
         """
+        image_embedding_np = np.asarray(image_embedding_np, dtype=np.float32)
         if len(image_embedding_np.shape) == 1:
             image_embedding_np = image_embedding_np.reshape(1, -1)
-        results = []
-        all_dot_products = None
-        valid_entries = self.get_embeddings()
-        if len(valid_entries) == 0:
+        snapshot = self._refresh_cache()
+        valid_entries = snapshot.valid_entries
+        if len(valid_entries) == 0 or image_embedding_np.shape[0] == 0:
             return []
-        text_embeddings_np = np.array([self.entries[i].embedding for i in valid_entries])
-        for row_idx, image_embedding_1d in enumerate(image_embedding_np):
-            dot_products = np.dot(text_embeddings_np, image_embedding_1d)
-            all_dot_products = dot_products[np.newaxis, :] if all_dot_products is None else np.vstack((all_dot_products, dot_products))
-
-            if self.run_softmax:
-                similarities = np.exp(100 * dot_products)
-                similarities /= np.sum(similarities)
-            else:
-                # These magic numbers were collected by running actual inferences and measureing statistics.
-		# stats min: 0.27013595659637846, max: 0.4043235050452188, avg: 0.33676838831786493
-                # map to [0,1]
-                similarities = (dot_products - 0.27) / (0.41 - 0.27)
-                similarities = np.clip(similarities, 0, 1)
-
-            best_idx = np.argmax(similarities)
-            best_similarity = similarities[best_idx]
-            for i, _ in enumerate(similarities):
-                self.entries[valid_entries[i]].probability = similarities[i]
-                if update_tracked_probability is None or update_tracked_probability == row_idx:
-                    logger.debug("Updating tracked probability for entry %s to %s", valid_entries[i], similarities[i])
-                    self.entries[valid_entries[i]].tracked_probability = similarities[i]
-            new_match = Match(row_idx,
-                              self.entries[valid_entries[best_idx]].text,
-                              best_similarity, valid_entries[best_idx],
-                              self.entries[valid_entries[best_idx]].negative,
-                              best_similarity > self.threshold)
-            if not report_all and new_match.negative:
-                continue
-            if report_all or new_match.passed_threshold:
-                results.append(new_match)
+
+        if snapshot.prompt_index is not None:
+            dot_products, columns = self._indexed_dot_products(snapshot, image_embedding_np)
+        else:
+            dot_products = snapshot.prompt_matrix.dot(image_embedding_np)
+            columns = None
+        similarities = self.compute_similarities(dot_products)
+        results = self._best_matches(similarities, columns, valid_entries, snapshot.valid_texts, snapshot.negative_mask,
+                                     self.threshold, report_all)
+
+        # Entry probabilities reflect the last row, tracked probabilities the focused row (or the last one)
+        probabilities = self._row_probabilities(snapshot, similarities, columns, -1)
+        tracked_probabilities = None
+        if update_tracked_probability is None:
+            tracked_probabilities = probabilities
+        elif 0 <= update_tracked_probability < similarities.shape[0]:
+            tracked_probabilities = self._row_probabilities(snapshot, similarities, columns, update_tracked_probability)
+            logger.debug("Updating tracked probabilities from row %s", update_tracked_probability)
+        snapshot.stats.write(valid_entries, probabilities, tracked_probabilities)
 
         logger.debug("Best match output: %s", results)
         return results
@@ -252,15 +877,30 @@ text_image_matcher = TextImageMatcher()
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--output", type=str, default="text_embeddings.json", help="output file name default=text_embeddings.json")
+    parser.add_argument("--output", type=str, default="text_embeddings.json", help=f"output file name default=text_embeddings.json. Use the {BINARY_EXTENSION} extension to save in the binary format")
     parser.add_argument("--interactive", action="store_true", help="input text from interactive shell")
     parser.add_argument("--image-path", type=str, default=None, help="Optional, path to image file to match. Note image embeddings are not running on Hailo here.")
+    parser.add_argument("--image-dir", type=str, nargs='+', default=None, help="Directories, glob patterns or files of images to embed into --index-output, instead of adding texts. Rerun the same command to resume an interrupted run.")
+    parser.add_argument("--index-output", type=str, default="image_index", help="Output directory of --image-dir, default=image_index")
+    parser.add_argument("--image-batch-size", type=int, default=32, help="Images per image encoder call with --image-dir, default=32")
+    parser.add_argument("--workers", type=int, default=None, help="Image decoding processes with --image-dir, default=number of CPUs")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches decoded ahead of the image encoder with --image-dir, default=4")
     parser.add_argument('--texts-list', nargs='+', help='A list of texts to add to the matcher, the first one will be the searched text, the others will be considered negative prompts.\n Example: --texts-list "cat" "dog" "yellow car"')
     parser.add_argument('--texts-json', type=str, help='A json of texts to add to the matcher, the json will include 2 keys negative and positive, the values are going to be lists of texts\n Example: --texts-json resources/texts_json_example.json')
+    parser.add_argument("--disable-cache", action="store_true", help="Do not use the on disk text embeddings cache")
+    parser.add_argument("--batch-size", type=int, default=64, help="Number of prompt strings encoded per text encoder call, default=64")
+    parser.add_argument("--storage-dtype", type=str, default="float32", choices=list(STORAGE_DTYPES), help=f"Prompt matrix type of {BINARY_EXTENSION} output files, default=float32")
     args = parser.parse_args()
 
     matcher = TextImageMatcher()
+    if args.disable_cache:
+        matcher.embedding_cache_dir = None
+    matcher.set_storage_dtype(args.storage_dtype)
     matcher.init_clip()
+    if args.image_dir:
+        matcher.index_images(args.image_dir, args.index_output, batch_size=args.image_batch_size,
+                             workers=args.workers, prefetch=args.prefetch)
+        sys.exit()
     texts = []
     if args.interactive:
         while True:
@@ -292,13 +932,15 @@ def main():
 
     start_time = time.time()
 
-    for text in texts_positive:
-        matcher.add_text(text, negative=False)
-    for text in texts_negative:
-        matcher.add_text(text, negative=True)
+    matcher.add_texts(texts_positive + texts_negative,
+                      negative=[False] * len(texts_positive) + [True] * len(texts_negative),
+                      batch_size=args.batch_size)
 
     end_time = time.time()
-    logger.info("Time taken to add %s text embeddings using add_text(): %.4f seconds", len(texts), end_time - start_time)
+    logger.info("Time taken to add %s text embeddings using add_texts(): %.4f seconds",
+                len(texts_positive) + len(texts_negative), end_time - start_time)
+    if matcher.embedding_cache is not None:
+        logger.info("Text embeddings cache: %s", matcher.embedding_cache.stats())
 
     matcher.save_embeddings(args.output)
 
@@ -306,6 +948,7 @@ def main():
         logger.info("No image path provided, skipping image embedding generation")
         sys.exit()
 
+    from PIL import Image
     image = Image.open(args.image_path)
     image_embedding = matcher.get_image_embedding(image)
 
@@ -318,7 +961,7 @@ def main():
 
     valid_entries = matcher.get_embeddings()
     for i in valid_entries:
-        logger.info("Entry %s: %s similarity: %.4f", i, matcher.entries[i].text, matcher.entries[i].probability)
+        logger.info("Entry %s: %s similarity: %.4f", i, matcher.entries[i].text, matcher.get_probability(i))
     logger.info("Time taken to run match(): %.4f seconds", end_time - start_time)
 
 if __name__ == "__main__":
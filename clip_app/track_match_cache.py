@@ -0,0 +1,145 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from clip_app.logger_setup import setup_logger
+from clip_app.text_image_matcher import Match
+
+"""
+Cache of match results keyed by track id.
+The tracker pipelines re-crop a track only every few frames, in between the same embedding is attached
+to the detection again. Rows whose embedding fingerprint equals the cached one reuse the cached match
+instead of being scored again.
+The cache is cleared when the matcher prompts, threshold or scoring settings change. Tracks that were not
+seen for ttl seconds are dropped, and the least recently seen tracks are dropped above max_tracks.
+"""
+
+logger = setup_logger()
+
+DEFAULT_MAX_TRACKS = 256
+DEFAULT_TTL = 2.0  # Seconds
+
+
+class TrackMatchEntry:
+    def __init__(self, fingerprint, match, probabilities, last_seen):
+        self.fingerprint = fingerprint
+        self.match = match  # Match of the track, row_idx is updated on every hit
+        self.probabilities = probabilities  # Tracked probabilities, stored only for the focused track
+        self.last_seen = last_seen
+
+
+class TrackMatchCache:
+    def __init__(self, max_tracks=DEFAULT_MAX_TRACKS, ttl=DEFAULT_TTL):
+        self.max_tracks = max_tracks
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # track_id -> TrackMatchEntry, least recently seen first
+        self._matcher_state = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(embedding):
+        """Return a cheap fingerprint of an embedding row, equal for identical rows."""
+        return hash(np.ascontiguousarray(embedding).tobytes())
+
+    @staticmethod
+    def matcher_state(matcher):
+        """Everything match() results depend on besides the image embedding."""
+        return (matcher.version, matcher.threshold, matcher.run_softmax, matcher.index_n_probe, matcher.index_top_k)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self, now):
+        # Entries are ordered by last_seen, stop at the first live one
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.last_seen <= self.ttl and len(self._entries) <= self.max_tracks:
+                break
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def match(self, matcher, embeddings, track_ids, update_tracked_probability=None, now=None):
+        """
+        Same as matcher.match(embeddings, report_all=True, update_tracked_probability=...) but rows with a
+        track id whose embedding did not change since it was last scored are not scored again.
+        track_ids holds a track id or None per row.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            state = self.matcher_state(matcher)
+            if state != self._matcher_state:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._matcher_state = state
+            self._expire(now)
+
+            results = [None] * len(embeddings)
+            fingerprints = [None] * len(embeddings)
+            cached_probabilities = None
+            miss_rows = []
+            for row, track_id in enumerate(track_ids):
+                if track_id is None:
+                    miss_rows.append(row)
+                    continue
+                fingerprints[row] = self.fingerprint(embeddings[row])
+                entry = self._entries.get(track_id)
+                focused = row == update_tracked_probability
+                if (entry is None or entry.fingerprint != fingerprints[row] or
+                        (focused and entry.probabilities is None)):
+                    self.misses += 1
+                    miss_rows.append(row)
+                    continue
+                self.hits += 1
+                entry.last_seen = now
+                self._entries.move_to_end(track_id)
+                cached = entry.match
+                results[row] = Match(row, cached.text, cached.similarity, cached.entry_index,
+                                     cached.negative, cached.passed_threshold)
+                if focused:
+                    cached_probabilities = entry.probabilities
+
+            if miss_rows:
+                if update_tracked_probability in miss_rows:
+                    tracked_row = miss_rows.index(update_tracked_probability)
+                elif update_tracked_probability is not None:
+                    tracked_row = -1  # The focused track is cached or missing, keep the tracked probabilities
+                else:
+                    tracked_row = None
+                matches = matcher.match(embeddings[miss_rows], report_all=True, update_tracked_probability=tracked_row)
+                for match in matches:
+                    row = miss_rows[match.row_idx]
+                    match.row_idx = row
+                    results[row] = match
+                    track_id = track_ids[row]
+                    if track_id is None:
+                        continue
+                    probabilities = None
+                    if row == update_tracked_probability:
+                        probabilities = matcher.tracked_probabilities
+                    self._entries[track_id] = TrackMatchEntry(fingerprints[row], match, probabilities, now)
+                    self._entries.move_to_end(track_id)
+                self._expire(now)
+            if cached_probabilities is not None:
+                matcher.set_tracked_probabilities(cached_probabilities)
+            return [result for result in results if result is not None]
+
+    def stats(self):
+        """Return the hit / miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tracks": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -2,7 +2,6 @@ import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 import hailo
-from clip_app.clip_app_pipeline import ClipApp
 
 class app_callback_class:
     def __init__(self):
@@ -63,6 +62,8 @@ def app_callback(self, pad, info, user_data):
     return Gst.PadProbeReturn.OK
 
 def main():
+    # Imported here so app_callback can be used (and benchmarked) without the GTK app
+    from clip_app.clip_app_pipeline import ClipApp
     user_data = app_callback_class()
     clip = ClipApp(user_data, app_callback)
     clip.run()
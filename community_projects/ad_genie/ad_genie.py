@@ -3,13 +3,20 @@ gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 import os
 import json
-import random
 import time
+import queue
 import multiprocessing
 import hailo
-from PIL import Image, ImageDraw
+from PIL import Image
 from hailo_apps_infra.gstreamer_app import app_callback_class
 from clip_app.clip_app_pipeline import ClipApp
+from catalog_index import CatalogIndex
+from label_queue import LabelTable, put_latest, get_latest
+from display_cache import CanvasCache, letterbox, load_logo, composite_logos, prerendered_path, DEFAULT_CACHE_MB
+
+DISPLAY_INTERVAL = 2.0  # Minimum seconds between ad switches
+PRERENDERED_DIR = os.path.join("resources", "display")  # Written by display_cache.py
+CACHE_REPORT_INTERVAL = 50  # Ad switches between display cache reports
 
 class user_app_callback_class(app_callback_class):
     """
@@ -32,34 +39,40 @@ class user_app_callback_class(app_callback_class):
         with open(CLOTHES_JSON_PATH, "r", encoding="utf-8") as f:
             clothes_map = json.load(f)
         self.clothes_map = clothes_map
+        self.label_table = LabelTable(clothes_map)
+        # Catalog of image embeddings (see catalog_index.py), the crops are matched against the catalog images when it exists
+        CATALOG_DIR = os.path.join("resources", "catalog")
+        self.catalog = CatalogIndex.load(CATALOG_DIR) if os.path.isfile(os.path.join(CATALOG_DIR, "items.json")) else None
         self.MAX_QUEUE_SIZE = 3
         self.labels_queue = multiprocessing.Queue(maxsize=self.MAX_QUEUE_SIZE)
         client_process = multiprocessing.Process(target=self.label_to_css, args=(self.labels_queue,))
         client_process.start()
 
-    def parse_lable(self,lable_str):
+    def label_gender(self, lable_str):
         """
-        Parses a label string to determine the corresponding clothing item file.
+        Returns the gender of a label ("Men" or "Women"), or None.
         """
-
+        if "Women" in lable_str:
+            return "Women"
         if "Men" in lable_str:
-            gender = "Men"
-        elif "Women" in lable_str:
-            gender = "Women"
-            # We also assume the item is after "wearing".
-        # For example, "a men wearing REFLECTIVE EFFECT JACKET"
-        # -> item_str = "REFLECTIVE EFFECT JACKET"
-        parts = lable_str.split("wearing a ")
-        if len(parts) > 1:
-            item_str = parts[1].strip().upper()  # "REFLECTIVE EFFECT JACKET"
-        else:
-            item_str = None
-        # Attempt to look up the file
-        matched_file = None
-        if gender and item_str:
-            if gender in self.clothes_map.keys() and item_str in self.clothes_map[gender].keys():
-                matched_file = self.clothes_map[gender][item_str][0]
-        return matched_file
+            return "Men"
+        return None
+
+    def match_catalog(self, embedding, lable_str):
+        """
+        Returns the catalog image most similar to a crop embedding, among the items of the label's gender.
+        """
+        gender = self.label_gender(lable_str)
+        filters = {"gender": gender} if gender in self.catalog.partition_values("gender") else {}
+        matches = self.catalog.query(embedding, k=1, **filters)
+        return matches[0][0] if matches else None
+
+    def parse_lable(self, lable_str):
+        """
+        Returns the clothing item file of a label, looked up in the precomputed label table.
+        For example, "a Men wearing a REFLECTIVE EFFECT JACKET" -> the first image of REFLECTIVE EFFECT JACKET
+        """
+        return self.label_table.first_file(lable_str)
 
     def update_image(self, file = None):
         """
@@ -75,26 +88,34 @@ class user_app_callback_class(app_callback_class):
         """
         Chooses a random clothing image from the loaded clothes map.
         """
-        gender = random.choice(list(self.clothes_map.keys()))
-        item_str = random.choice(list(self.clothes_map[gender].keys()))
-        file = random.choice(list(self.clothes_map[gender][item_str]))
-        return file
+        return self.label_table.random_file()
 
     def label_to_css(self, queue_in,) -> None:
         """
         Processes labels from the queue and updates the display accordingly.
+        Blocks until a label arrives and shows the newest one, at most once every DISPLAY_INTERVAL seconds.
         """
-        start = time.time()
+        last_update = time.monotonic() - DISPLAY_INTERVAL
         while True:
-            if not queue_in.empty():
-                label = queue_in.get()
-                label = queue_in.get()
-                now_time = time.time()
-                if now_time - start < 2:
-                    continue
-                start = time.time()
+            label, matched_file = get_latest(queue_in)
+            wait = last_update + DISPLAY_INTERVAL - time.monotonic()
+            if wait > 0:
+                # Labels received meanwhile replace this one
+                time.sleep(wait)
+                try:
+                    label, matched_file = get_latest(queue_in, block=False)
+                except queue.Empty:
+                    pass
+            last_update = time.monotonic()
+            if matched_file is None:
                 matched_file = self.parse_lable(label)
-                self.update_image(matched_file)
+            self.update_image(matched_file)
+            cache = self.display.cache
+            if (cache.hits + cache.misses) % CACHE_REPORT_INTERVAL == 0:
+                stats = cache.summary()
+                print(f"Display cache: {stats['hit_rate']:.0%} hits, {stats['canvases']} canvases "
+                      f"({stats['cache_mb']:.0f} MB), switch p50 {stats['switch_ms']['p50_ms']:.1f} ms "
+                      f"p99 {stats['switch_ms']['p99_ms']:.1f} ms")
 
     def increment(self):
         """Increments the frame count (for potential future use)."""
@@ -139,7 +160,13 @@ def user_app_callback(self, pad, info, user_data):
             string_to_print += ' CLIP Classifications:'
             for classification in classifications:
                 label = classification.get_label()
-                user_data.labels_queue.put(label)
+                matched_file = None
+                if user_data.catalog is not None:
+                    matrices = detection.get_objects_typed(hailo.HAILO_MATRIX)
+                    if matrices:
+                        matched_file = user_data.match_catalog(matrices[0], label)
+                # Never block the streaming thread, the oldest label is dropped when the display lags
+                put_latest(user_data.labels_queue, (label, matched_file))
                 confidence = classification.get_confidence()
                 string_to_print += f'Label: {label} Confidence: {confidence:.2f} '
             string_to_print += '\n'
@@ -155,54 +182,52 @@ def user_app_callback(self, pad, info, user_data):
 class DisplayManager:
     """
     Manages the display canvas for showing images and logos.
+    Canvases are rendered once (from the pre-rendered images of display_cache.py when they exist) and kept in an LRU cache.
     """
-    def __init__(self, screen_width, screen_height):
+    def __init__(self, screen_width, screen_height, prerendered_dir=PRERENDERED_DIR, cache_mb=DEFAULT_CACHE_MB):
         """
         Initializes the display manager with screen dimensions.
         """
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.canvas = Image.new('RGB', (screen_width, screen_height), color='white')  # white canvas
-        self.image = None
+        self.image_path = None
         self.left_logo = None
         self.right_logo = None
+        self.prerendered_dir = prerendered_dir
+        self.cache = CanvasCache(self.render, cache_mb * 1024 * 1024)
+
+    def render(self, image_path):
+        """
+        Returns the canvas of an image, letterboxed to the screen, with the logos.
+        """
+        size = (self.screen_width, self.screen_height)
+        prerendered = prerendered_path(self.prerendered_dir, image_path)
+        with Image.open(prerendered if os.path.isfile(prerendered) else image_path) as image:
+            canvas = image.convert('RGB') if image.size == size else letterbox(image, size)
+        return composite_logos(canvas, self.left_logo, self.right_logo)
 
     def update_image(self, image_path):
         """
         Updates the canvas with a new image.
         """
-        new_image = Image.open(image_path)
-        img_width, img_height = new_image.size
-        left_margin = (self.screen_width - img_width) // 2
-        top_margin = (self.screen_height - img_height) // 2
-        self.canvas.paste(new_image, (left_margin, top_margin))
-        self.image = new_image
+        self.canvas = self.cache.get(image_path)
+        self.image_path = image_path
 
     def update_logos(self, left_logo_path=None, right_logo_path=None):
         """
         Updates the canvas with logos at the bottom corners.
         """
-        draw = ImageDraw.Draw(self.canvas)  # to draw white placeholders for logos
-
-        # Handle the left logo
         if left_logo_path:
-            left_logo = Image.open(left_logo_path).convert('RGBA')  # Ensure RGBA mode for transparency
-            left_logo = left_logo.resize((100, 100))  # Resize logo if needed
-            self.left_logo = left_logo
-            logo_x = 0
-            logo_y = self.screen_height - left_logo.height
-            # Use the alpha channel of the logo as the mask for pasting
-            self.canvas.paste(left_logo, (logo_x, logo_y), left_logo.split()[3])  # Alpha channel as mask
-
-        # Handle the right logo
+            self.left_logo = load_logo(left_logo_path)
         if right_logo_path:
-            right_logo = Image.open(right_logo_path).convert('RGBA')  # Ensure RGBA mode for transparency
-            right_logo = right_logo.resize((100, 100))  # Resize logo if needed
-            self.right_logo = right_logo
-            logo_x = self.screen_width - right_logo.width
-            logo_y = self.screen_height - right_logo.height
-            # Use the alpha channel of the logo as the mask for pasting
-            self.canvas.paste(right_logo, (logo_x, logo_y), right_logo.split()[3])  # Alpha channel as mask
+            self.right_logo = load_logo(right_logo_path)
+        # The cached canvases have the previous logos
+        self.cache.clear()
+        if self.image_path is not None:
+            self.update_image(self.image_path)
+        else:
+            self.canvas = composite_logos(self.canvas.copy(), self.left_logo, self.right_logo)
 
     def show(self):
         """Displays the current canvas."""
@@ -213,7 +238,7 @@ class DisplayManager:
         Saves the current canvas to a file.
         """
         self.canvas.save(save_path)
-        
+
 if __name__ == "__main__":
     user_data = user_app_callback_class()
     clip = ClipApp(user_data, user_app_callback)
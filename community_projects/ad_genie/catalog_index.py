@@ -0,0 +1,252 @@
+import os
+import sys
+import glob
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from clip_app.prompt_matrix import PromptMatrix
+from clip_app.prompt_index import PromptIndex
+
+"""
+Image to image search over the catalog: the shopper's crop embedding (the HAILO_MATRIX CLIP embedding of the
+detection) is compared with the CLIP embeddings of the catalog images, instead of mapping the CLIP label back to
+an item by its text.
+
+A catalog is a directory:
+    embeddings.npy  (items x dim) float32 normalized image embeddings, memory mapped at load
+    items.json      {"fields": ["gender", "item"], "ids": [image file per row], "values": {field: [value per row]}}
+    index.npz       IVF lists (clip_app.prompt_index) of the whole catalog and of every first field partition,
+                    for catalogs of at least INDEX_MIN_ITEMS items
+Rows are sorted by the partition fields, so filtering on the first fields (gender, or gender and item) selects a
+contiguous slice of the matrix; filters on other fields gather the matching rows.
+Queries score every item of the selected rows with one matrix product. Catalogs of at least INDEX_MIN_ITEMS items
+are searched approximately instead: only the items of the n_probe closest IVF lists are scored and re-ranked, so the
+top k may differ from the exact one. Pass exact=True to a query (or delete index.npz) for an exact search.
+
+Build the catalog from zara.json and the downloaded images (runs the CLIP image encoder on the host, resumable):
+    python catalog_index.py --json-path resources/zara.json --images resources/images --output resources/catalog
+"""
+
+CATALOG_FIELDS = ("gender", "item")
+INDEX_MIN_ITEMS = 20000  # Smaller catalogs (and partitions) are scored exactly
+DEFAULT_N_PROBE = 16  # IVF lists scanned per query
+INDEX_CANDIDATES = 64  # Candidates returned by the IVF index, re-ranked exactly
+
+
+def write_catalog(directory, ids, embeddings, values, fields=CATALOG_FIELDS):
+    """
+    Write a catalog: ids and embeddings per item, values a dict of field -> value per item.
+    Rows are sorted by the fields values and normalized.
+    """
+    order = sorted(range(len(ids)), key=lambda row: tuple(values[field][row] for field in fields) + (ids[row],))
+    matrix = np.asarray(embeddings, dtype=np.float32)[order]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms > 0, norms, 1)
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "embeddings.npy"), matrix)
+    items = {"fields": list(fields), "ids": [ids[row] for row in order],
+             "values": {field: [values[field][row] for row in order] for field in fields}}
+    with open(os.path.join(directory, "items.json"), 'w', encoding='utf-8') as f:
+        json.dump(items, f)
+    index_file = os.path.join(directory, "index.npz")
+    if os.path.exists(index_file):
+        os.remove(index_file)
+    catalog = CatalogIndex(items["ids"], matrix, items["values"], fields)
+    arrays = {}
+    for number, (key, (start, end)) in enumerate(catalog.indexed_ranges()):
+        centroids, index_ids, offsets = PromptIndex(PromptMatrix(matrix), ids=np.arange(start, end)).to_arrays()
+        arrays.update({f"key_{number}": np.array(json.dumps(list(key))), f"centroids_{number}": centroids,
+                       f"ids_{number}": index_ids, f"offsets_{number}": offsets})
+    if arrays:
+        np.savez(index_file, **arrays)
+
+
+class CatalogIndex:
+    def __init__(self, ids, embeddings, values=None, fields=(), indexes=None, n_probe=DEFAULT_N_PROBE):
+        """
+        embeddings is (items x dim) normalized, sorted by fields when filters are to select slices.
+        indexes maps a partition key (a tuple of first field values, () for the whole catalog) to its PromptIndex.
+        """
+        self.ids = ids
+        self.embeddings = embeddings
+        self.values = values or {}
+        self.fields = list(fields)
+        self.indexes = indexes or {}
+        self.n_probe = n_probe
+        self._ranges = {}  # (value of fields[0], ..., value of fields[i]) -> (start, end) row range
+        for depth in range(1, len(self.fields) + 1):
+            keys = list(zip(*(self.values[field] for field in self.fields[:depth])))
+            for row, key in enumerate(keys):
+                start, _ = self._ranges.get(key, (row, row))
+                self._ranges[key] = (start, row + 1)
+        self._ranges[()] = (0, len(ids))
+        # Computed once, match_catalog() checks them for every classification on the streaming thread
+        self._partition_values = {field: sorted(set(self.values[field])) for field in self.fields}
+        self._gathered = {}  # Row indices of filters that are not a prefix of the fields
+
+    @classmethod
+    def load(cls, directory, mmap=True, n_probe=DEFAULT_N_PROBE):
+        with open(os.path.join(directory, "items.json"), 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode='r' if mmap else None)
+        indexes = {}
+        index_file = os.path.join(directory, "index.npz")
+        if os.path.isfile(index_file):
+            with np.load(index_file) as arrays:
+                matrix = PromptMatrix(embeddings)
+                number = 0
+                while f"key_{number}" in arrays:
+                    key = tuple(json.loads(str(arrays[f"key_{number}"])))
+                    indexes[key] = PromptIndex.from_arrays(matrix, arrays[f"centroids_{number}"],
+                                                           arrays[f"ids_{number}"], arrays[f"offsets_{number}"])
+                    number += 1
+        return cls(items["ids"], embeddings, items["values"], items["fields"], indexes, n_probe)
+
+    def indexed_ranges(self):
+        """Return the (key, (start, end)) of the whole catalog and first field partitions large enough for an index."""
+        return [(key, (start, end)) for key, (start, end) in self._ranges.items()
+                if len(key) <= 1 and end - start >= INDEX_MIN_ITEMS]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def partition_values(self, field):
+        """Return the distinct values of a partition field."""
+        return self._partition_values.get(field, [])
+
+    def _rows(self, filters):
+        """Return (matrix, row offset or row indices, index or None) of the items matching filters."""
+        if not filters:
+            return self.embeddings, 0, self.indexes.get(())
+        unknown = set(filters) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Unknown catalog partition fields {sorted(unknown)}, use {self.fields}")
+        prefix = []
+        for field in self.fields:
+            if field not in filters:
+                break
+            prefix.append(filters[field])
+        if len(prefix) == len(filters):
+            start, end = self._ranges.get(tuple(prefix), (0, 0))
+            return self.embeddings[start:end], start, self.indexes.get(tuple(prefix))
+        key = tuple(sorted(filters.items()))
+        if key not in self._gathered:
+            mask = np.ones(len(self.ids), dtype=bool)
+            for field, value in filters.items():
+                mask &= np.array([v == value for v in self.values[field]])
+            rows = np.flatnonzero(mask)
+            self._gathered[key] = (np.ascontiguousarray(self.embeddings[rows]), rows, None)
+        return self._gathered[key]
+
+    def _search_index(self, index, queries, k):
+        """Exact top k among the IVF candidates of every query. Returns (rows, scores), padded with -1 / -inf."""
+        candidates = index.search(queries, self.n_probe, max(k, INDEX_CANDIDATES))
+        top = np.full((len(queries), k), -1, dtype=np.intp)
+        top_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, query_candidates) in enumerate(zip(queries, candidates)):
+            query_candidates = query_candidates[query_candidates >= 0]
+            scores = self.embeddings[query_candidates].dot(query)
+            best = np.argsort(-scores)[:k]
+            top[row, :len(best)] = query_candidates[best]
+            top_scores[row, :len(best)] = scores[best]
+        return top, top_scores
+
+    def query_batch(self, embeddings, k=5, exact=False, **filters):
+        """
+        Return the k most similar items for every row of embeddings ((rows x dim) or (dim,)), optionally only among
+        the items whose partition fields match filters (gender="Men"). Every result is a list of (id, cosine) pairs,
+        most similar first. Indexed partitions are searched approximately unless exact is True.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        matrix, rows, index = self._rows(filters)
+        if len(matrix) == 0:
+            return [[] for _ in range(len(queries))]
+        if index is not None and not exact:
+            item_rows, top_scores = self._search_index(index, queries, k)
+            return [[(self.ids[row], float(score)) for row, score in zip(query_rows, query_scores) if row >= 0]
+                    for query_rows, query_scores in zip(item_rows, top_scores)]
+        scores = queries.dot(matrix.T)  # (queries x items)
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        item_rows = top + rows if np.isscalar(rows) else rows[top]
+        return [[(self.ids[row], float(score)) for row, score in zip(query_rows, query_scores)]
+                for query_rows, query_scores in zip(item_rows, top_scores)]
+
+    def query(self, embedding, k=5, exact=False, **filters):
+        """Return the k most similar items of a single embedding (a HAILO_MATRIX object or an array)."""
+        return self.query_batch(matrix_embedding(embedding), k, exact, **filters)[0]
+
+
+def matrix_embedding(matrix):
+    """Return the data of a HAILO_MATRIX object as a float32 array, arrays are returned as they are."""
+    if isinstance(matrix, np.ndarray):
+        return matrix
+    try:
+        return np.asarray(memoryview(matrix), dtype=np.float32).reshape(-1)
+    except TypeError:
+        return np.array(matrix.get_data(), dtype=np.float32)
+
+
+def catalog_items(clothes_map, images_dir):
+    """Return (image paths, values) of the items of zara.json whose image was downloaded to images_dir."""
+    paths = []
+    values = {"gender": [], "item": []}
+    for gender, items in clothes_map.items():
+        for item, files in items.items():
+            for file in files:
+                path = os.path.abspath(os.path.join(images_dir, file))
+                if os.path.isfile(path):
+                    paths.append(path)
+                    values["gender"].append(gender)
+                    values["item"].append(item)
+    return paths, values
+
+
+def build_catalog(json_path, images_dir, output, batch_size=32, workers=None):
+    """Embed the catalog images with the CLIP image encoder (resumable image index) and write the catalog."""
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+    from clip_app.text_image_matcher import text_image_matcher
+    from clip_app.image_indexer import load_image_index, STATUS_DONE
+    with open(json_path, 'r', encoding='utf-8') as f:
+        clothes_map = json.load(f)
+    paths, values = catalog_items(clothes_map, images_dir)
+    image_index = os.path.join(output, "image_index")
+    text_image_matcher.init_clip()
+    text_image_matcher.index_images([glob.escape(path) for path in paths], image_index, batch_size=batch_size,
+                                    workers=workers)
+    indexed_paths, embeddings, status = load_image_index(image_index)
+    value_of = {path: (values["gender"][row], values["item"][row]) for row, path in enumerate(paths)}
+    rows = [row for row, path in enumerate(indexed_paths) if status[row] == STATUS_DONE]
+    ids = [os.path.basename(indexed_paths[row]) for row in rows]
+    write_catalog(output, ids, embeddings[rows],
+                  {"gender": [value_of[indexed_paths[row]][0] for row in rows],
+                   "item": [value_of[indexed_paths[row]][1] for row in rows]})
+    print(f"Catalog of {len(ids)} items saved to {output}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Catalog Index Preparation for Ad Genie")
+    parser.add_argument("--json-path", "-p", type=str, default="resources/zara.json", help="Enter the path to the zara json file")
+    parser.add_argument("--images", type=str, default="resources/images", help="Enter the path to the downloaded images")
+    parser.add_argument("--output", "-o", type=str, default="resources/catalog", help="Enter the path for the output catalog directory")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per image encoder call")
+    parser.add_argument("--workers", type=int, default=None, help="Image decoding processes, default=number of CPUs")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    build_catalog(args.json_path, args.images, args.output, args.batch_size, args.workers)
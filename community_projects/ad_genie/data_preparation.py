@@ -1,13 +1,150 @@
 import os
 import csv
 import ast
-import requests
-from collections import defaultdict
+import time
 import json
+import hashlib
 import argparse
- 
- 
-def download_images(base_dir, retries=1, dest_dir="resources/images"):
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+"""
+Downloads the Zara dataset images and writes zara.json (gender -> product name -> image files).
+The dataset tree is walked once, and the rows of every CSV file are queued for download while the next files
+are parsed. A bounded pool of threads downloads the images, each thread reusing the pooled connections of
+its own requests session.
+Every finished download is appended to a checkpoint (JSON lines: name, size, sha256). Interrupted runs resume:
+images in the checkpoint whose file has the same size (and hash, with --verify) are skipped, and zara.json is
+written from the checkpoint.
+"""
+
+DEFAULT_WORKERS = 16  # Downloads in flight, the time is spent waiting for the server
+CHUNK_SIZE = 256 * 1024  # Bytes read from the response at once
+TIMEOUT = 10  # Seconds
+CHECKPOINT_NAME = "download_checkpoint.jsonl"
+PROGRESS_INTERVAL = 10.0  # Seconds between progress logs
+
+_local = threading.local()
+
+
+def get_session(pool_size=DEFAULT_WORKERS):
+    """Return the requests session of the calling thread, its connections are kept alive between downloads."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_csv_files(base_dir, dest_dir):
+    """Return the sorted (folder name, csv path) of the CSV files under the subdirectories of base_dir, in one walk."""
+    dest_dir = os.path.abspath(dest_dir)
+    csv_files = []
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != dest_dir)
+        if os.path.abspath(root) == os.path.abspath(base_dir):
+            continue
+        for file in sorted(files):
+            if file.endswith(".csv"):
+                csv_files.append((os.path.basename(root), os.path.join(root, file)))
+    return csv_files
+
+
+def parse_csv(folder_name, file_path):
+    """
+    Return the images of a CSV file, as (image link, image name, folder name, product name) tuples.
+    The CSV files have an "image" column with image URLs (in a JSON-like format) and a "name" column for product names.
+    """
+    images = []
+    csv_filename = os.path.splitext(os.path.basename(file_path))[0]
+    with open(file_path, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row_number, row in enumerate(reader):
+            # Normalize and handle different column naming
+            image_field = next((field for field in row if 'image' in field.lower()), None)
+            product_field = next((field for field in row if 'name' in field.lower()), None)
+            if not image_field:
+                print(f"No valid image column found in {file_path}. Skipping...")
+                return images
+            try:
+                image_data = ast.literal_eval(row[image_field])
+                for image_num, image_url in enumerate(image_data):
+                    image_link = list(image_url.keys())[0]
+                    image_name = f"{folder_name}_{csv_filename}_{row_number}_{image_num}.jpg"
+                    images.append((image_link, image_name, folder_name, row[product_field]))
+            except (ValueError, KeyError, SyntaxError, AttributeError, TypeError) as e:
+                print(f"Error processing row {row_number} in {file_path}: {e}")
+    return images
+
+
+def load_checkpoint(checkpoint_path):
+    """Return image name -> {"size", "sha256"} of the finished downloads. A truncated last line is ignored."""
+    done = {}
+    if os.path.isfile(checkpoint_path):
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[entry["name"]] = entry
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def is_downloaded(path, entry, verify=False):
+    """True when path matches its checkpoint entry, by size, and by hash with verify."""
+    if entry is None or not os.path.isfile(path) or os.path.getsize(path) != entry["size"]:
+        return False
+    return not verify or file_sha256(path) == entry["sha256"]
+
+
+def download_image_with_retry(url, save_path, retries, session=None):
+    """
+    Downloads an image from a URL with retry logic.
+    Returns (size, sha256) of the downloaded file, or None when every attempt failed.
+    """
+    session = session or get_session()
+    for attempt in range(retries + 1):
+        try:
+            with session.get(url, stream=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                digest = hashlib.sha256()
+                size = 0
+                # Write then rename, an interrupted download never leaves a truncated image
+                with open(save_path + ".part", 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+            os.replace(save_path + ".part", save_path)
+            return size, digest.hexdigest()
+        except (requests.RequestException, OSError) as e:
+            print(f"Failed for {url} (attempt {attempt + 1}/{retries + 1}): {e}")
+    return None
+
+
+def download_images(base_dir, retries=1, dest_dir="resources/images", output_json="resources/zara.json",
+                    workers=DEFAULT_WORKERS, checkpoint_path=None, verify=False):
     """
     Downloads images specified in CSV files located within a directory structure.
 
@@ -15,90 +152,101 @@ def download_images(base_dir, retries=1, dest_dir="resources/images"):
         base_dir (str): The base directory containing nested folders and CSV files.
         retries (int): Number of retry attempts for downloading an image in case of failure.
         dest_dir (str): Destination directory to save downloaded images.
+        output_json (str): Path of the zara.json output.
+        workers (int): Concurrent downloads.
+        checkpoint_path (str): Checkpoint of the finished downloads, dest_dir/download_checkpoint.jsonl by default.
+        verify (bool): Check the hash of the images of the checkpoint before skipping them.
 
     Outputs:
         - Downloads images to the specified destination directory.
         - Logs any failed downloads to a file named `failed_links.txt` in the base directory.
-        - Saves metadata about successfully downloaded images in `resources/zara.json`.
+        - Saves metadata about successfully downloaded images in output_json.
+        - Returns a dict of statistics: images, skipped, downloaded, failed, bytes, elapsed_s, images_per_s, mb_per_s.
 
     Notes:
-        - CSV files should have an "image" column with image URLs (in a JSON-like format) and a "name" column for product names.
         - Folder names categorize data into keys like "Men" and "Women" in the JSON output.
     """
+    os.makedirs(dest_dir, exist_ok=True)
+    checkpoint_path = checkpoint_path or os.path.join(dest_dir, CHECKPOINT_NAME)
+    done = load_checkpoint(checkpoint_path)
+    images = []
     failed_links = []
-    data_dict = defaultdict(dict)
-    data_dict['Men'] = defaultdict(dict)
-    data_dict['Women'] = defaultdict(dict)
-    for _, dirs, _ in os.walk(base_dir):
-        for dir1 in dirs:
-            if dir1 != dest_dir:
-                for root, _, files in os.walk(os.path.join(base_dir, dir1)):
-                    for file in files:
-                        if file.endswith(".csv"):
-                            file_path = os.path.join(root, file)
-                            folder_name = os.path.basename(root)
-                            csv_filename = os.path.splitext(file)[0]
-                            
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                reader = csv.DictReader(f)
-                                for row_number, row in enumerate(reader):
-                                    # Normalize and handle different column naming
-                                    image_field = next(
-                                        (field for field in row if 'image' in field.lower()), None
-                                    )
-                                    product_field = next(
-                                        (field for field in row if 'name' in field.lower()), None
-                                    )
-                                    if not image_field:
-                                        print(f"No valid image column found in {file}. Skipping...")
-                                        continue
-                                    
-                                    try:
-                                        image_data = ast.literal_eval(row[image_field])
-                                        for image_num, image_url in enumerate(image_data):
-                                            image_link = list(image_url.keys())[0]
-                                            # Generate the file name
-                                            image_name = f"{folder_name}_{csv_filename}_{row_number}_{image_num}.jpg"
-                                            # import ipdb; ipdb.set_trace()
-                                            download_path = os.path.join(dest_dir, image_name)
- 
-                                            # Download the image with retry logic
-                                            success = download_image_with_retry(image_link, download_path, retries)
-                                            if not success:
-                                                failed_links.append((image_link, download_path))
-                                            else:
-                                                if row[product_field] not in data_dict[folder_name].keys():
-                                                    data_dict[folder_name][row[product_field]] = []
-                                                data_dict[folder_name][row[product_field]].append(image_name)
-                                    except (ValueError, KeyError) as e:
-                                        print(f"Error processing row {row_number} in {file}: {e}")
- 
+    stats = {"images": 0, "skipped": 0, "downloaded": 0, "failed": 0, "bytes": 0}
+    start = time.perf_counter()
+    last_log = start
+
+    def collect(future, image_link, image_name, download_path):
+        nonlocal last_log
+        result = future.result()
+        if result is None:
+            failed_links.append((image_link, download_path))
+            stats["failed"] += 1
+            return
+        size, sha256 = result
+        done[image_name] = {"name": image_name, "size": size, "sha256": sha256}
+        checkpoint.write(json.dumps(done[image_name]) + "\n")
+        checkpoint.flush()
+        stats["downloaded"] += 1
+        stats["bytes"] += size
+        now = time.perf_counter()
+        if now - last_log >= PROGRESS_INTERVAL:
+            print(f"Downloaded {stats['downloaded']} images, {stats['downloaded'] / (now - start):.1f} images/s, "
+                  f"{stats['bytes'] / (now - start) / 1e6:.1f} MB/s")
+            last_log = now
+
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, ThreadPoolExecutor(workers) as pool:
+        if checkpoint.tell() and not _ends_with_newline(checkpoint_path):
+            checkpoint.write("\n")  # After a truncated last entry
+        # Bounded in flight downloads, the next CSV files are parsed while they run
+        in_flight = deque()
+        for folder_name, file_path in find_csv_files(base_dir, dest_dir):
+            for image_link, image_name, folder, product in parse_csv(folder_name, file_path):
+                images.append((image_name, folder, product))
+                download_path = os.path.join(dest_dir, image_name)
+                if is_downloaded(download_path, done.get(image_name), verify):
+                    stats["skipped"] += 1
+                    continue
+                done.pop(image_name, None)
+                while len(in_flight) >= 4 * workers:
+                    collect(*in_flight.popleft())
+                future = pool.submit(download_image_with_retry, image_link, download_path, retries)
+                in_flight.append((future, image_link, image_name, download_path))
+        while in_flight:
+            collect(*in_flight.popleft())
+
+    stats["images"] = len(images)
+    stats["elapsed_s"] = time.perf_counter() - start
+    stats["images_per_s"] = stats["downloaded"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else 0.0
+    stats["mb_per_s"] = stats["bytes"] / stats["elapsed_s"] / 1e6 if stats["elapsed_s"] > 0 else 0.0
+
     # Write all failed links to a file
     failed_links_file = os.path.join(base_dir, "failed_links.txt")
     with open(failed_links_file, 'w') as f:
         for link, path in failed_links:
             f.write(f"{link} -> {path}\n")
     print(f"Failed links logged to {failed_links_file}")
-    with open('resources/zara.json', 'w') as file:
+    write_zara_json(images, done, output_json)
+    print(f"Downloaded {stats['downloaded']} images ({stats['bytes'] / 1e6:.1f} MB) in {stats['elapsed_s']:.1f} s, "
+          f"{stats['images_per_s']:.1f} images/s, {stats['mb_per_s']:.1f} MB/s, "
+          f"{stats['skipped']} done before, {stats['failed']} failed")
+    return stats
+
+
+def write_zara_json(images, done, output_json):
+    """Write zara.json from the images of the CSV files, in CSV order, keeping the ones in the checkpoint."""
+    data_dict = defaultdict(dict)
+    data_dict['Men'] = defaultdict(dict)
+    data_dict['Women'] = defaultdict(dict)
+    for image_name, folder_name, product in images:
+        if image_name in done:
+            data_dict[folder_name].setdefault(product, []).append(image_name)
+    output_dir = os.path.dirname(output_json)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_json + ".tmp", 'w') as file:
         json.dump(data_dict, file, indent=4)
- 
- 
-def download_image_with_retry(url, save_path, retries):
-    """
-    Downloads an image from a URL with retry logic.
-    """
-    try:
-        response = requests.get(url, stream=True, timeout=10)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
-        print(f"Downloaded: {save_path}")
-        return True
-    except requests.RequestException as e:
-        print(f"Failed for {url}: {e}")
-    return False
- 
+    os.replace(output_json + ".tmp", output_json)
+
 
 def parse_arguments():
     """
@@ -107,12 +255,19 @@ def parse_arguments():
     Returns:
         argparse.Namespace: Parsed arguments containing:
             - data (str): Path to the base directory containing the dataset.
+            - workers (int): Concurrent downloads.
+            - retries (int): Retry attempts per image.
+            - verify (bool): Check the hash of the images downloaded before.
     """
     parser = argparse.ArgumentParser(description="Data Preparation for Ad Genie")
     parser.add_argument("--data", "-d", type=str, default="resources/zara_dataset", help="Enter the path to the zara dataset")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent downloads")
+    parser.add_argument("--retries", type=int, default=1, help="Retry attempts per image")
+    parser.add_argument("--verify", action="store_true", help="Check the hash of the images downloaded before")
     return parser.parse_args()
-    
-# Parse arguments and run the download_images function
-args = parse_arguments()
-base_directory = args.data
-download_images(base_directory)
+
+
+if __name__ == "__main__":
+    # Parse arguments and run the download_images function
+    args = parse_arguments()
+    download_images(args.data, retries=args.retries, workers=args.workers, verify=args.verify)
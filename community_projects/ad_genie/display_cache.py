@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from clip_app.latency_tracer import LatencyHistogram
+
+"""
+Display ready ads for DisplayManager.
+prerender_catalog() resizes every catalog image to fit the screen and letterboxes it on a white canvas, in parallel,
+so the display only decodes a screen sized image. CanvasCache keeps the decoded canvases, with the logos already
+composited, in an LRU within a memory budget: switching to a cached ad is a dictionary lookup.
+
+Pre-render the downloaded images (files already rendered for the same screen size are skipped):
+    python display_cache.py --images resources/images --output resources/display
+"""
+
+SCREEN_SIZE = (1080, 1920)
+BACKGROUND = 'white'
+LOGO_SIZE = (100, 100)
+DEFAULT_CACHE_MB = 256  # About 40 canvases of 1080 x 1920
+PRERENDER_QUALITY = 95
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def letterbox(image, size, background=BACKGROUND):
+    """Return image resized to fit size, keeping its aspect ratio, centered on a background canvas of size."""
+    width, height = size
+    scale = min(width / image.width, height / image.height)
+    resized = image.convert('RGB')
+    if scale != 1:
+        resized = resized.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                 Image.BICUBIC)
+    canvas = Image.new('RGB', size, color=background)
+    canvas.paste(resized, ((width - resized.width) // 2, (height - resized.height) // 2))
+    return canvas
+
+
+def load_logo(path):
+    """Return a logo as an RGBA image of LOGO_SIZE."""
+    with Image.open(path) as logo:
+        return logo.convert('RGBA').resize(LOGO_SIZE)
+
+
+def composite_logos(canvas, left_logo=None, right_logo=None):
+    """Paste the RGBA logos at the bottom corners of canvas, using their alpha channel as the mask."""
+    if left_logo is not None:
+        canvas.paste(left_logo, (0, canvas.height - left_logo.height), left_logo.split()[3])
+    if right_logo is not None:
+        canvas.paste(right_logo, (canvas.width - right_logo.width, canvas.height - right_logo.height),
+                     right_logo.split()[3])
+    return canvas
+
+
+def prerendered_path(output_dir, image_path):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(image_path))[0] + ".jpg")
+
+
+def _prerender(item):
+    """Pool worker: letterbox one image. Returns (image_path, error or None)."""
+    image_path, output_path, size = item
+    try:
+        with Image.open(image_path) as image:
+            canvas = letterbox(image, size)
+        # Write then rename, an interrupted run never leaves a truncated file
+        canvas.save(output_path + ".tmp", format="JPEG", quality=PRERENDER_QUALITY)
+        os.replace(output_path + ".tmp", output_path)
+        return image_path, None
+    except (OSError, ValueError) as e:
+        return image_path, str(e)
+
+
+def _is_prerendered(image_path, output_path, size):
+    if not os.path.isfile(output_path) or os.path.getmtime(output_path) < os.path.getmtime(image_path):
+        return False
+    try:
+        with Image.open(output_path) as image:
+            return image.size == tuple(size)
+    except OSError:
+        return False
+
+
+def prerender_catalog(images_dir, output_dir, size=SCREEN_SIZE, workers=None):
+    """
+    Letterbox every image of images_dir to size into output_dir (same name, .jpg), skipping images already rendered.
+    Returns a dict of statistics: images, skipped, rendered, failed, elapsed_s and images_per_s.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(os.path.join(images_dir, name) for name in os.listdir(images_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    pending = [(path, prerendered_path(output_dir, path), tuple(size)) for path in paths
+               if not _is_prerendered(path, prerendered_path(output_dir, path), size)]
+    stats = {"images": len(paths), "skipped": len(paths) - len(pending), "rendered": 0, "failed": 0}
+    start = time.perf_counter()
+    if pending:
+        with multiprocessing.get_context("spawn").Pool(workers or os.cpu_count() or 1) as pool:
+            for image_path, error in pool.imap_unordered(_prerender, pending, chunksize=8):
+                if error is None:
+                    stats["rendered"] += 1
+                else:
+                    print(f"Failed to render {image_path}: {error}")
+                    stats["failed"] += 1
+    stats["elapsed_s"] = time.perf_counter() - start
+    stats["images_per_s"] = stats["rendered"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else 0.0
+    return stats
+
+
+class CanvasCache:
+    def __init__(self, render, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        """render(key) returns the canvas (a PIL image) of key. Canvases are kept up to max_bytes, least recent first out."""
+        self.render = render
+        self.max_bytes = max_bytes
+        self.canvases = OrderedDict()
+        self.bytes = 0
+        self.switch_latency = LatencyHistogram()
+        self.reset_stats()
+
+    @staticmethod
+    def canvas_bytes(canvas):
+        return canvas.width * canvas.height * len(canvas.getbands())
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.switch_latency.reset()
+
+    def get(self, key):
+        """Return the canvas of key, rendering it on a miss. The canvas is shared, do not modify it."""
+        start = time.perf_counter()
+        canvas = self.canvases.get(key)
+        if canvas is not None:
+            self.canvases.move_to_end(key)
+            self.hits += 1
+        else:
+            canvas = self.render(key)
+            self.misses += 1
+            self.put(key, canvas)
+        self.switch_latency.add((time.perf_counter() - start) * 1000)
+        return canvas
+
+    def put(self, key, canvas):
+        size = self.canvas_bytes(canvas)
+        if key in self.canvases:
+            self.bytes -= self.canvas_bytes(self.canvases.pop(key))
+        if size > self.max_bytes:
+            return
+        while self.bytes + size > self.max_bytes:
+            _, evicted = self.canvases.popitem(last=False)
+            self.bytes -= self.canvas_bytes(evicted)
+            self.evictions += 1
+        self.canvases[key] = canvas
+        self.bytes += size
+
+    def clear(self):
+        self.canvases.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.canvases)
+
+    def summary(self):
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "evictions": self.evictions,
+            "canvases": len(self.canvases),
+            "cache_mb": self.bytes / (1024 * 1024),
+            "switch_ms": self.switch_latency.summary(),
+        }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Display Pre-render for Ad Genie")
+    parser.add_argument("--images", type=str, default="resources/images", help="Enter the path to the downloaded images")
+    parser.add_argument("--output", "-o", type=str, default="resources/display", help="Enter the path for the rendered images")
+    parser.add_argument("--width", type=int, default=SCREEN_SIZE[0], help="Screen width")
+    parser.add_argument("--height", type=int, default=SCREEN_SIZE[1], help="Screen height")
+    parser.add_argument("--workers", type=int, default=None, help="Rendering processes, default=number of CPUs")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    stats = prerender_catalog(args.images, args.output, (args.width, args.height), args.workers)
+    print(f"Rendered {stats['rendered']} images in {stats['elapsed_s']:.1f} s ({stats['images_per_s']:.1f} images/s), "
+          f"{stats['failed']} failed, {stats['skipped']} done before")
@@ -0,0 +1,86 @@
+import queue
+import random
+
+"""
+Hand off of the CLIP labels from the GStreamer streaming thread to the display process.
+The producer never blocks: when the queue is full the oldest label is dropped (put_latest), and the consumer
+blocks until a label arrives and then skips to the newest one (get_latest), only the latest label is worth showing.
+
+LabelTable maps the labels of lables_preparation.py ("a Men wearing a REFLECTIVE EFFECT JACKET") to their catalog
+files once, from zara.json, in the order of lables.json.
+"""
+
+
+def put_latest(queue_out, item):
+    """Put item without blocking, dropping the oldest items while the queue is full. Returns the number dropped."""
+    dropped = 0
+    while True:
+        try:
+            queue_out.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                queue_out.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+def get_latest(queue_in, block=True, timeout=None):
+    """Return the newest item of queue_in, dropping the older ones. Waits for the first item like Queue.get()."""
+    item = queue_in.get(block, timeout)
+    while True:
+        try:
+            item = queue_in.get_nowait()
+        except queue.Empty:
+            return item
+
+
+def catalog_label(gender, item):
+    """Return the CLIP label of an item, as written by lables_preparation.py."""
+    return f"a {gender} wearing a {item}"
+
+
+class LabelTable:
+    def __init__(self, clothes_map):
+        """clothes_map is zara.json: gender -> item -> list of image files."""
+        self.labels = []
+        self.files = []  # Catalog files of every label
+        self.entries = {}  # Label -> table index
+        self.gender_entries = {}  # Gender -> table indices with files, for random choices
+        for gender, items in clothes_map.items():
+            for item, files in items.items():
+                label = catalog_label(gender, item)
+                self.entries[label] = len(self.labels)
+                self.entries.setdefault(catalog_label(gender, item.upper()), len(self.labels))
+                if files:
+                    self.gender_entries.setdefault(gender, []).append(len(self.labels))
+                self.labels.append(label)
+                self.files.append(list(files))
+        self.genders = list(self.gender_entries)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def entry_index(self, label):
+        """Return the table index of a label, or None."""
+        index = self.entries.get(label)
+        if index is None:
+            # Labels typed by hand, "a Men wearing a reflective effect jacket"
+            gender, _, item = label.partition(" wearing a ")
+            index = self.entries.get(catalog_label(gender[2:], item.strip().upper()))
+        return index
+
+    def first_file(self, label):
+        """Return the first catalog file of a label, or None."""
+        index = self.entry_index(label)
+        if index is None or not self.files[index]:
+            return None
+        return self.files[index][0]
+
+    def random_file(self, rng=random):
+        """Return a random catalog file: a random gender, then a random item of it, then a random image of it."""
+        if not self.genders:
+            return None
+        index = rng.choice(self.gender_entries[rng.choice(self.genders)])
+        return rng.choice(self.files[index])
@@ -12,7 +12,11 @@ from community_projects.baiby_monitor.src.match_handler import MatchHandler
 current_path = os.path.dirname(os.path.realpath(__file__))
 embedding_path = os.path.join(current_path, "..", "embeddings")
 json_files = [os.path.join(embedding_path, f) for f in os.listdir(embedding_path) if os.path.isfile(os.path.join(embedding_path, f))]
-len_json_files = len(json_files)
+
+# Every embeddings file is a profile (cry detection, sleep detection...), all of them are matched on every frame
+for json_file in json_files:
+    text_image_matcher.add_profile(os.path.splitext(os.path.basename(json_file))[0], filename=json_file)
+text_image_matcher.set_active_profiles(text_image_matcher.profiles.keys())
 
 
 match_handler = MatchHandler()
@@ -51,13 +55,6 @@ def app_callback(self, pad, info, user_data):
     if len(detections) == 0:
         detections = [roi] # Use the ROI as the detection
     user_data.increment()
-    # Switch embeddings every 10 frames
-    if user_data.get_count() % 10 == 0:
-        # Load embeddings from the next json file
-        json_file = json_files[user_data.get_count() // 10 % len_json_files]
-        # TODO: add logging or remove print
-        print(f"Loading embeddings from {json_file}")
-        user_data.text_image_matcher.load_embeddings(json_file)
     # Parse the detections
     for detection in detections:
         track = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
@@ -4,6 +4,10 @@
 #include <filesystem>
 #include <vector>
 #include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <cmath>
+#include <stdexcept>
 #include <mutex>
 #include <atomic>
 #include <nlohmann/json.hpp>
@@ -14,7 +18,6 @@
 #include <xtensor/xview.hpp>
 #include <xtensor/xadapt.hpp>
 #include <xtensor/xsort.hpp>
-#include <xtensor-blas/xlinalg.hpp>
 
 #ifndef TEXTIMAGEMATCHER_H
 #define TEXTIMAGEMATCHER_H
@@ -81,6 +84,14 @@ private:
     }
     std::atomic<bool> m_debug;//When set outputs all matches overrides match(report_all = false)
 
+    // Contiguous float32 matrix of the valid entries' embeddings, rebuilt by rebuild_prompt_matrix()
+    std::vector<float> prompt_matrix;
+    std::vector<int> valid_entries;
+    size_t prompt_dim = 0;
+    // Buffers reused between match() calls
+    std::vector<float> score_buffer;
+    std::mutex match_mutex;  // Serializes match() with loading embeddings
+
 public:
     // Public Method to get the singleton instance
     static TextImageMatcher* getInstance(std::string model_name, float threshold, int max_entries) {
@@ -104,6 +115,33 @@ public:
         text_prefix = new_text_prefix;
     }
 
+    // Cache the valid entries' embeddings as one float32 matrix. Called by load_embeddings,
+    // call it after modifying entries directly.
+    void rebuild_prompt_matrix() {
+        std::lock_guard<std::mutex> lock(match_mutex);
+        rebuild_prompt_matrix_locked();
+    }
+
+    void rebuild_prompt_matrix_locked() {
+        std::vector<int> valid = get_embeddings();
+        size_t dim = valid.empty() ? 0 : entries[valid.front()].embedding.size();
+        std::vector<float> matrix(valid.size() * dim);
+        for (size_t i = 0; i < valid.size(); i++) {
+            const auto& embedding = entries[valid[i]].embedding;
+            if (embedding.size() != dim) {
+                std::cout << "Entry " << entries[valid[i]].text << " has " << embedding.size()
+                          << " values, expected " << dim << ". Ignoring all the entries." << std::endl;
+                valid.clear();
+                matrix.clear();
+                break;
+            }
+            std::copy(embedding.begin(), embedding.end(), matrix.begin() + i * dim);
+        }
+        prompt_matrix = std::move(matrix);
+        valid_entries = std::move(valid);
+        prompt_dim = dim;
+    }
+
     std::vector<int> get_embeddings() {
         std::vector<int> valid_entries;
         for (size_t i = 0; i < entries.size(); i++) {
@@ -114,11 +152,140 @@ public:
         return valid_entries;
     }
 
+    // Binary embeddings format, see clip_app/embedding_store.py for the layout.
+    // Fields are little endian, which matches the hosts this library is built for.
+    static constexpr char EMBEDDINGS_MAGIC[8] = {'H', 'C', 'L', 'I', 'P', 'E', 'M', 'B'};
+    static constexpr uint32_t EMBEDDINGS_FORMAT_VERSION = 1;
+    static constexpr uint32_t EMBEDDINGS_QUANTIZED_FORMAT_VERSION = 2;  // float16 or int8 matrix
+    static constexpr size_t EMBEDDINGS_HEADER_SIZE = 24;
+    static constexpr size_t EMBEDDINGS_DATA_ALIGNMENT = 64;
+
+    static size_t align_embeddings_offset(size_t offset) {
+        return (offset + EMBEDDINGS_DATA_ALIGNMENT - 1) / EMBEDDINGS_DATA_ALIGNMENT * EMBEDDINGS_DATA_ALIGNMENT;
+    }
+
+    static float half_to_float(uint16_t half) {
+        const uint32_t sign = static_cast<uint32_t>(half & 0x8000) << 16;
+        uint32_t exponent = (half >> 10) & 0x1f;
+        uint32_t mantissa = half & 0x3ff;
+        uint32_t bits;
+        if (exponent == 0x1f) {
+            bits = sign | 0x7f800000 | (mantissa << 13);  // inf / nan
+        } else if (exponent != 0) {
+            bits = sign | ((exponent + 112) << 23) | (mantissa << 13);
+        } else if (mantissa == 0) {
+            bits = sign;
+        } else {
+            // Subnormal, normalize the mantissa
+            exponent = 113;
+            while ((mantissa & 0x400) == 0) {
+                mantissa <<= 1;
+                exponent--;
+            }
+            bits = sign | (exponent << 23) | ((mantissa & 0x3ff) << 13);
+        }
+        float value;
+        std::memcpy(&value, &bits, sizeof(value));
+        return value;
+    }
+
+    // Read a rows x dim matrix stored as dtype at data_offset and convert it to float32
+    static std::vector<float> read_embeddings_matrix(std::ifstream& f, const std::string& dtype,
+                                                     size_t data_offset, size_t rows, size_t dim) {
+        std::vector<float> matrix(rows * dim);
+        f.seekg(data_offset);
+        if (dtype == "float32") {
+            // Read the whole matrix with a single read
+            f.read(reinterpret_cast<char*>(matrix.data()), matrix.size() * sizeof(float));
+        } else if (dtype == "float16") {
+            std::vector<uint16_t> halfs(rows * dim);
+            f.read(reinterpret_cast<char*>(halfs.data()), halfs.size() * sizeof(uint16_t));
+            std::transform(halfs.begin(), halfs.end(), matrix.begin(), half_to_float);
+        } else if (dtype == "int8") {
+            std::vector<int8_t> values(rows * dim);
+            std::vector<float> scales(rows);
+            f.read(reinterpret_cast<char*>(values.data()), values.size());
+            f.seekg(align_embeddings_offset(data_offset + values.size()));
+            f.read(reinterpret_cast<char*>(scales.data()), scales.size() * sizeof(float));
+            for (size_t row = 0; row < rows; row++) {
+                for (size_t col = 0; col < dim; col++) {
+                    matrix[row * dim + col] = values[row * dim + col] * scales[row];
+                }
+            }
+        } else {
+            throw std::runtime_error("unsupported embeddings dtype " + dtype);
+        }
+        if (!f) {
+            throw std::runtime_error("file is truncated");
+        }
+        return matrix;
+    }
+
+    static bool is_binary_embeddings_file(const std::string& filename) {
+        std::ifstream f(filename, std::ios::binary);
+        char magic[sizeof(EMBEDDINGS_MAGIC)] = {0};
+        f.read(magic, sizeof(magic));
+        return f && std::memcmp(magic, EMBEDDINGS_MAGIC, sizeof(magic)) == 0;
+    }
+
+    void load_binary_embeddings(const std::string& filename) {
+        std::ifstream f(filename, std::ios::binary);
+        char magic[sizeof(EMBEDDINGS_MAGIC)];
+        uint32_t header[4];  // version, meta_length, rows, dim
+        f.read(magic, sizeof(magic));
+        f.read(reinterpret_cast<char*>(header), sizeof(header));
+        if (!f || std::memcmp(magic, EMBEDDINGS_MAGIC, sizeof(magic)) != 0) {
+            throw std::runtime_error("not a binary embeddings file");
+        }
+        if (header[0] != EMBEDDINGS_FORMAT_VERSION && header[0] != EMBEDDINGS_QUANTIZED_FORMAT_VERSION) {
+            throw std::runtime_error("unsupported embeddings format version " + std::to_string(header[0]));
+        }
+        const size_t meta_length = header[1];
+        const size_t rows = header[2];
+        const size_t dim = header[3];
+
+        std::string metadata(meta_length, '\0');
+        f.read(&metadata[0], meta_length);
+        nlohmann::json data = nlohmann::json::parse(metadata);
+
+        // Quantized matrices are converted to float32 once at load
+        const std::string dtype = data.value("dtype", std::string("float32"));
+        const size_t data_offset = align_embeddings_offset(EMBEDDINGS_HEADER_SIZE + meta_length);
+        std::vector<float> matrix = read_embeddings_matrix(f, dtype, data_offset, rows, dim);
+
+        threshold = data["threshold"].get<double>();
+        text_prefix = data["text_prefix"].get<std::string>();
+
+        entries.clear();
+        for (const auto& entry : data["entries"]) {
+            int row = entry["row"].get<int>();
+            std::vector<float> embedding;
+            if (row >= 0 && static_cast<size_t>(row) < rows) {
+                embedding.assign(matrix.begin() + row * dim, matrix.begin() + (row + 1) * dim);
+            }
+            entries.push_back(TextEmbeddingEntry(entry["text"].get<std::string>(), embedding,
+                                                 entry["negative"].get<bool>(), entry["ensemble"].get<bool>()));
+        }
+    }
+
     void load_embeddings(std::string filename) {
+        // Frames are not matched while the entries are replaced
+        std::lock_guard<std::mutex> lock(match_mutex);
+        load_embeddings_locked(filename);
+        rebuild_prompt_matrix_locked();
+    }
+
+    void load_embeddings_locked(const std::string& filename) {
         if (!std::filesystem::exists(filename)) {
             std::ofstream file(filename);
             file.close();
             std::cout << "File " << filename << " does not exist, creating it." << std::endl;
+        } else if (is_binary_embeddings_file(filename)) {
+            try {
+                load_binary_embeddings(filename);
+            } catch (const std::exception& e) {
+                std::cout << "Error while loading binary embeddings file " << filename << ": " << e.what() << std::endl;
+            }
         } else {
             try {
                 std::ifstream f(filename);
@@ -146,97 +313,167 @@ public:
         std::cout << "Setting debug to: " << m_debug.load() << std::endl;
     }
 
-    std::vector<Match> match(const xt::xarray<double>& image_embedding_np, bool report_all = false) {
-        
-        bool report_all_debug = report_all || m_debug.load();
+    // Prompts scored against every image row of the frame while they stay in cache
+    static constexpr size_t PROMPT_BLOCK = 64;
 
-        std::vector<Match> results;
-        // Ensure the input is a 2D array
-        xt::xarray<double> image_embedding = image_embedding_np;
-        if (image_embedding.dimension() == 1) {
-            image_embedding = image_embedding.reshape({1, -1});
-        }
-        // Getting valid entries
-        std::vector<int> valid_entries = get_embeddings();
-        if (valid_entries.empty()) {
-            return results; // Return an empty list if no valid entries
+    // Score R image rows against prompts [first, last), R x 4 prompts at a time with 8 partial sums per dot product
+    // so the compiler vectorizes. scores points to the first row's scores, rows are n_prompts apart.
+    template <size_t R>
+    static void score_tile(const float* images, size_t dim, const float* prompts, size_t first, size_t last,
+                           size_t n_prompts, float* scores) {
+        size_t prompt = first;
+        for (; prompt + 4 <= last; prompt += 4) {
+            const float* p = prompts + prompt * dim;
+            float acc[R][4][8] = {};
+            size_t k = 0;
+            for (; k + 8 <= dim; k += 8) {
+                for (size_t r = 0; r < R; r++) {
+                    const float* image = images + r * dim + k;
+                    for (size_t j = 0; j < 4; j++) {
+                        for (size_t lane = 0; lane < 8; lane++) {
+                            acc[r][j][lane] += image[lane] * p[j * dim + k + lane];
+                        }
+                    }
+                }
+            }
+            for (size_t r = 0; r < R; r++) {
+                const float* image = images + r * dim;
+                for (size_t j = 0; j < 4; j++) {
+                    float sum = 0;
+                    for (size_t lane = 0; lane < 8; lane++) {
+                        sum += acc[r][j][lane];
+                    }
+                    for (size_t tail = k; tail < dim; tail++) {
+                        sum += image[tail] * p[j * dim + tail];
+                    }
+                    scores[r * n_prompts + prompt + j] = sum;
+                }
+            }
         }
-        
-        std::vector<xt::xarray<double>> to_stack;
-        to_stack.reserve(valid_entries.size()); // Reserve memory in advance
-
-        xt::xarray<double> text_embeddings_np; // Declare text_embeddings_np outside the if block
+        for (; prompt < last; prompt++) {
+            const float* p = prompts + prompt * dim;
+            for (size_t r = 0; r < R; r++) {
+                const float* image = images + r * dim;
+                float acc[8] = {};
+                size_t k = 0;
+                for (; k + 8 <= dim; k += 8) {
+                    for (size_t lane = 0; lane < 8; lane++) {
+                        acc[lane] += image[k + lane] * p[k + lane];
+                    }
+                }
+                float sum = 0;
+                for (size_t lane = 0; lane < 8; lane++) {
+                    sum += acc[lane];
+                }
+                for (; k < dim; k++) {
+                    sum += image[k] * p[k];
+                }
+                scores[r * n_prompts + prompt] = sum;
+            }
+        }
+    }
 
-        if (!valid_entries.empty()) {
-            for (size_t entry_idx : valid_entries) {
-                if (entry_idx < entries.size()) {
-                    to_stack.push_back(entries[entry_idx].embedding);
-                } 
+    // Score rows x dim image embeddings against the n_prompts x dim prompt matrix, scores is rows x n_prompts.
+    // A hand written matrix product blocked over both operands: each block of PROMPT_BLOCK prompts is read from
+    // memory once per frame and scored against pairs of image rows, each register tile reuses every loaded image
+    // value for 4 prompts and every prompt value for 2 image rows.
+    static void score_rows(const float* images, size_t rows, const float* prompts, size_t n_prompts, size_t dim,
+                           float* scores) {
+        for (size_t first = 0; first < n_prompts; first += PROMPT_BLOCK) {
+            const size_t last = std::min(first + PROMPT_BLOCK, n_prompts);
+            size_t row = 0;
+            for (; row + 2 <= rows; row += 2) {
+                score_tile<2>(images + row * dim, dim, prompts, first, last, n_prompts, scores + row * n_prompts);
+            }
+            for (; row < rows; row++) {
+                score_tile<1>(images + row * dim, dim, prompts, first, last, n_prompts, scores + row * n_prompts);
             }
+        }
+    }
 
-            if (!to_stack.empty()) {
-                // Initialize text_embeddings_np with the correct shape
-                text_embeddings_np.resize({to_stack.size(), to_stack.front().size()});
-                for (size_t i = 0; i < to_stack.size(); ++i) {
-                    xt::view(text_embeddings_np, i, xt::all()) = to_stack[i];
-                }
+    // Turn a row of dot products into similarities in place, returns the index of the best one
+    static size_t similarities_in_place(float* row_scores, size_t n_prompts, bool softmax) {
+        size_t best_idx = 0;
+        for (size_t i = 1; i < n_prompts; i++) {
+            if (row_scores[i] > row_scores[best_idx]) {
+                best_idx = i;
             }
         }
-        
-        // Looping through each image embedding
-        for (std::size_t row_idx = 0; row_idx < image_embedding.shape()[0]; ++row_idx) {
-            auto image_embedding_1d = xt::view(image_embedding, row_idx);
-            xt::xarray<double> dot_products = xt::linalg::dot(text_embeddings_np, image_embedding_1d);
-            xt::xarray<double> similarities;
-
-            if (run_softmax) {
-                similarities = xt::exp(100 * dot_products);
-                double sum = xt::sum(similarities)();
-                if (sum != 0) {
-                    similarities /= sum;
-                } else {
-                    similarities = xt::zeros<double>({dot_products.size()});
-                }
-            } else {
-                // These values are based on statistics collected for the RN50x4 model
-                similarities = (dot_products - 0.27) / (0.41 - 0.27);
-                similarities = xt::clip(similarities, 0, 1);
+        if (softmax) {
+            // exp(100 * (x - max)) has the same softmax as exp(100 * x) and does not overflow in float32
+            const float max_score = row_scores[best_idx];
+            float sum = 0;
+            for (size_t i = 0; i < n_prompts; i++) {
+                row_scores[i] = std::exp(100.0f * (row_scores[i] - max_score));
+                sum += row_scores[i];
+            }
+            for (size_t i = 0; i < n_prompts; i++) {
+                row_scores[i] /= sum;
             }
+        } else {
+            // These values are based on statistics collected for the RN50x4 model
+            for (size_t i = 0; i < n_prompts; i++) {
+                row_scores[i] = std::min(std::max((row_scores[i] - 0.27f) / (0.41f - 0.27f), 0.0f), 1.0f);
+            }
+        }
+        return best_idx;
+    }
 
-            int best_idx = xt::argmax(similarities)();
+    // Match rows x dim float32 image embeddings, e.g. the buffer filled by clip_matcher filter().
+    // Scores go to a buffer reused between frames, nothing is allocated once it is large enough.
+    std::vector<Match> match(const float* image_embeddings, size_t rows, size_t dim, bool report_all = false) {
+        bool report_all_debug = report_all || m_debug.load();
+        std::vector<Match> results;
+        std::lock_guard<std::mutex> lock(match_mutex);
+        const size_t n_prompts = valid_entries.size();
+        if (n_prompts == 0 || rows == 0) {
+            return results; // Return an empty list if no valid entries
+        }
+        if (dim != prompt_dim) {
+            std::cout << "Image embedding size " << dim << " does not match the text embedding size " << prompt_dim << std::endl;
+            return results;
+        }
+        if (score_buffer.size() < rows * n_prompts) {
+            score_buffer.resize(rows * n_prompts);
+        }
+        score_rows(image_embeddings, rows, prompt_matrix.data(), n_prompts, dim, score_buffer.data());
+
+        for (size_t row_idx = 0; row_idx < rows; ++row_idx) {
+            float* similarities = score_buffer.data() + row_idx * n_prompts;
+            size_t best_idx = similarities_in_place(similarities, n_prompts, run_softmax);
             double best_similarity = similarities[best_idx];
 
             // Updating probabilities in entries
-            for (size_t i = 0; i < similarities.size(); i++) {
+            for (size_t i = 0; i < n_prompts; i++) {
                 entries[valid_entries[i]].probability = similarities[i];
             }
 
-            // Creating a new match object
-            Match new_match(row_idx,
-                            entries[valid_entries[best_idx]].text,
-                            best_similarity,
-                            valid_entries[best_idx],
-                            entries[valid_entries[best_idx]].negative,
-                            best_similarity > threshold);
-
+            const TextEmbeddingEntry& best_entry = entries[valid_entries[best_idx]];
             // Filtering results based on conditions
-            if (!report_all_debug && new_match.negative) {
+            if (!report_all_debug && best_entry.negative) {
                 continue;
             }
-            if (report_all_debug || new_match.passed_threshold) {
-                results.push_back(new_match);
+            bool passed_threshold = best_similarity > threshold;
+            if (report_all_debug || passed_threshold) {
+                results.emplace_back(row_idx, best_entry.text, best_similarity, valid_entries[best_idx],
+                                     best_entry.negative, passed_threshold);
             }
         }
-
-        // print results
-        // std::cout << "Best match output: [";
-        // for (const auto& match : results) {
-        //     std::cout << match.text << ", ";
-        // }
-        // std::cout << "]" << std::endl;
-
         return results;
-    }    
+    }
+
+    std::vector<Match> match(const xt::xarray<double>& image_embedding_np, bool report_all = false) {
+        // A 1D array is a single row
+        const size_t dim = image_embedding_np.shape()[image_embedding_np.dimension() - 1];
+        const size_t rows = dim == 0 ? 0 : image_embedding_np.size() / dim;
+        // One conversion buffer per calling thread, match() may run concurrently from several threads
+        static thread_local std::vector<float> input_buffer;
+        if (input_buffer.size() < image_embedding_np.size()) {
+            input_buffer.resize(image_embedding_np.size());
+        }
+        std::copy(image_embedding_np.begin(), image_embedding_np.end(), input_buffer.begin());
+        return match(input_buffer.data(), rows, dim, report_all);
+    }
 };
 
 #endif // TEXTIMAGEMATCHER_H
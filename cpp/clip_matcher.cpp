@@ -16,16 +16,18 @@
 #include "TextImageMatcher.hpp"
 TextImageMatcher* matcher = TextImageMatcher::getInstance("", 0.8f, 6);
 
-static xt::xarray<float> get_xtensor(HailoMatrixPtr matrix)
+// Detection embeddings of the current frame, reused between frames (per streaming thread) so it is allocated
+// only when it grows
+static thread_local std::vector<float> embeddings_buffer;
+
+// Append a matrix to embeddings_buffer, returns its number of values
+static size_t append_embedding(HailoMatrixPtr matrix)
 {
-    // Adapt a HailoTensorPtr to an xarray (quantized)
-    xt::xarray<float> xtensor = xt::adapt(matrix->get_data().data(), matrix->size(), xt::no_ownership(), matrix->shape());
-    // remove (squeeze) xtensor first dim
-    xtensor = xt::squeeze(xtensor, 0);
-    return xtensor;
+    const std::vector<float>& data = matrix->get_data();
+    embeddings_buffer.insert(embeddings_buffer.end(), data.begin(), data.end());
+    return data.size();
 }
 
-
 void* init(std::string config_path, std::string func_name)
 {
     if (config_path == "NULL")
@@ -55,57 +57,48 @@ void update_config(std::string config_path)
 
 void filter(HailoROIPtr roi)
 {
-    // define 2D array for image embedding
-    xt::xarray<double> image_embedding;
-    
-    // vector to hold detections
-    std::vector<HailoDetectionPtr> detections_ptrs;
-    
+    // rows x dim image embeddings, one row per used detection
+    embeddings_buffer.clear();
+    size_t dim = 0;
+
     // vector to hold used detections
-    // std::vector<HailoDetectionPtr> used_detections;
     std::vector<HailoROIPtr> used_detections;
-    
+
     // Check if roi is used for clip
     auto roi_matrixs = roi->get_objects_typed(HAILO_MATRIX);
     if (!roi_matrixs.empty())
     {
-        HailoMatrixPtr matrix_ptr = std::dynamic_pointer_cast<HailoMatrix>(roi_matrixs[0]);
-        xt::xarray<float> embeddings = get_xtensor(matrix_ptr);
-        image_embedding = embeddings;
+        dim = append_embedding(std::dynamic_pointer_cast<HailoMatrix>(roi_matrixs[0]));
         used_detections.push_back(roi);
     }
     else
     {
         // Get detections from roi
-        detections_ptrs = hailo_common::get_hailo_detections(roi);
-        
+        std::vector<HailoDetectionPtr> detections_ptrs = hailo_common::get_hailo_detections(roi);
+        used_detections.reserve(detections_ptrs.size());
         for (HailoDetectionPtr &detection : detections_ptrs)
         {
             auto matrix_objs = detection->get_objects_typed(HAILO_MATRIX);
             for (auto matrix : matrix_objs)
             {
-                HailoMatrixPtr matrix_ptr = std::dynamic_pointer_cast<HailoMatrix>(matrix);
-                xt::xarray<float> embeddings = get_xtensor(matrix_ptr);
-                // if image_embedding is empty or 0-dimensional, initialize it with embeddings
-                if (image_embedding.size() == 0 || image_embedding.dimension() == 0)
-                {
-                    image_embedding = embeddings;
-                }
-                else 
+                size_t size = append_embedding(std::dynamic_pointer_cast<HailoMatrix>(matrix));
+                if (dim != 0 && size != dim)
                 {
-                    // if image_embedding is not empty and not 0-dimensional, concatenate it with embeddings
-                    image_embedding = xt::concatenate(xt::xtuple(image_embedding, embeddings), 0);
+                    std::cout << "Skipping a detection embedding of size " << size << ", expected " << dim << std::endl;
+                    embeddings_buffer.resize(embeddings_buffer.size() - size);
+                    continue;
                 }
+                dim = size;
                 used_detections.push_back(detection);
             }
         }
     }
-    // if image_embedding is empty, return
-    if (image_embedding.size() == 0 || image_embedding.dimension() == 0)
+    // if there are no embeddings, return
+    if (used_detections.empty() || dim == 0)
     {
         return;
     }
-    std::vector<Match> matches = matcher->match(image_embedding);
+    std::vector<Match> matches = matcher->match(embeddings_buffer.data(), used_detections.size(), dim);
     for (auto &match : matches)
     {
         auto detection = used_detections[match.row_idx];
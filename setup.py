@@ -64,6 +64,7 @@ def main():
         entry_points={
             'console_scripts': [
                 'text_image_matcher=clip_app.text_image_matcher:main',
+                'clip_app_headless=clip_app.headless:main',
             ],
         },
         package_data={
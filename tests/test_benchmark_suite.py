@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Add path for clip app and the benchmark modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+from run_suite import compare
+
+
+def document(results):
+    return {"quick": True, "results": results}
+
+
+class TestBaselineComparison:
+    """Tests for comparing benchmark results with the stored baseline."""
+
+    def test_regression_above_threshold(self):
+        baseline = document({"match": [{"rows": 1, "prompts": 6, "match_ms": 1.0},
+                                       {"rows": 8, "prompts": 6, "match_ms": 2.0}]})
+        current = document({"match": [{"rows": 1, "prompts": 6, "match_ms": 1.1},
+                                      {"rows": 8, "prompts": 6, "match_ms": 3.0}]})
+        comparisons = compare(current, baseline, threshold=0.2)
+        assert [c["regression"] for c in comparisons] == [False, True]
+        assert comparisons[1]["config"] == {"rows": 8, "prompts": 6}
+        assert comparisons[1]["ratio"] == 1.5
+        assert [c["regression"] for c in compare(current, baseline, threshold=0.6)] == [False, False]
+
+    def test_ignores_noise_and_new_configurations(self):
+        baseline = document({"callbacks": [{"callback": "run", "detections": 1, "frame_ms": 0.002}]})
+        current = document({"callbacks": [{"callback": "run", "detections": 1, "frame_ms": 0.004},
+                                          {"callback": "run", "detections": 8, "frame_ms": 1.0}],
+                            "unknown": [{"value_ms": 1.0}]})
+        comparisons = compare(current, baseline, threshold=0.2, min_delta_ms=0.01)
+        assert len(comparisons) == 1
+        assert comparisons[0]["ratio"] == 2.0 and not comparisons[0]["regression"]
@@ -0,0 +1,101 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Add path for clip app and the ad_genie catalog index
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+import catalog_index
+from catalog_index import CatalogIndex, write_catalog, matrix_embedding
+
+DIM = 16
+
+
+class FakeMatrix:
+    """HAILO_MATRIX like object exposing its data through get_data()."""
+    def __init__(self, data):
+        self.data = data
+
+    def get_data(self):
+        return list(self.data)
+
+
+def normalize(embeddings):
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+
+def synthetic_catalog(num_items, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = normalize(rng.standard_normal((num_items, DIM)))
+    ids = [f"item_{i}.jpg" for i in range(num_items)]
+    values = {"gender": ["Men" if i % 2 else "Women" for i in range(num_items)],
+              "item": [f"PRODUCT {i % 5}" for i in range(num_items)]}
+    return ids, embeddings, values
+
+
+def brute_force(ids, embeddings, query, k, rows=None):
+    rows = np.arange(len(ids)) if rows is None else np.asarray(rows)
+    scores = embeddings[rows] @ (query / np.linalg.norm(query))
+    return [ids[rows[i]] for i in np.argsort(-scores)[:k]]
+
+
+class TestCatalogIndex:
+    """Tests for the ad_genie image to image catalog search."""
+
+    @pytest.fixture
+    def catalog(self, tmp_path):
+        ids, embeddings, values = synthetic_catalog(200)
+        write_catalog(str(tmp_path), ids, embeddings, values)
+        return CatalogIndex.load(str(tmp_path)), (ids, embeddings, values)
+
+    def test_query_matches_brute_force(self, catalog):
+        catalog, (ids, embeddings, values) = catalog
+        query = embeddings[17] + 0.1
+        result = catalog.query(query, k=5)
+        assert [item for item, _ in result] == brute_force(ids, embeddings, query, 5)
+        scores = [score for _, score in result]
+        assert scores == sorted(scores, reverse=True)
+        assert len(catalog.query(query, k=500)) == len(ids)
+
+    def test_partition_filters(self, catalog):
+        catalog, (ids, embeddings, values) = catalog
+        query = embeddings[3]
+        for filters in ({"gender": "Men"}, {"gender": "Women", "item": "PRODUCT 2"}, {"item": "PRODUCT 4"}):
+            rows = [row for row in range(len(ids)) if all(values[f][row] == v for f, v in filters.items())]
+            result = [item for item, _ in catalog.query(query, k=5, **filters)]
+            assert result == brute_force(ids, embeddings, query, 5, rows)
+        assert catalog.query(query, gender="Kids") == []
+        with pytest.raises(ValueError):
+            catalog.query(query, color="red")
+        assert catalog.partition_values("gender") == ["Men", "Women"]
+
+    def test_hailo_matrix_input(self, catalog):
+        catalog, (ids, embeddings, values) = catalog
+        np.testing.assert_allclose(matrix_embedding(FakeMatrix(embeddings[5])), embeddings[5])
+        assert catalog.query(FakeMatrix(embeddings[5]), k=1)[0][0] == ids[5]
+        assert catalog.query(memoryview(embeddings[8]), k=1)[0][0] == ids[8]
+
+    def test_indexed_catalog(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(catalog_index, "INDEX_MIN_ITEMS", 500)
+        ids, embeddings, values = synthetic_catalog(1500)
+        write_catalog(str(tmp_path), ids, embeddings, values)
+        assert os.path.isfile(tmp_path / "index.npz")
+        catalog = CatalogIndex.load(str(tmp_path))
+        assert set(catalog.indexes) == {(), ("Men",), ("Women",)}
+        rng = np.random.default_rng(1)
+        targets = rng.integers(0, len(ids), 20)
+        queries = normalize(embeddings[targets] + 0.1 * normalize(rng.standard_normal((20, DIM))))
+        results = catalog.query_batch(queries, k=3)
+        assert [result[0][0] for result in results] == [ids[target] for target in targets]
+        men = [result[0][0] for result in catalog.query_batch(queries, k=3, gender="Men")]
+        assert all(values["gender"][ids.index(item)] == "Men" for item in men)
+        # exact=True scores every item, as brute force
+        far = rng.standard_normal((5, DIM)).astype(np.float32)
+        for query, result in zip(far, catalog.query_batch(far, k=3, exact=True)):
+            assert [item for item, _ in result] == brute_force(ids, embeddings, query, 3)
+        # Catalogs below the threshold are scored exactly and drop a stale index
+        monkeypatch.setattr(catalog_index, "INDEX_MIN_ITEMS", 5000)
+        write_catalog(str(tmp_path), ids, embeddings, values)
+        assert not os.path.exists(tmp_path / "index.npz")
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+pytest.importorskip("requests")
+
+# Add path for the ad_genie data preparation
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+from data_preparation import download_images, find_csv_files, load_checkpoint, CHECKPOINT_NAME
+
+IMAGES = {f"/img_{i}.jpg": bytes([i]) * (1000 + 300 * i) for i in range(6)}
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves IMAGES, 404 for other paths, and counts the requests per path."""
+    requests_seen = {}
+    protocol_version = "HTTP/1.1"  # Keep alive, so pooled sessions reuse their connections
+
+    def do_GET(self):
+        ImageHandler.requests_seen[self.path] = ImageHandler.requests_seen.get(self.path, 0) + 1
+        body = IMAGES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    ImageHandler.requests_seen = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def write_csv(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = ["name,images"]
+    for name, urls in rows:
+        images = repr([{url: "image"} for url in urls]).replace('"', '""')
+        lines.append(f'{name},"{images}"')
+    path.write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def dataset(tmp_path, server):
+    base = tmp_path / "zara"
+    write_csv(base / "Men" / "jackets.csv", [("JACKET", [f"{server}/img_0.jpg", f"{server}/img_1.jpg"]),
+                                             ("SHIRT", [f"{server}/img_2.jpg"])])
+    write_csv(base / "Women" / "dresses.csv", [("DRESS", [f"{server}/img_3.jpg", f"{server}/missing.jpg"]),
+                                               ("SKIRT", [f"{server}/img_4.jpg", f"{server}/img_5.jpg"])])
+    return base
+
+
+class TestDataPreparation:
+    """Tests for the ad_genie concurrent resumable downloader, against a local HTTP server."""
+
+    def test_find_csv_files(self, dataset, tmp_path):
+        (dataset / "Men" / "notes.txt").write_text("")
+        (dataset / "top.csv").write_text("name,images\n")
+        dest = dataset / "images"
+        write_csv(dest / "ignored.csv", [])
+        assert find_csv_files(str(dataset), str(dest)) == [
+            ("Men", str(dataset / "Men" / "jackets.csv")), ("Women", str(dataset / "Women" / "dresses.csv"))]
+
+    def test_download(self, dataset, tmp_path):
+        dest = tmp_path / "images"
+        output = tmp_path / "zara.json"
+        stats = download_images(str(dataset), retries=0, dest_dir=str(dest), output_json=str(output), workers=3)
+        assert stats["images"] == 7 and stats["downloaded"] == 6 and stats["failed"] == 1
+        assert stats["bytes"] == sum(len(body) for body in IMAGES.values())
+        assert (dest / "Men_jackets_0_1.jpg").read_bytes() == IMAGES["/img_1.jpg"]
+        zara = json.loads(output.read_text())
+        assert zara["Men"] == {"JACKET": ["Men_jackets_0_0.jpg", "Men_jackets_0_1.jpg"], "SHIRT": ["Men_jackets_1_0.jpg"]}
+        assert zara["Women"] == {"DRESS": ["Women_dresses_0_0.jpg"],
+                                 "SKIRT": ["Women_dresses_1_0.jpg", "Women_dresses_1_1.jpg"]}
+        assert "missing.jpg" in (dataset / "failed_links.txt").read_text()
+        assert not list(dest.glob("*.part"))
+
+    def test_resume(self, dataset, tmp_path):
+        dest = tmp_path / "images"
+        output = tmp_path / "zara.json"
+        download_images(str(dataset), retries=1, dest_dir=str(dest), output_json=str(output), workers=2)
+        assert ImageHandler.requests_seen["/missing.jpg"] == 2
+        first = json.loads(output.read_text())
+        # An interrupted run: a file cut short, a truncated checkpoint line
+        (dest / "Women_dresses_1_1.jpg").write_bytes(b"short")
+        with open(dest / CHECKPOINT_NAME, "a") as f:
+            f.write('{"name": "Women_')
+        ImageHandler.requests_seen = {}
+        stats = download_images(str(dataset), retries=0, dest_dir=str(dest), output_json=str(output), workers=2)
+        assert stats["skipped"] == 5 and stats["downloaded"] == 1
+        assert set(ImageHandler.requests_seen) == {"/img_5.jpg", "/missing.jpg"}
+        assert (dest / "Women_dresses_1_1.jpg").read_bytes() == IMAGES["/img_5.jpg"]
+        assert json.loads(output.read_text()) == first
+        assert len(load_checkpoint(str(dest / CHECKPOINT_NAME))) == 6
+        # With verify, a file changed in place with the same size is downloaded again
+        (dest / "Men_jackets_1_0.jpg").write_bytes(b"x" * len(IMAGES["/img_2.jpg"]))
+        assert download_images(str(dataset), retries=0, dest_dir=str(dest), output_json=str(output))["downloaded"] == 0
+        stats = download_images(str(dataset), retries=0, dest_dir=str(dest), output_json=str(output), verify=True)
+        assert stats["downloaded"] == 1
+        assert (dest / "Men_jackets_1_0.jpg").read_bytes() == IMAGES["/img_2.jpg"]
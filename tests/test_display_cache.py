@@ -0,0 +1,77 @@
+import os
+import sys
+import pytest
+from PIL import Image
+
+# Add path for the ad_genie display cache
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+from display_cache import (letterbox, composite_logos, prerender_catalog, prerendered_path, CanvasCache,
+                           LOGO_SIZE)
+
+SIZE = (60, 100)
+
+
+class TestDisplayCache:
+    """Tests for the ad_genie pre-rendered canvases and canvas cache."""
+
+    def test_letterbox(self):
+        # A wide red image fits the width, white bars above and below
+        canvas = letterbox(Image.new("RGB", (120, 40), (255, 0, 0)), SIZE)
+        assert canvas.size == SIZE
+        assert canvas.getpixel((30, 50)) == (255, 0, 0)
+        assert canvas.getpixel((30, 5)) == (255, 255, 255)
+        assert canvas.getpixel((30, 95)) == (255, 255, 255)
+        # A small image is scaled up to fit
+        canvas = letterbox(Image.new("L", (6, 10), 0), SIZE)
+        assert canvas.getpixel((0, 0)) == (0, 0, 0) and canvas.getpixel((59, 99)) == (0, 0, 0)
+
+    def test_composite_logos(self):
+        logo = Image.new("RGBA", LOGO_SIZE, (0, 0, 255, 255))
+        canvas = composite_logos(Image.new("RGB", (300, 300), "white"), right_logo=logo)
+        assert canvas.getpixel((299, 299)) == (0, 0, 255)
+        assert canvas.getpixel((0, 299)) == (255, 255, 255)
+
+    def test_prerender_catalog(self, tmp_path):
+        images = tmp_path / "images"
+        images.mkdir()
+        for i in range(5):
+            Image.new("RGB", (30 + i * 10, 40), (i * 40, 0, 0)).save(images / f"item_{i}.png")
+        (images / "broken.jpg").write_bytes(b"not a jpeg")
+        (images / "notes.txt").write_text("not an image")
+        output = str(tmp_path / "display")
+        stats = prerender_catalog(str(images), output, SIZE, workers=2)
+        assert stats["images"] == 6 and stats["rendered"] == 5 and stats["failed"] == 1
+        rendered = prerendered_path(output, str(images / "item_3.png"))
+        with Image.open(rendered) as image:
+            assert image.size == SIZE
+        # Rendered images are skipped, a different screen size renders them again
+        assert prerender_catalog(str(images), output, SIZE, workers=1)["skipped"] == 5
+        assert prerender_catalog(str(images), output, (30, 50), workers=1)["rendered"] == 5
+
+    def test_canvas_cache(self):
+        rendered = []
+
+        def render(key):
+            rendered.append(key)
+            return Image.new("RGB", SIZE, "white")
+        canvas_bytes = SIZE[0] * SIZE[1] * 3
+        cache = CanvasCache(render, max_bytes=2 * canvas_bytes)
+        first = cache.get("a")
+        assert cache.get("a") is first
+        cache.get("b")
+        cache.get("a")  # "b" is now the least recently used
+        cache.get("c")
+        assert rendered == ["a", "b", "c"]
+        assert set(cache.canvases) == {"a", "c"}
+        assert cache.bytes == 2 * canvas_bytes
+        stats = cache.summary()
+        assert stats["hits"] == 2 and stats["misses"] == 3 and stats["evictions"] == 1
+        assert stats["hit_rate"] == pytest.approx(0.4)
+        assert stats["switch_ms"]["count"] == 5
+        cache.clear()
+        assert len(cache) == 0 and cache.bytes == 0
+        # Canvases larger than the budget are not kept
+        small = CanvasCache(render, max_bytes=canvas_bytes - 1)
+        small.get("d")
+        assert len(small) == 0 and small.bytes == 0
@@ -0,0 +1,105 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.embedding_gatherer import EmbeddingGatherer
+
+MATRIX_TYPE = 1
+UNIQUE_ID_TYPE = 2
+CLASSIFICATION_TYPE = 3
+
+
+class SyntheticObject:
+    def __init__(self, obj_type, data=None, track_id=None):
+        self.obj_type = obj_type
+        self.data = data
+        self.track_id = track_id
+
+    def get_type(self):
+        return self.obj_type
+
+    def get_data(self):
+        return list(self.data)
+
+    def get_id(self):
+        return self.track_id
+
+
+class SyntheticBufferMatrix(np.ndarray):
+    """Matrix object exposing its data through the buffer protocol."""
+
+    def get_type(self):
+        return MATRIX_TYPE
+
+
+class SyntheticDetection:
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get_objects(self):
+        return self.objects
+
+
+def make_detections(rng, count, dim=16, buffer_matrix=False):
+    detections = []
+    for i in range(count):
+        data = rng.standard_normal(dim).astype(np.float32)
+        matrix = data.view(SyntheticBufferMatrix) if buffer_matrix else SyntheticObject(MATRIX_TYPE, data)
+        objects = [SyntheticObject(CLASSIFICATION_TYPE), matrix]
+        if i % 2 == 0:
+            objects.append(SyntheticObject(UNIQUE_ID_TYPE, track_id=100 + i))
+        detections.append(SyntheticDetection(objects))
+    return detections
+
+
+class TestEmbeddingGatherer:
+    """Tests for gathering detection embeddings into the preallocated buffer."""
+
+    @pytest.mark.parametrize("buffer_matrix", [False, True])
+    def test_gather(self, buffer_matrix):
+        rng = np.random.default_rng(0)
+        detections = make_detections(rng, 5, buffer_matrix=buffer_matrix)
+        detections.insert(2, SyntheticDetection([SyntheticObject(UNIQUE_ID_TYPE, track_id=7)]))  # No embedding
+        gatherer = EmbeddingGatherer(MATRIX_TYPE, UNIQUE_ID_TYPE)
+        embeddings, used_detections, track_ids = gatherer.gather(detections)
+        assert embeddings.dtype == np.float32
+        assert used_detections == detections[:2] + detections[3:]
+        assert track_ids == [100, None, 102, None, 104]
+        expected = np.array([np.asarray(d.objects[1]).reshape(-1) if buffer_matrix else d.objects[1].data
+                             for d in used_detections])
+        np.testing.assert_array_equal(embeddings, expected)
+
+    def test_buffer_reused_and_grown(self):
+        rng = np.random.default_rng(1)
+        gatherer = EmbeddingGatherer(MATRIX_TYPE, UNIQUE_ID_TYPE, max_detections=4)
+        first, _, _ = gatherer.gather(make_detections(rng, 3))
+        second, _, _ = gatherer.gather(make_detections(rng, 2))
+        assert np.shares_memory(first, second)
+        detections = make_detections(rng, 9)
+        embeddings, _, _ = gatherer.gather(detections)
+        assert len(embeddings) == 9 and gatherer.max_detections >= 9
+        np.testing.assert_array_equal(embeddings, [d.objects[1].data for d in detections])
+
+    def test_mismatched_embedding_size(self):
+        rng = np.random.default_rng(2)
+        gatherer = EmbeddingGatherer(MATRIX_TYPE, UNIQUE_ID_TYPE, max_detections=2)
+        gatherer.gather(make_detections(rng, 2, dim=8))
+        detections = make_detections(rng, 3, dim=16)
+        detections.insert(1, make_detections(rng, 1, dim=32)[0])
+        embeddings, used_detections, track_ids = gatherer.gather(detections)
+        # The odd sized embedding is skipped, the rows gathered before it are kept
+        assert used_detections == [detections[0]] + detections[2:]
+        np.testing.assert_array_equal(embeddings, [d.objects[1].data for d in used_detections])
+        assert gatherer.skipped == 1
+        # A new size on the first row of a frame replaces the buffer
+        detections = make_detections(rng, 3, dim=32)
+        embeddings, _, _ = gatherer.gather(detections)
+        np.testing.assert_array_equal(embeddings, [d.objects[1].data for d in detections])
+
+    def test_no_embeddings(self):
+        gatherer = EmbeddingGatherer(MATRIX_TYPE, UNIQUE_ID_TYPE)
+        assert gatherer.gather([SyntheticDetection([])]) == (None, [], [])
@@ -0,0 +1,121 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+from clip_app.embedding_log import (EmbeddingRecorder, read_log, log_info, shard_path, replay, replay_shards,
+                                    expand_log_paths)
+
+
+def random_embeddings(rng, rows, dim=64):
+    embeddings = rng.standard_normal((rows, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def record_frames(recorder, rng, frames):
+    """Record frames with 0 to 3 detections, returns the recorded (embeddings, track ids, bboxes)."""
+    recorded = []
+    for frame in range(frames):
+        rows = frame % 4
+        embeddings = random_embeddings(rng, rows) if rows else None
+        track_ids = [None if row == 0 else frame * 10 + row for row in range(rows)]
+        bboxes = rng.random((rows, 4)).astype(np.float32)
+        recorder.record(embeddings, track_ids, bboxes, timestamp=frame * 0.04, pts=frame * 40000000)
+        recorded.append((embeddings, track_ids, bboxes))
+    recorder.close()
+    return recorded
+
+
+class TestEmbeddingLog:
+    """Tests for the embeddings recorder and replayer."""
+
+    @pytest.fixture
+    def matcher(self):
+        rng = np.random.default_rng(1)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.5
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding, negative=(i == 2))
+                           for i, embedding in enumerate(random_embeddings(rng, 4))]
+        return matcher
+
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / "run.clog")
+        recorded = record_frames(EmbeddingRecorder(path), np.random.default_rng(0), 9)
+        frames = list(read_log(path))
+        assert len(frames) == 9
+        for frame, (embeddings, track_ids, bboxes) in zip(frames, recorded):
+            if embeddings is None:
+                assert frame.embeddings.shape[0] == 0
+            else:
+                np.testing.assert_array_equal(frame.embeddings, embeddings)
+            assert frame.track_id_list() == track_ids
+            np.testing.assert_array_equal(frame.bboxes, bboxes)
+        assert frames[3].pts == 120000000
+        info = log_info(path)
+        assert info["frames"] == 9 and info["detections"] == 12 and info["dim"] == 64
+        assert info["duration_s"] == pytest.approx(0.32)
+
+    def test_float16_log(self, tmp_path):
+        path = str(tmp_path / "run.clog")
+        recorded = record_frames(EmbeddingRecorder(path, dtype="float16"), np.random.default_rng(0), 4)
+        frame = list(read_log(path))[3]
+        assert frame.embeddings.dtype == np.float32
+        np.testing.assert_allclose(frame.embeddings, recorded[3][0], atol=1e-3)
+
+    def test_truncated_log_is_resumed(self, tmp_path):
+        path = str(tmp_path / "run.clog")
+        record_frames(EmbeddingRecorder(path), np.random.default_rng(0), 5)
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 10)
+        # The cut record is skipped, and dropped when the log is appended to
+        assert len(list(read_log(path))) == 4
+        record_frames(EmbeddingRecorder(path), np.random.default_rng(1), 2)
+        assert len(list(read_log(path))) == 6
+
+    def test_shards(self, tmp_path):
+        path = str(tmp_path / "run.clog")
+        recorder = EmbeddingRecorder(path, shard_frames=4)
+        record_frames(recorder, np.random.default_rng(0), 10)
+        assert recorder.paths == [shard_path(path, index) for index in range(3)]
+        assert [log_info(filename)["frames"] for filename in expand_log_paths([str(tmp_path)])] == [4, 4, 2]
+
+    def test_replay_matches_matcher(self, matcher, tmp_path):
+        path = str(tmp_path / "run.clog")
+        rng = np.random.default_rng(0)
+        recorder = EmbeddingRecorder(path)
+        frames = [np.array([matcher.entries[i].embedding for i in rows]) for rows in ([0, 1], [2], [0, 3, 3])]
+        for index, embeddings in enumerate(frames):
+            recorder.record(embeddings + 0.01 * random_embeddings(rng, len(embeddings)), timestamp=index)
+        recorder.record(None, timestamp=3)
+        recorder.close()
+
+        summary = replay([path], matcher).summary(thresholds=[0.0, 1.01])
+        assert summary["frames"] == 4
+        assert summary["detections"] == 6
+        assert {text: prompt["best"] for text, prompt in summary["prompts"].items()} == \
+            {"prompt 0": 2, "prompt 1": 1, "prompt 2": 1, "prompt 3": 2}
+        assert summary["prompts"]["prompt 2"]["negative"]
+        assert summary["prompts"]["prompt 2"]["passed"] == 0
+        # Every positive best match is above 0, none above 1.01
+        assert summary["threshold_sweep"] == {"0.0": 5, "1.01": 0}
+
+    def test_replay_shards_in_workers(self, matcher, tmp_path):
+        embeddings_file = str(tmp_path / "embeddings.json")
+        matcher.save_embeddings(embeddings_file)
+        path = str(tmp_path / "run.clog")
+        rng = np.random.default_rng(0)
+        recorder = EmbeddingRecorder(path, shard_frames=5)
+        for frame in range(12):
+            recorder.record(random_embeddings(rng, 3), timestamp=frame)
+        recorder.close()
+
+        filenames = expand_log_paths([str(tmp_path)])
+        expected = replay_shards(filenames, embeddings_file, workers=1).summary()
+        summary = replay_shards(filenames, embeddings_file, workers=2).summary()
+        assert summary["frames"] == expected["frames"] == 12
+        assert summary["detections"] == 36
+        assert summary["prompts"] == expected["prompts"]
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+from clip_app.embeddings_watcher import EmbeddingsWatcher
+from clip_app.prompt_encoder import PromptEncodingWorker
+
+EMBEDDING_DIM = 32
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestEmbeddingsWatcher:
+    """Tests for hot reloading the embeddings file."""
+
+    @pytest.fixture
+    def embeddings(self):
+        rng = np.random.default_rng(0)
+        embeddings = rng.standard_normal((8, EMBEDDING_DIM)).astype(np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    @staticmethod
+    def save(matcher, filename, prefix, embeddings, threshold=0.5):
+        matcher.entries = [TextEmbeddingEntry(f"{prefix} {i}", embedding) for i, embedding in enumerate(embeddings)]
+        matcher.threshold = threshold
+        matcher.save_embeddings(filename)
+
+    @pytest.fixture
+    def matcher(self, tmp_path, embeddings):
+        matcher = TextImageMatcher()
+        self.save(matcher, str(tmp_path / "embeddings.json"), "old", embeddings)
+        return matcher
+
+    @pytest.mark.parametrize("use_inotify", [True, False])
+    def test_reload_on_change(self, matcher, tmp_path, embeddings, use_inotify):
+        filename = str(tmp_path / "embeddings.json")
+        reloads = []
+        watcher = EmbeddingsWatcher(matcher, filename, on_reload=lambda *args: reloads.append(args),
+                                    poll_interval=0.05, settle_time=0.02, use_inotify=use_inotify)
+        watcher.start()
+        try:
+            time.sleep(0.1)
+            # Written by another process
+            data = {"threshold": 0.4, "text_prefix": "A photo of a ", "ensemble_template": [],
+                    "entries": [TextEmbeddingEntry(f"new {i}", embedding).to_dict()
+                                for i, embedding in enumerate(embeddings[::-1])]}
+            with open(filename + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(filename + ".tmp", filename)
+            assert wait_for(lambda: reloads)
+        finally:
+            watcher.stop()
+        assert reloads[0][0] and reloads[0][1] > 0
+        assert matcher.threshold == 0.4
+        assert matcher.match(embeddings[0])[0].text == "new 7"
+        assert watcher.stats()["reloads"] == 1
+
+    def test_invalid_file_keeps_entries(self, matcher, tmp_path, embeddings):
+        filename = str(tmp_path / "embeddings.json")
+        watcher = EmbeddingsWatcher(matcher, filename)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('{"threshold": 0.5, "entries": [')
+        assert not watcher.reload()
+        assert watcher.stats()["failures"] == 1 and watcher.stats()["last_error"]
+        assert matcher.match(embeddings[2])[0].text == "old 2"
+
+    def test_reload_cancels_text_updates(self, matcher, tmp_path, embeddings, monkeypatch):
+        gate = threading.Event()
+        calls = []
+
+        def encode(strings, batch_size=64):
+            calls.append(list(strings))
+            gate.wait(5)
+            return np.ones((len(strings), EMBEDDING_DIM), dtype=np.float32) / np.sqrt(EMBEDDING_DIM)
+        monkeypatch.setattr(matcher, "model_runtime", "clip")
+        monkeypatch.setattr(matcher, "embedding_cache", None)
+        monkeypatch.setattr(matcher, "encode_prompt_strings", encode)
+        worker = PromptEncodingWorker(matcher)
+        worker.start()
+        try:
+            worker.submit(0, "typed 0")
+            assert wait_for(lambda: calls)
+            worker.submit(1, "typed 1")  # Queued behind the encode in flight
+            filename = str(tmp_path / "new.json")
+            data = {"threshold": 0.5, "entries": [TextEmbeddingEntry(f"new {i}", embedding).to_dict()
+                                                  for i, embedding in enumerate(embeddings)]}
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            watcher = EmbeddingsWatcher(matcher, filename, before_publish=worker.cancel)
+            assert watcher.reload()
+            gate.set()
+            assert worker.wait_idle(5)
+        finally:
+            gate.set()
+            worker.stop()
+        assert matcher.get_texts()[:2] == ["new 0", "new 1"]
+        assert matcher.match(embeddings[1])[0].text == "new 1"
+
+    def test_frames_see_consistent_snapshots(self, matcher, tmp_path, embeddings):
+        files = {}
+        for prefix in ("a", "b"):
+            files[prefix] = str(tmp_path / f"{prefix}.json")
+            self.save(matcher, files[prefix], prefix, embeddings)
+        stop = threading.Event()
+        prefixes = []
+
+        def match_frames():
+            while not stop.is_set():
+                matches = matcher.match(embeddings, report_all=True)
+                prefixes.append({m.text.split()[0] for m in matches})
+
+        thread = threading.Thread(target=match_frames)
+        thread.start()
+        try:
+            for i in range(50):
+                watcher = EmbeddingsWatcher(matcher, files["ab"[i % 2]])
+                assert watcher.reload()
+        finally:
+            stop.set()
+            thread.join()
+        # Every frame was matched against the prompts of a single file
+        assert prefixes and all(len(frame) == 1 for frame in prefixes)
@@ -0,0 +1,75 @@
+import os
+import sys
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app import frame_stats
+from clip_app.frame_stats import FrameStats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFrameStats:
+    """Tests for the headless runner throughput and latency statistics."""
+
+    def test_fps_and_latency(self):
+        clock = FakeClock()
+        stats = FrameStats(clock)
+        # A frame enters every 10 ms and leaves 25 ms later
+        for frame in range(11):
+            clock.now = frame * 0.01
+            stats.start(frame)
+        for frame in range(11):
+            clock.now = frame * 0.01 + 0.025
+            stats.finish(frame)
+        summary = stats.summary()
+        assert summary["frames"] == 11
+        assert summary["fps"] == pytest.approx(100.0)
+        assert summary["latency_frames"] == 11
+        assert summary["latency_p50_ms"] == pytest.approx(25.0)
+        assert summary["latency_max_ms"] == pytest.approx(25.0)
+
+    def test_frames_without_start(self):
+        clock = FakeClock()
+        stats = FrameStats(clock)
+        stats.start(1)
+        clock.now = 0.5
+        stats.finish(None)  # No PTS
+        stats.finish(2)  # Never started
+        assert stats.summary()["frames"] == 2
+        assert stats.summary()["latency_frames"] == 0
+        assert "latency_p50_ms" not in stats.summary()
+
+    def test_dropped_frames_are_forgotten(self, monkeypatch):
+        monkeypatch.setattr(frame_stats, "MAX_IN_FLIGHT", 4)
+        stats = FrameStats(FakeClock())
+        for frame in range(10):
+            stats.start(frame)
+        assert len(stats._in_flight) == 4
+        stats.finish(0)
+        assert stats.summary()["latency_frames"] == 0
+
+    def test_latency_memory_is_bounded(self):
+        clock = FakeClock()
+        stats = FrameStats(clock)
+        buckets = len(stats.latencies.buckets)
+        for frame in range(10000):
+            clock.now = frame * 0.01
+            stats.start(frame)
+            clock.now += 0.001 * (1 + frame % 100)
+            stats.finish(frame)
+        assert len(stats.latencies.buckets) == buckets
+        summary = stats.summary()
+        assert summary["latency_frames"] == 10000
+        # Percentiles of the histogram are within its 2.5% bucket width
+        assert summary["latency_p50_ms"] == pytest.approx(50.0, rel=0.05)
+        assert summary["latency_p99_ms"] == pytest.approx(99.0, rel=0.05)
+        assert summary["latency_max_ms"] == pytest.approx(100.0)
@@ -0,0 +1,104 @@
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.image_indexer import (list_images, preprocess_image, build_image_index, load_image_index,
+                                    open_image_index, CLIP_MEAN, CLIP_STD, STATUS_DONE, STATUS_FAILED)
+
+N_PX = 16
+
+
+def fake_encode(pixels):
+    """Mean of every channel, a deterministic 3 dim embedding of the preprocessed images."""
+    return pixels.mean(axis=(2, 3))
+
+
+class Interrupt(Exception):
+    pass
+
+
+class TestImageIndexer:
+    """Tests for the directory image embedding indexer."""
+
+    @pytest.fixture
+    def images(self, tmp_path):
+        directory = tmp_path / "images"
+        (directory / "sub").mkdir(parents=True)
+        paths = []
+        for i in range(10):
+            path = directory / ("sub" if i % 2 else "") / f"image_{i}.png"
+            Image.new("RGB", (20 + i, 30), (i * 20, 100, 200)).save(path)
+            paths.append(str(path))
+        (directory / "notes.txt").write_text("not an image")
+        (directory / "broken.jpg").write_bytes(b"not a jpeg")
+        return directory
+
+    def test_list_images(self, images):
+        paths = list_images([str(images)])
+        assert len(paths) == 11
+        assert paths == sorted(paths)
+        assert list_images([str(images / "sub" / "*.png")]) == [p for p in paths if "/sub/" in p]
+
+    def test_preprocess_center_crop(self):
+        # A wide image: left half black, right half white, the crop keeps the middle
+        image = Image.new("RGB", (64, 32), (0, 0, 0))
+        image.paste((255, 255, 255), (32, 0, 64, 32))
+        pixels = preprocess_image(image, N_PX)
+        assert pixels.shape == (3, N_PX, N_PX)
+        assert pixels.dtype == np.float32
+        np.testing.assert_allclose(pixels[:, 0, 0], -CLIP_MEAN / CLIP_STD, atol=1e-5)
+        np.testing.assert_allclose(pixels[:, 0, -1], (1 - CLIP_MEAN) / CLIP_STD, atol=1e-5)
+        # Grayscale images are converted to RGB
+        assert preprocess_image(Image.new("L", (N_PX, N_PX), 128), N_PX).shape == (3, N_PX, N_PX)
+
+    def test_build_index(self, images, tmp_path):
+        paths = list_images([str(images)])
+        output = str(tmp_path / "index")
+        stats = build_image_index(paths, output, fake_encode, N_PX, 3, batch_size=4, workers=2)
+        assert stats["encoded"] == 10 and stats["failed"] == 1 and stats["skipped"] == 0
+        indexed_paths, embeddings, status = load_image_index(output)
+        assert indexed_paths == paths
+        assert isinstance(embeddings, np.memmap)
+        broken = paths.index(str(images / "broken.jpg"))
+        assert status[broken] == STATUS_FAILED
+        assert np.count_nonzero(status == STATUS_DONE) == 10
+        first = paths.index(str(images / "image_0.png"))
+        with Image.open(paths[first]) as image:
+            expected = fake_encode(preprocess_image(image, N_PX)[None])[0]
+        np.testing.assert_allclose(embeddings[first], expected, atol=1e-5)
+
+    def test_resume(self, images, tmp_path):
+        paths = list_images([str(images)])
+        output = str(tmp_path / "index")
+        encoded = []
+
+        def interrupted_encode(pixels):
+            if len(encoded) == 2:
+                raise Interrupt()
+            encoded.append(len(pixels))
+            return fake_encode(pixels)
+        with pytest.raises(Interrupt):
+            build_image_index(paths, output, interrupted_encode, N_PX, 3, batch_size=3, workers=1, prefetch=2)
+        _, _, status = load_image_index(output)
+        assert np.count_nonzero(status == STATUS_DONE) == sum(encoded)
+
+        stats = build_image_index(paths, output, fake_encode, N_PX, 3, batch_size=3, workers=1)
+        assert stats["skipped"] == 6
+        assert stats["encoded"] + sum(encoded) == 10
+        _, embeddings, status = load_image_index(output)
+        assert np.all(status != 0)
+        full = build_image_index(paths, str(tmp_path / "full"), fake_encode, N_PX, 3, workers=1)
+        assert full["encoded"] == 10
+        np.testing.assert_allclose(embeddings, load_image_index(str(tmp_path / "full"))[1], atol=1e-5)
+
+    def test_resume_other_images(self, images, tmp_path):
+        paths = list_images([str(images)])
+        output = str(tmp_path / "index")
+        open_image_index(output, paths, 3)
+        with pytest.raises(ValueError):
+            open_image_index(output, paths[:5], 3)
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import queue
+import random
+import threading
+import multiprocessing
+import pytest
+
+# Add path for the ad_genie label queue
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'community_projects', 'ad_genie')))
+
+from label_queue import put_latest, get_latest, catalog_label, LabelTable
+
+CLOTHES_MAP = {
+    "Men": {"REFLECTIVE EFFECT JACKET": ["men_0.jpg", "men_1.jpg"], "LINEN SHIRT": ["men_2.jpg"]},
+    "Women": {"LONG DRESS": ["women_0.jpg"], "EMPTY ITEM": []},
+}
+
+
+class TestLabelQueue:
+    """Tests for the ad_genie label hand off and label table."""
+
+    def test_put_latest_drops_oldest(self):
+        labels = queue.Queue(maxsize=3)
+        assert [put_latest(labels, i) for i in range(5)] == [0, 0, 0, 1, 1]
+        assert [labels.get_nowait() for _ in range(3)] == [2, 3, 4]
+
+    def test_get_latest(self):
+        labels = queue.Queue()
+        for i in range(4):
+            labels.put(i)
+        assert get_latest(labels) == 3
+        assert labels.empty()
+        with pytest.raises(queue.Empty):
+            get_latest(labels, block=False)
+        with pytest.raises(queue.Empty):
+            get_latest(labels, timeout=0.01)
+        # A blocked consumer wakes up on the first label
+        threading.Timer(0.05, labels.put, ("late",)).start()
+        start = time.monotonic()
+        assert get_latest(labels, timeout=5) == "late"
+        assert time.monotonic() - start < 5
+
+    def test_multiprocessing_queue(self):
+        labels = multiprocessing.Queue(maxsize=3)
+        for i in range(10):
+            put_latest(labels, (f"label {i}", None))
+        time.sleep(0.1)  # Let the feeder thread flush
+        assert get_latest(labels, timeout=5) == ("label 9", None)
+
+    def test_label_table(self):
+        table = LabelTable(CLOTHES_MAP)
+        # Same order as lables_preparation.py
+        expected = [catalog_label(gender, item) for gender in CLOTHES_MAP for item in CLOTHES_MAP[gender]]
+        assert table.labels == expected
+        assert table.first_file("a Men wearing a LINEN SHIRT") == "men_2.jpg"
+        assert table.entry_index("a Men wearing a LINEN SHIRT") == 1
+        assert table.first_file("a Women wearing a long dress") == "women_0.jpg"
+        assert table.first_file("a Women wearing a EMPTY ITEM") is None
+        assert table.first_file("a person") is None
+
+    def test_random_file(self):
+        table = LabelTable(CLOTHES_MAP)
+        rng = random.Random(0)
+        files = {table.random_file(rng) for _ in range(200)}
+        assert files == {"men_0.jpg", "men_1.jpg", "men_2.jpg", "women_0.jpg"}
+        assert LabelTable({}).random_file() is None
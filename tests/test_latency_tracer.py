@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import urllib.request
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app import latency_tracer
+from clip_app.latency_tracer import LatencyHistogram, StageLatency, find_stage_boundaries
+from clip_app.pipeline_metrics import MetricsServer, render_text
+
+
+def make_graph(links):
+    """Build a find_stage_boundaries graph from (src element, sink element) links, pads are named element.src/sink_N."""
+    graph = {}
+    for src, sink in links:
+        for name in (src, sink):
+            if name is not None:
+                graph.setdefault(name, {"sink": [], "src": []})
+        if src is not None:
+            graph[src]["src"].append((f"{src}.src_{len(graph[src]['src'])}", sink))
+        if sink is not None:
+            graph[sink]["sink"].append((f"{sink}.sink_{len(graph[sink]['sink'])}", src))
+    return graph
+
+
+# Person detector pipeline: source, detection, tracker, cropper around the CLIP inference, matcher
+PERSON_PIPELINE = make_graph([
+    ("source", "source_queue_decode"), ("source_queue_decode", "source_decodebin"),
+    (None, "source_scale_q"), ("source_scale_q", "source_convert"), ("source_convert", "capsfilter0"),
+    ("capsfilter0", "detection_inference_scale_q"), ("detection_inference_scale_q", "detection_inference_hailonet"),
+    ("detection_inference_hailonet", "detection_inference_hailofilter"),
+    ("detection_inference_hailofilter", "hailotracker0"), ("hailotracker0", "clip_cropper_input_q"),
+    ("clip_cropper_input_q", "clip_cropper_cropper"), ("clip_cropper_cropper", "clip_cropper_bypass_q"),
+    ("clip_cropper_bypass_q", "clip_cropper_agg"), ("clip_cropper_cropper", "clip_inference_scale_q"),
+    ("clip_inference_scale_q", "clip_inference_hailonet"), ("clip_inference_hailonet", "clip_inference_hailofilter"),
+    ("clip_inference_hailofilter", "clip_cropper_agg"), ("clip_cropper_agg", "clip_cropper_output_q"),
+    ("clip_cropper_output_q", "pyproc"), ("pyproc", "clip_postprocess_queue"),
+    ("clip_postprocess_queue", "identity_callback"), ("identity_callback", "hailo_display_q"),
+])
+
+
+class TestLatencyTracer:
+    """Tests for the per stage latency tracer and the metrics endpoint."""
+
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        values = np.random.default_rng(0).lognormal(mean=1.0, sigma=1.0, size=10000)
+        for value in values:
+            histogram.add(value)
+        for q in (50, 90, 99):
+            assert histogram.percentile(q) == pytest.approx(np.percentile(values, q), rel=0.03)
+        summary = histogram.summary()
+        assert summary["count"] == 10000
+        assert summary["mean_ms"] == pytest.approx(values.mean())
+        assert summary["max_ms"] == values.max()
+        histogram.reset()
+        assert histogram.summary()["p99_ms"] == 0.0
+
+    def test_stage_boundaries(self):
+        assert find_stage_boundaries(PERSON_PIPELINE, "detection_inference") == \
+            (["detection_inference_scale_q.sink_0"], ["detection_inference_hailofilter.src_0"])
+        # The branch through the CLIP inference leaves the cropper and comes back, it is internal
+        assert find_stage_boundaries(PERSON_PIPELINE, "clip_cropper") == \
+            (["clip_cropper_input_q.sink_0"], ["clip_cropper_output_q.src_0"])
+        assert find_stage_boundaries(PERSON_PIPELINE, "clip_inference") == \
+            (["clip_inference_scale_q.sink_0"], ["clip_inference_hailofilter.src_0"])
+        assert find_stage_boundaries(PERSON_PIPELINE, "pyproc") == (["pyproc.sink_0"], ["pyproc.src_0"])
+        # The source is entered after decodebin, whose src pad is linked once playing
+        assert find_stage_boundaries(PERSON_PIPELINE, "source") == (["source_scale_q.sink_0"], ["source_convert.src_0"])
+        assert find_stage_boundaries(PERSON_PIPELINE, "missing") == ([], [])
+
+    def test_source_without_dynamic_link(self):
+        graph = make_graph([("source", "source_convert"), ("source_convert", "identity_callback")])
+        assert find_stage_boundaries(graph, "source") == (["source.src_0"], ["source_convert.src_0"])
+
+    def test_stage_latency(self, monkeypatch):
+        monkeypatch.setattr(latency_tracer, "MAX_IN_FLIGHT", 2)
+        stage = StageLatency("pyproc")
+        stage.enter(0, 1.0)
+        stage.enter(0, 1.5)  # A second entry of the same buffer keeps the first stamp
+        stage.exit(0, 1.010)
+        stage.exit(0, 1.020)  # Already counted
+        stage.enter(1, 2.0)
+        stage.enter(2, 2.0)
+        stage.enter(3, 2.0)  # Buffer 1 is dropped
+        stage.exit(1, 2.1)
+        stage.exit(3, 2.004)
+        summary = stage.summary(interval=True)
+        assert summary["count"] == 2
+        assert summary["max_ms"] == pytest.approx(10.0)
+        assert summary["in_flight"] == 1 and summary["dropped"] == 1
+        assert stage.summary(interval=True)["count"] == 0
+        assert stage.summary()["count"] == 2
+
+    def test_metrics_server(self):
+        server = MetricsServer(port=0)
+        server.add_source("latency", lambda: {"pyproc": {"count": 3, "p50_ms": 1.5}})
+        server.start()
+        try:
+            url = f"http://127.0.0.1:{server.port}"
+            with urllib.request.urlopen(url + "/metrics.json") as response:
+                assert json.loads(response.read()) == {"latency": {"pyproc": {"count": 3, "p50_ms": 1.5}}}
+            with urllib.request.urlopen(url + "/metrics") as response:
+                assert response.read().decode() == "latency.pyproc.count 3\nlatency.pyproc.p50_ms 1.5\n"
+        finally:
+            server.stop()
+
+    def test_render_text_skips_strings(self):
+        assert render_text({"stage": {"name": "pyproc", "ok": True, "count": 2}}) == "stage.ok 1\nstage.count 2\n"
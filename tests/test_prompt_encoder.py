@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+from clip_app.prompt_encoder import PromptEncodingWorker
+
+
+def fake_encode(strings, batch_size=64):
+    features = np.array([[len(string), sum(map(ord, string)) % 97, 1.0] for string in strings], dtype=np.float32)
+    return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+
+class TestPromptEncodingWorker:
+    """Tests for the background prompt encoding worker, using a fake text encoder."""
+
+    @pytest.fixture
+    def encoder_calls(self):
+        return []
+
+    @pytest.fixture
+    def gate(self):
+        gate = threading.Event()
+        gate.set()
+        return gate
+
+    @pytest.fixture
+    def matcher(self, monkeypatch, encoder_calls, gate):
+        def encode(strings, batch_size=64):
+            encoder_calls.append(list(strings))
+            gate.wait(5)
+            return fake_encode(strings, batch_size)
+
+        matcher = TextImageMatcher()
+        matcher.model_runtime = "clip"
+        matcher.embedding_cache = None
+        monkeypatch.setattr(matcher, "encode_prompt_strings", encode)
+        yield matcher
+        matcher.model_runtime = None
+
+    @pytest.fixture
+    def worker(self, matcher):
+        applied = []
+        worker = PromptEncodingWorker(matcher, on_applied=applied.append)
+        worker.applied = applied
+        worker.start()
+        yield worker
+        worker.stop()
+
+    def test_batches_slots_into_one_encode(self, matcher, worker, encoder_calls, gate):
+        gate.clear()
+        worker.submit(5, "warmup")
+        while not encoder_calls:
+            pass
+        # Queued while the encoder is busy, encoded together afterwards
+        worker.submit(0, "cat", negative=True)
+        worker.submit(1, "dog", ensemble=True)
+        worker.submit(2, "")
+        version = matcher.version
+        gate.set()
+        assert worker.wait_idle(5)
+        assert len(encoder_calls) == 2
+        assert encoder_calls[1] == [matcher.text_prefix + "cat"] + [t.format("dog") for t in matcher.ensemble_template]
+        assert matcher.version == version + 2  # One snapshot per batch
+        assert worker.applied == [[5], [0, 1, 2]]
+        entries = matcher.entries
+        assert (entries[0].text, entries[0].negative) == ("cat", True)
+        assert (entries[1].text, entries[1].ensemble) == ("dog", True)
+        np.testing.assert_allclose(entries[0].embedding, fake_encode([matcher.text_prefix + "cat"])[0], rtol=1e-6)
+        assert entries[2].text == "" and entries[2].embedding.size == 0
+
+    def test_last_write_wins(self, matcher, worker, encoder_calls, gate):
+        gate.clear()
+        worker.submit(0, "c")
+        while not encoder_calls:
+            pass
+        assert worker.is_pending(0)
+        # "c" is being encoded, these replace it and each other
+        for text in ("ca", "cat", "cats"):
+            worker.submit(0, text)
+        gate.set()
+        assert worker.wait_idle(5)
+        assert len(encoder_calls) == 2
+        assert matcher.entries[0].text == "cats"
+        assert not worker.is_pending(0)
+        stats = worker.stats()
+        assert stats["submitted"] == 4 and stats["coalesced"] == 3
+        assert stats["queue_depth"] == 0 and stats["mean_latency"] is not None
+
+    def test_cancel_drops_results(self, matcher, worker, encoder_calls, gate):
+        matcher.entries = [TextEmbeddingEntry() for _ in range(matcher.max_entries)]
+        gate.clear()
+        worker.submit(0, "cat")
+        while not encoder_calls:
+            pass
+        worker.submit(1, "dog")
+        worker.cancel()
+        gate.set()
+        assert worker.wait_idle(5)
+        assert matcher.get_texts()[:2] == ["", ""]
+        assert worker.applied == []
+
+    def test_waits_for_model(self, matcher, worker, encoder_calls, monkeypatch):
+        loading = threading.Event()
+        loading.set()
+        monkeypatch.setattr(matcher, "is_model_loading", loading.is_set)
+        worker.submit(0, "c")
+        worker.submit(0, "cat")
+        worker.submit(1, "dog")
+        assert not worker.wait_idle(0.3)
+        assert encoder_calls == []
+        loading.clear()
+        assert worker.wait_idle(5)
+        assert encoder_calls == [[matcher.text_prefix + "cat", matcher.text_prefix + "dog"]]
+        assert matcher.get_texts()[:2] == ["cat", "dog"]
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.queue_monitor import QueueMonitor, QueueSeries, find_bottleneck, element_depths
+
+
+class FakeQueue:
+    """Stand in for a GStreamer queue element."""
+
+    def __init__(self, max_size_buffers=10, leaky=0):
+        self.properties = {"max-size-buffers": max_size_buffers, "leaky": leaky, "current-level-buffers": 0}
+        self.handlers = {}
+
+    def get_property(self, name):
+        return self.properties[name]
+
+    def connect(self, signal, handler):
+        self.handlers[signal] = handler
+
+    def emit(self, signal):
+        self.handlers[signal](self)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+QUEUES = [("source_scale_q", "source_decodebin", "source_videoscale"),
+          ("clip_inference_hailonet_q", "clip_inference_convert", "clip_inference_hailonet"),
+          ("clip_postprocess_queue", "pyproc", "identity_callback")]
+
+
+class TestQueueMonitor:
+    """Tests for the queue occupancy monitor."""
+
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def monitor(self, clock):
+        monitor = QueueMonitor(capacity=8, window=4, clock=clock)
+        for name, upstream, downstream in QUEUES:
+            monitor.add_queue(name, FakeQueue(leaky=2 if name == "clip_postprocess_queue" else 0), upstream, downstream)
+        return monitor
+
+    def sample(self, monitor, clock, levels, count=1):
+        for _ in range(count):
+            clock.now += 0.1
+            for element, level in zip(monitor.elements, levels):
+                element.properties["current-level-buffers"] = level
+            monitor.sample()
+
+    def test_ring_buffer(self):
+        series = QueueSeries(2, capacity=3)
+        for i in range(5):
+            series.append(float(i), [i, 10 * i])
+        times, levels = series.last()
+        assert times.tolist() == [2.0, 3.0, 4.0]
+        assert levels[:, 1].tolist() == [20, 30, 40]
+        assert series.last(2)[0].tolist() == [3.0, 4.0]
+
+    def test_find_bottleneck(self):
+        # The hailonet queue is full: the hailonet does not keep up
+        assert find_bottleneck(QUEUES, [1.0, 0.9, 0.0]) == ("blocking", "clip_inference_hailonet", "clip_inference_hailonet_q")
+        # Everything after the source is empty: the source does not deliver
+        assert find_bottleneck(QUEUES, [0.0, 0.0, 0.05]) == ("starving", "source_decodebin", "source_scale_q")
+        assert find_bottleneck(QUEUES, [0.5, 0.0, 0.0]) == ("starving", "clip_inference_convert", "clip_inference_hailonet_q")
+        assert find_bottleneck(QUEUES, [0.5, 0.5, 0.5]) == (None, None, None)
+
+    def test_report(self, monitor, clock):
+        assert monitor.report()["bottleneck"] is None
+        self.sample(monitor, clock, [5, 0, 0], count=6)
+        self.sample(monitor, clock, [5, 10, 1], count=4)
+        monitor.on_qos("hailo_display")
+        monitor.elements[2].emit("overrun")
+        report = monitor.report()
+        # Only the last 4 samples are used
+        assert report["samples"] == 4
+        assert report["queues"]["clip_inference_hailonet_q"]["mean_fill"] == pytest.approx(1.0)
+        assert report["queues"]["clip_postprocess_queue"]["overruns"] == 1
+        assert report["queues"]["clip_postprocess_queue"]["leaky"]
+        assert report["qos"] == {"hailo_display": 1}
+        assert report["bottleneck"] == {"kind": "blocking", "element": "clip_inference_hailonet",
+                                        "queue": "clip_inference_hailonet_q", "qos": 0}
+
+    def test_dump(self, monitor, clock, tmp_path):
+        self.sample(monitor, clock, [1, 2, 3], count=10)
+        filename = str(tmp_path / "pipeline_queues.json")
+        monitor.dump(filename)
+        with open(filename, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+        assert document["queues"] == [name for name, _, _ in QUEUES]
+        # The ring buffer keeps the last 8 samples
+        assert len(document["times"]) == 8
+        assert document["levels"][-1] == [1, 2, 3]
+
+    def test_element_depths(self):
+        graph = {"src": {"sink": [], "src": [("p", "q1")]},
+                 "q1": {"sink": [("p", "src")], "src": [("p", "tee")]},
+                 "tee": {"sink": [("p", "q1")], "src": [("p", "mux"), ("p", "q2")]},
+                 "q2": {"sink": [("p", "tee")], "src": [("p", "mux")]},
+                 "mux": {"sink": [("p", "tee"), ("p", "q2")], "src": []}}
+        assert element_depths(graph) == {"src": 0, "q1": 1, "tee": 2, "q2": 3, "mux": 4}
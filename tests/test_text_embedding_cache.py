@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import numpy as np
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.text_embedding_cache import TextEmbeddingCache
+from clip_app.text_image_matcher import TextImageMatcher
+
+
+class TestTextEmbeddingCache:
+    """Tests for the on disk text embeddings cache."""
+
+    def test_hit_and_miss(self, tmp_path):
+        cache = TextEmbeddingCache(str(tmp_path))
+        embedding = np.arange(8, dtype=np.float32)
+        assert cache.get("RN50x4", ["A photo of a cat"]) is None
+        cache.put("RN50x4", ["A photo of a cat"], embedding)
+        np.testing.assert_array_equal(cache.get("RN50x4", ["A photo of a cat"]), embedding)
+        # Model name and prompt strings are part of the key
+        assert cache.get("RN50", ["A photo of a cat"]) is None
+        assert cache.get("RN50x4", ["a photo of a cat."]) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 3
+
+    def test_shared_between_instances(self, tmp_path):
+        cache = TextEmbeddingCache(str(tmp_path))
+        cache.put("RN50x4", ["dog"], np.ones(4))
+        assert TextEmbeddingCache(str(tmp_path)).get("RN50x4", ["dog"]) is not None
+        # Readable by the other users of a shared cache directory, as files created by open()
+        (tmp_path / "reference").write_bytes(b"")
+        path = cache._path(cache.make_key("RN50x4", ["dog"]))
+        assert os.stat(path).st_mode == (tmp_path / "reference").stat().st_mode
+
+    def test_lru_eviction(self, tmp_path):
+        embedding = np.zeros(1024, dtype=np.float32)
+        file_size = 4096 + 128  # Data plus .npy header
+        cache = TextEmbeddingCache(str(tmp_path), max_bytes=3 * file_size)
+        for i, text in enumerate(["a", "b", "c"]):
+            cache.put("RN50x4", [text], embedding)
+            past = time.time() - 100 + i
+            os.utime(cache._path(cache.make_key("RN50x4", [text])), (past, past))
+        cache.get("RN50x4", ["a"])  # "a" becomes the most recently used
+        cache.put("RN50x4", ["d"], embedding)
+        assert cache.get("RN50x4", ["b"]) is None
+        assert cache.get("RN50x4", ["a"]) is not None
+        assert cache.get("RN50x4", ["d"]) is not None
+        assert cache.stats()["evictions"] == 1
+
+
+class TestAddTextCache:
+    """Tests for add_text() using the cache to skip the text encoder."""
+
+    def test_repeated_prompt_skips_encoder(self, tmp_path, monkeypatch):
+        matcher = TextImageMatcher()
+        matcher.model_runtime = "clip"
+        matcher.embedding_cache = TextEmbeddingCache(str(tmp_path))
+        calls = []
+
+        def fake_encode(text_entries):
+            calls.append(list(text_entries))
+            return np.full(4, len(calls), dtype=np.float32)
+
+        monkeypatch.setattr(matcher, "encode_text_entries", fake_encode)
+        matcher.add_text("cat", 0)
+        matcher.add_text("dog", 0)
+        matcher.add_text("cat", 0)
+        matcher.add_text("cat", 0, ensemble=True)
+        matcher.add_text("", 1)
+        assert len(calls) == 3
+        assert calls[2] == [template.format("cat") for template in matcher.ensemble_template]
+        assert matcher.embedding_cache.stats()["hits"] == 1
+        matcher.embedding_cache = None
+        matcher.model_runtime = None
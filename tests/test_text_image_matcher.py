@@ -0,0 +1,470 @@
+import os
+import sys
+import subprocess
+import threading
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+from clip_app.prompt_matrix import PromptMatrix, QUANTIZATION_TOLERANCE
+from clip_app.probability_buffer import ProbabilityBuffer
+
+EMBEDDING_DIM = 640
+
+
+def random_embeddings(rng, rows, dim=EMBEDDING_DIM):
+    embeddings = rng.standard_normal((rows, dim))
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def reference_match(matcher, image_embedding_np, report_all=False):
+    """Row by row implementation of match(), used as ground truth."""
+    if len(image_embedding_np.shape) == 1:
+        image_embedding_np = image_embedding_np.reshape(1, -1)
+    valid_entries = [i for i, entry in enumerate(matcher.entries) if entry.text != ""]
+    if len(valid_entries) == 0:
+        return []
+    text_embeddings_np = np.array([matcher.entries[i].embedding for i in valid_entries])
+    results = []
+    for row_idx, image_embedding_1d in enumerate(image_embedding_np):
+        dot_products = np.dot(text_embeddings_np, image_embedding_1d)
+        if matcher.run_softmax:
+            similarities = np.exp(100 * dot_products)
+            similarities /= np.sum(similarities)
+        else:
+            similarities = np.clip((dot_products - 0.27) / (0.41 - 0.27), 0, 1)
+        best_idx = np.argmax(similarities)
+        entry = matcher.entries[valid_entries[best_idx]]
+        passed = similarities[best_idx] > matcher.threshold
+        if not report_all and entry.negative:
+            continue
+        if report_all or passed:
+            results.append((row_idx, entry.text, similarities[best_idx], valid_entries[best_idx], entry.negative, passed))
+    return results
+
+
+class TestVectorizedMatch:
+    """Tests for the batched TextImageMatcher.match() path."""
+
+    @pytest.fixture
+    def matcher(self):
+        rng = np.random.default_rng(0)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.5
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding, negative=(i % 3 == 0))
+                           for i, embedding in enumerate(random_embeddings(rng, 12))]
+        # Keep an empty slot in the middle to check valid entry indexing
+        matcher.entries[4] = TextEmbeddingEntry()
+        return matcher
+
+    @pytest.mark.parametrize("run_softmax", [True, False])
+    @pytest.mark.parametrize("report_all", [True, False])
+    def test_matches_reference(self, matcher, run_softmax, report_all):
+        rng = np.random.default_rng(1)
+        matcher.run_softmax = run_softmax
+        # Mix in copies of the prompts so some rows pass the threshold
+        images = np.vstack((random_embeddings(rng, 8), np.array([e.embedding for e in matcher.entries if e.text])))
+        results = [(m.row_idx, m.text, m.similarity, m.entry_index, m.negative, m.passed_threshold)
+                   for m in matcher.match(images, report_all=report_all)]
+        expected = reference_match(matcher, images, report_all=report_all)
+        assert [r[:2] + r[3:] for r in results] == [e[:2] + e[3:] for e in expected]
+        np.testing.assert_allclose([r[2] for r in results], [e[2] for e in expected], rtol=1e-4)
+
+    def test_single_row_and_tracked_probability(self, matcher):
+        images = np.array([e.embedding for e in matcher.entries if e.text])
+        matcher.match(images[0])
+        assert matcher.get_tracked_probability(0) == pytest.approx(1.0)
+        matcher.match(images, update_tracked_probability=1)
+        assert matcher.get_tracked_probability(1) == pytest.approx(1.0)
+        assert matcher.get_tracked_probability(0) == pytest.approx(0.0, abs=1e-6)
+        assert matcher.get_probability(len(matcher.entries)) == 0.0
+
+    def test_softmax_does_not_overflow(self, matcher):
+        # Unnormalized embeddings used to overflow exp() and return nan similarities
+        images = 100 * np.array([e.embedding for e in matcher.entries if e.text])
+        for match in matcher.match(images, report_all=True):
+            assert np.isfinite(match.similarity)
+
+
+class TestPromptMatrixCache:
+    """Tests for the versioned prompt matrix cache."""
+
+    @pytest.fixture
+    def matcher(self):
+        rng = np.random.default_rng(2)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.5
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding)
+                           for i, embedding in enumerate(random_embeddings(rng, 4))]
+        return matcher
+
+    def test_cache_reused_between_frames(self, matcher):
+        image = matcher.entries[2].embedding
+        matcher.match(image)
+        cached = matcher._snapshot.prompt_matrix
+        assert cached.data.dtype == np.float32 and cached.data.flags['C_CONTIGUOUS']
+        matcher.match(image)
+        assert matcher._snapshot.prompt_matrix is cached
+
+    def test_set_negative_invalidates(self, matcher):
+        image = matcher.entries[2].embedding
+        assert matcher.match(image)[0].entry_index == 2
+        version = matcher.version
+        matcher.set_negative(2, False)
+        assert matcher.version == version
+        matcher.set_negative(2, True)
+        assert matcher.version == version + 1
+        assert matcher.match(image) == []
+
+    def test_update_text_entries_invalidates(self, matcher):
+        image = matcher.entries[2].embedding
+        matcher.match(image)
+        matcher.update_text_entries(TextEmbeddingEntry(), 2)
+        assert matcher.match(image, report_all=True)[0].entry_index != 2
+
+
+class TestBinaryEmbeddings:
+    """Tests for the binary embeddings file format."""
+
+    def test_binary_round_trip(self, tmp_path):
+        rng = np.random.default_rng(3)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.65
+        matcher.text_prefix = "A picture of "
+        embeddings = random_embeddings(rng, 3).astype(np.float32)
+        matcher.entries = [TextEmbeddingEntry("cat", embeddings[0]),
+                           TextEmbeddingEntry(),
+                           TextEmbeddingEntry("dog", embeddings[1], negative=True),
+                           TextEmbeddingEntry("car", embeddings[2], ensemble=True)]
+        expected = [m.to_dict() for m in matcher.match(embeddings, report_all=True)]
+        test_file = str(tmp_path / "embeddings.emb")
+        matcher.save_embeddings(test_file)
+        # Created with the mode of open(), not the 0600 of the temporary file
+        (tmp_path / "reference").write_bytes(b"")
+        assert os.stat(test_file).st_mode == (tmp_path / "reference").stat().st_mode
+
+        matcher.threshold = 0.1
+        matcher.entries = [TextEmbeddingEntry()]
+        matcher.load_embeddings(test_file)
+
+        assert matcher.threshold == 0.65
+        assert matcher.text_prefix == "A picture of "
+        assert matcher.get_texts() == ["cat", "", "dog", "car"]
+        assert [e.negative for e in matcher.entries] == [False, False, True, False]
+        assert [e.ensemble for e in matcher.entries] == [False, False, False, True]
+        assert matcher.entries[1].embedding.size == 0
+        assert [m.to_dict() for m in matcher.match(embeddings, report_all=True)] == expected
+
+    def test_binary_and_json_agree(self, tmp_path):
+        rng = np.random.default_rng(4)
+        matcher = TextImageMatcher()
+        embeddings = random_embeddings(rng, 5).astype(np.float32)
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", e) for i, e in enumerate(embeddings)]
+        matcher.save_embeddings(str(tmp_path / "embeddings.json"))
+        matcher.save_embeddings(str(tmp_path / "embeddings.emb"))
+        matcher.load_embeddings(str(tmp_path / "embeddings.json"))
+        from_json = np.array([e.embedding for e in matcher.entries])
+        matcher.load_embeddings(str(tmp_path / "embeddings.emb"))
+        from_binary = np.array([e.embedding for e in matcher.entries])
+        np.testing.assert_array_equal(from_json.astype(np.float32), from_binary)
+
+
+class TestQuantizedStorage:
+    """Tests for float16 / int8 prompt matrix storage."""
+
+    @pytest.fixture
+    def matcher(self):
+        rng = np.random.default_rng(5)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.5
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding, negative=(i % 4 == 0))
+                           for i, embedding in enumerate(random_embeddings(rng, 200))]
+        return matcher
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_dot_products_within_tolerance(self, dtype):
+        rng = np.random.default_rng(6)
+        prompts = random_embeddings(rng, 5000).astype(np.float32)
+        images = random_embeddings(rng, 8).astype(np.float32)
+        quantized = PromptMatrix.quantize(prompts, dtype)
+        error = np.abs(quantized.dot(images) - images @ prompts.T).max()
+        assert error < QUANTIZATION_TOLERANCE[dtype]
+        assert quantized.nbytes <= prompts.nbytes // 2
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_top1_agrees_with_float32(self, matcher, dtype):
+        rng = np.random.default_rng(7)
+        # Images close to a prompt, as real matches are
+        images = np.array([matcher.entries[i].embedding for i in range(0, 200, 7)])
+        images = images + 0.5 * random_embeddings(rng, len(images))
+        images /= np.linalg.norm(images, axis=1, keepdims=True)
+        expected = [(m.entry_index, m.passed_threshold) for m in matcher.match(images, report_all=True)]
+        matcher.set_storage_dtype(dtype)
+        assert [(m.entry_index, m.passed_threshold) for m in matcher.match(images, report_all=True)] == expected
+        assert matcher._snapshot.prompt_matrix.dtype == dtype
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_binary_round_trip(self, matcher, tmp_path, dtype):
+        image = matcher.entries[9].embedding
+        matcher.set_storage_dtype(dtype)
+        expected = matcher.match(image, report_all=True)[0].similarity
+        test_file = str(tmp_path / "embeddings.emb")
+        matcher.save_embeddings(test_file)
+        matcher.entries = [TextEmbeddingEntry()]
+        matcher.set_storage_dtype("float32")
+        matcher.load_embeddings(test_file)
+        assert matcher.storage_dtype == dtype
+        assert matcher.match(image, report_all=True)[0].entry_index == 9
+        # Scored straight from the mapped file
+        assert isinstance(matcher._snapshot.prompt_matrix.data, np.memmap)
+        assert matcher.match(image, report_all=True)[0].similarity == pytest.approx(expected, abs=1e-6)
+
+
+class TestEmbeddingProfiles:
+    """Tests for named profiles scored together by match_profiles()."""
+
+    @pytest.fixture
+    def profile_entries(self):
+        rng = np.random.default_rng(8)
+        cry = [TextEmbeddingEntry(text, e, negative=(text == "Calm baby"))
+               for text, e in zip(["Crying baby", "Calm baby"], random_embeddings(rng, 2))]
+        sleep = [TextEmbeddingEntry(text, e)
+                 for text, e in zip(["sleeping baby", "", "awaken baby", "empty crib"], random_embeddings(rng, 4))]
+        return {"cry": (cry, 0.6), "sleep": (sleep, 0.3)}
+
+    @pytest.fixture
+    def matcher(self, profile_entries, tmp_path):
+        matcher = TextImageMatcher()
+        for name, (entries, threshold) in profile_entries.items():
+            matcher.entries = entries
+            matcher.threshold = threshold
+            matcher.save_embeddings(str(tmp_path / f"{name}.emb"))
+            assert matcher.add_profile(name, filename=str(tmp_path / f"{name}.emb"))
+        matcher.entries = [TextEmbeddingEntry()]
+        return matcher
+
+    def test_matches_each_profile_alone(self, matcher, profile_entries):
+        images = np.array([e.embedding for entries, _ in profile_entries.values() for e in entries if e.text])
+        matcher.set_active_profiles(["cry", "sleep"])
+        results = matcher.match_profiles(images, report_all=True)
+        for name, (entries, threshold) in profile_entries.items():
+            # The matcher entries are independent of the profiles
+            matcher.entries = entries
+            matcher.threshold = threshold
+            expected = [m.to_dict() for m in matcher.match(images, report_all=True)]
+            assert [m.to_dict() for m in results[name]] == pytest.approx(expected)
+        cry = matcher.match_profiles(images)["cry"]
+        assert (cry[0].row_idx, cry[0].text) == (0, "Crying baby")
+        # Negative prompt
+        assert 1 not in [m.row_idx for m in cry]
+
+    def test_switch_reuses_stacked_profiles(self, matcher, tmp_path):
+        matcher.set_active_profiles(["cry", "sleep"])
+        stacked = matcher._active_profile_set
+        os.remove(tmp_path / "cry.emb")
+        matcher.set_active_profiles(["sleep"])
+        assert list(matcher.match_profiles(np.ones(EMBEDDING_DIM))) == ["sleep"]
+        matcher.set_active_profiles(["cry", "sleep"])
+        assert matcher._active_profile_set is stacked
+        assert not matcher.set_active_profiles(["missing"])
+        assert matcher.get_active_profiles() == ("cry", "sleep")
+
+    def test_replace_and_remove_profile(self, matcher, profile_entries):
+        matcher.set_active_profiles(["cry", "sleep"])
+        entries, _ = profile_entries["sleep"]
+        matcher.add_profile("cry", entries=entries[:1], threshold=0.0)
+        image = entries[0].embedding
+        assert matcher.match_profiles(image)["cry"][0].text == "sleeping baby"
+        matcher.remove_profile("sleep")
+        assert matcher.get_active_profiles() == ("cry",)
+        assert matcher.match_profiles(np.zeros((0, EMBEDDING_DIM))) == {"cry": []}
+
+
+class TestSnapshotConcurrency:
+    """Stress test of edits published while another thread is matching."""
+
+    def test_no_torn_reads(self):
+        rng = np.random.default_rng(9)
+        num_prompts = 6
+        embeddings = random_embeddings(rng, num_prompts, dim=64).astype(np.float32)
+        matcher = TextImageMatcher()
+
+        def generation_entries(generation):
+            # Every generation holds all the prompts in another order, texts tell the generation and prompt
+            order = np.roll(np.arange(num_prompts), generation)
+            return [TextEmbeddingEntry(f"g{generation} p{k}", embeddings[k]) for k in order]
+
+        matcher.entries = generation_entries(0)
+        stop = threading.Event()
+        errors = []
+
+        def match_frames():
+            frame = 0
+            while not stop.is_set():
+                order = np.roll(np.arange(num_prompts), frame)
+                matches = matcher.match(embeddings[order], report_all=True)
+                texts = [m.text.split() for m in matches]
+                if len({generation for generation, _ in texts}) != 1:
+                    errors.append(f"frame mixes generations: {texts}")
+                if [prompt for _, prompt in texts] != [f"p{k}" for k in order]:
+                    errors.append(f"frame matched wrong prompts: {texts}")
+                frame += 1
+
+        def sample_probabilities():
+            while not stop.is_set():
+                snapshot = matcher.get_snapshot()
+                probabilities, tracked_probabilities = snapshot.stats.sample()
+                for values in (probabilities, tracked_probabilities):
+                    if values.any() and abs(values.sum() - 1) > 1e-3:
+                        errors.append(f"torn probabilities: {values}")
+
+        threads = [threading.Thread(target=match_frames), threading.Thread(target=sample_probabilities)]
+        for thread in threads:
+            thread.start()
+        try:
+            for generation in range(1, 200):
+                matcher.publish_entries(generation_entries(generation))
+                # Copy-on-write edits of the published entries
+                matcher.set_negative(generation % num_prompts, True)
+                entry = matcher.entries[0]
+                matcher.update_text_entries(TextEmbeddingEntry(entry.text, entry.embedding), 0)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        assert errors == []
+
+    def test_failed_write_releases_readers(self):
+        buffer = ProbabilityBuffer(4)
+        with pytest.raises(ValueError):
+            buffer.write([0, 1], np.ones(3))
+        with pytest.raises(ValueError):
+            buffer.write_tracked(np.ones(3))
+        # The sequence is even again, sample() returns instead of spinning
+        buffer.write([2], [0.5])
+        probabilities, tracked_probabilities = buffer.sample()
+        assert probabilities[2] == 0.5 and not tracked_probabilities.any()
+
+
+class TestAddTexts:
+    """Tests for the batched add_texts() API, using a fake text encoder."""
+
+    @staticmethod
+    def fake_encode(strings, batch_size=64):
+        features = np.array([[len(string), sum(map(ord, string)) % 97, 1.0] for string in strings], dtype=np.float32)
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+    @pytest.fixture
+    def matcher(self, monkeypatch):
+        matcher = TextImageMatcher()
+        matcher.model_runtime = "clip"
+        matcher.embedding_cache = None
+        monkeypatch.setattr(matcher, "encode_prompt_strings", self.fake_encode)
+        yield matcher
+        matcher.model_runtime = None
+
+    def test_matches_add_text(self, matcher):
+        texts = ["cat", "dog", "", "yellow car", "tree"]
+        negatives = [False, True, False, True, False]
+        ensembles = [True, False, False, True, False]
+        for text, negative, ensemble in zip(texts, negatives, ensembles):
+            matcher.add_text(text, negative=negative, ensemble=ensemble)
+        expected = [(e.text, e.negative, e.ensemble, e.embedding) for e in matcher.entries]
+
+        matcher.entries = [TextEmbeddingEntry() for _ in range(matcher.max_entries)]
+        version = matcher.version
+        matcher.add_texts(texts, negative=negatives, ensemble=ensembles)
+        assert matcher.version == version + 1
+        for (text, negative, ensemble, embedding), entry in zip(expected, matcher.entries):
+            assert (entry.text, entry.negative, entry.ensemble) == (text, negative, ensemble)
+            np.testing.assert_allclose(entry.embedding, embedding, rtol=1e-6)
+
+    def test_appends_past_max_entries(self, matcher):
+        matcher.add_texts([f"prompt {i}" for i in range(10)], negative=True)
+        assert len(matcher.entries) == 10
+        assert all(entry.negative for entry in matcher.entries)
+
+
+class TestBackgroundModelLoading:
+    """Tests for init_clip_async() and the lazy import chain."""
+
+    def test_import_does_not_load_encoder(self):
+        code = ("import sys, clip_app.text_image_matcher; "
+                "print(','.join(m for m in ('torch', 'clip', 'PIL') if m in sys.modules))")
+        output = subprocess.check_output([sys.executable, "-c", code],
+                                         cwd=os.path.join(os.path.dirname(__file__), '..'), stderr=subprocess.DEVNULL)
+        assert output.decode().strip() == ""
+
+    def test_texts_queued_while_loading(self, monkeypatch):
+        matcher = TextImageMatcher()
+        matcher.embedding_cache_dir = None
+        model_released = threading.Event()
+        ready = threading.Event()
+
+        def fake_init_clip():
+            model_released.wait(5)
+            matcher.model_runtime = "clip"
+
+        monkeypatch.setattr(matcher, "init_clip", fake_init_clip)
+        monkeypatch.setattr(matcher, "encode_prompt_strings", TestAddTexts.fake_encode)
+        matcher.init_clip_async(on_ready=ready.set)
+        assert matcher.is_model_loading()
+        matcher.add_text("cat", 0)
+        matcher.add_texts(["dog", "car"], negative=True)
+        matcher.add_text("bird", 0)
+        assert matcher.get_texts()[:3] == ["", "", ""]
+        model_released.set()
+        assert ready.wait(5)
+        assert not matcher.is_model_loading()
+        assert matcher.get_texts()[:3] == ["bird", "dog", "car"]
+        matcher.model_runtime = None
+
+
+def clustered_embeddings(rng, rows, num_clusters, noise=0.5, dim=EMBEDDING_DIM):
+    centers = random_embeddings(rng, num_clusters, dim)
+    embeddings = centers[rng.integers(num_clusters, size=rows)] + noise * random_embeddings(rng, rows, dim)
+    return (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)).astype(np.float32)
+
+
+class TestPromptIndex:
+    """Tests for the approximate prompt index mode."""
+
+    @pytest.fixture
+    def matcher(self):
+        rng = np.random.default_rng(5)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.0
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding, negative=(i % 100 == 0))
+                           for i, embedding in enumerate(clustered_embeddings(rng, 2000, 40))]
+        yield matcher
+        matcher.set_index_mode(False)
+
+    def test_full_probe_is_exact(self, matcher):
+        rng = np.random.default_rng(6)
+        images = clustered_embeddings(rng, 16, 40)
+        expected = [m.entry_index for m in matcher.match(images, report_all=True)]
+        matcher.set_index_mode(True, n_lists=20, n_probe=20, top_k=64, min_prompts=100)
+        results = matcher.match(images, report_all=True)
+        assert matcher._snapshot.prompt_index is not None
+        assert [m.entry_index for m in results] == expected
+
+    def test_negatives_scored_exactly(self, matcher):
+        matcher.set_index_mode(True, n_lists=40, n_probe=1, top_k=4, min_prompts=100)
+        negative_images = np.array([matcher.entries[i].embedding for i in (0, 100, 1900)])
+        results = matcher.match(negative_images, report_all=True)
+        assert [m.entry_index for m in results] == [0, 100, 1900]
+        assert all(m.negative for m in results)
+        assert matcher.match(negative_images) == []
+
+    def test_recall_with_partial_probe(self, matcher):
+        rng = np.random.default_rng(7)
+        # Image embeddings close to some of the prompts
+        prompts = np.array([matcher.entries[i].embedding for i in rng.integers(len(matcher.entries), size=64)])
+        images = prompts + 0.5 * random_embeddings(rng, 64)
+        expected = np.array([m.entry_index for m in matcher.match(images, report_all=True)])
+        matcher.set_index_mode(True, n_lists=40, n_probe=4, top_k=32, min_prompts=100)
+        results = np.array([m.entry_index for m in matcher.match(images, report_all=True)])
+        assert np.mean(results == expected) >= 0.9
@@ -0,0 +1,99 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Add path for clip app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from clip_app.text_image_matcher import TextImageMatcher, TextEmbeddingEntry
+from clip_app.track_match_cache import TrackMatchCache
+
+
+def random_embeddings(rng, rows, dim=64):
+    embeddings = rng.standard_normal((rows, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+class TestTrackMatchCache:
+    """Tests for the per track match result cache."""
+
+    @pytest.fixture
+    def matcher(self):
+        rng = np.random.default_rng(0)
+        matcher = TextImageMatcher()
+        matcher.threshold = 0.5
+        matcher.entries = [TextEmbeddingEntry(f"prompt {i}", embedding, negative=(i == 3))
+                           for i, embedding in enumerate(random_embeddings(rng, 6))]
+        return matcher
+
+    @pytest.fixture
+    def frame(self, matcher):
+        return np.array([matcher.entries[i].embedding for i in (1, 3, 5)])
+
+    @pytest.fixture
+    def scored_rows(self, matcher, monkeypatch):
+        """Record the number of rows passed to matcher.match()."""
+        rows = []
+        original_match = matcher.match
+
+        def match(image_embedding_np, *args, **kwargs):
+            rows.append(len(image_embedding_np))
+            return original_match(image_embedding_np, *args, **kwargs)
+        monkeypatch.setattr(matcher, "match", match)
+        return rows
+
+    @staticmethod
+    def as_tuples(matches):
+        return [(m.row_idx, m.text, m.entry_index, m.negative, m.passed_threshold) for m in matches]
+
+    def test_unchanged_tracks_are_not_rescored(self, matcher, frame, scored_rows):
+        cache = TrackMatchCache()
+        expected = self.as_tuples(matcher.match(frame, report_all=True))
+        assert self.as_tuples(cache.match(matcher, frame, [10, 11, None], now=0.0)) == expected
+        assert self.as_tuples(cache.match(matcher, frame, [10, 11, None], now=0.1)) == expected
+        # First frame scores all rows, then only the row without a track id
+        assert scored_rows == [3, 3, 1]
+        assert cache.stats()["hits"] == 2
+
+    def test_reordered_and_changed_rows(self, matcher, frame, scored_rows):
+        cache = TrackMatchCache()
+        cache.match(matcher, frame, [10, 11, 12], now=0.0)
+        new_frame = np.array([frame[2], matcher.entries[0].embedding, frame[0]])
+        matches = cache.match(matcher, new_frame, [12, 11, 10], now=0.1)
+        assert self.as_tuples(matches) == self.as_tuples(matcher.match(new_frame, report_all=True))
+        # Track 11 got a new crop
+        assert scored_rows[1] == 1
+
+    def test_invalidated_by_prompts_and_threshold(self, matcher, frame, scored_rows):
+        cache = TrackMatchCache()
+        cache.match(matcher, frame, [10, 11, 12], now=0.0)
+        matcher.set_threshold(0.99)
+        cache.match(matcher, frame, [10, 11, 12], now=0.1)
+        matcher.set_negative(1, True)
+        matches = cache.match(matcher, frame, [10, 11, 12], now=0.2)
+        assert scored_rows == [3, 3, 3]
+        assert matches[0].negative
+        assert cache.stats()["invalidations"] == 2
+
+    def test_ttl_and_lru_eviction(self, matcher, frame):
+        cache = TrackMatchCache(max_tracks=2, ttl=1.0)
+        cache.match(matcher, frame, [10, 11, 12], now=0.0)
+        assert cache.stats()["tracks"] == 2
+        # Track 10 was evicted as least recently seen, adding it back evicts track 11
+        cache.match(matcher, frame[:1], [10], now=0.5)
+        assert cache.stats()["evictions"] == 2
+        # Track 12 was not seen for more than ttl seconds
+        cache.match(matcher, frame[:1], [10], now=1.4)
+        assert cache.stats()["tracks"] == 1
+        assert cache.stats()["evictions"] == 3
+
+    def test_tracked_probabilities_restored(self, matcher, frame):
+        cache = TrackMatchCache()
+        cache.match(matcher, frame, [10, 11, 12], update_tracked_probability=0, now=0.0)
+        expected = matcher.tracked_probabilities.copy()
+        assert np.argmax(expected) == 1
+        # A new track with another embedding is scored, the focused track is served from the cache
+        other = np.array([frame[0], matcher.entries[4].embedding])
+        cache.match(matcher, other, [10, 13], update_tracked_probability=0, now=0.1)
+        np.testing.assert_array_equal(matcher.tracked_probabilities, expected)